@@ -0,0 +1,77 @@
+"""
+Бенчмарк векторного скоринга лидов
+
+Сравнивает поштучный скоринг функциями lead_scoring с bulk_scoring
+(раскладка по колонкам и векторный проход отдельно) на большом наборе
+лидов. Перед замерами проверяется, что статус квалификации, полнота
+данных, скор и условия эскалации совпадают для каждого лида.
+
+Запуск:
+    python benchmarks/bench_bulk_scoring.py [--leads 100000] [--rounds 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_lead_scoring import random_lead  # noqa: E402
+from bot.memory import lead_scoring  # noqa: E402
+from bot.memory.bulk_scoring import LeadColumns, score_columns, score_leads  # noqa: E402
+
+
+def score_scalar(leads):
+    return (
+        [lead_scoring.qualification_status(lead) for lead in leads],
+        [lead_scoring.data_completeness(lead) for lead in leads],
+        [lead_scoring.escalation_score(lead) for lead in leads],
+        [lead_scoring.should_escalate(lead) for lead in leads],
+    )
+
+
+def check_equivalence(leads) -> None:
+    statuses, completeness, scores, escalate = score_scalar(leads)
+    bulk = score_leads(leads)
+    assert bulk.qualification_statuses() == statuses
+    assert bulk.completeness.tolist() == completeness
+    assert bulk.escalation_score.tolist() == scores
+    assert bulk.should_escalate.tolist() == escalate
+
+
+def best_of(rounds: int, function, *args) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=41)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    leads = [random_lead(rng) for _ in range(args.leads)]
+    check_equivalence(leads)
+    print(f"Результаты совпадают на {len(leads)} лидах")
+
+    scalar = best_of(args.rounds, score_scalar, leads)
+    load = best_of(args.rounds, LeadColumns.from_leads, leads)
+    columns = LeadColumns.from_leads(leads)
+    vectorized = best_of(args.rounds, score_columns, columns)
+
+    print(f"Поштучно (lead_scoring):  {scalar * 1e3:8.1f} мс")
+    print(f"Раскладка по колонкам:    {load * 1e3:8.1f} мс")
+    print(f"Векторный скоринг:        {vectorized * 1e3:8.1f} мс")
+    print(f"Всего bulk:               {(load + vectorized) * 1e3:8.1f} мс (x{scalar / (load + vectorized):.1f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
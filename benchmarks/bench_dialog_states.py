@@ -0,0 +1,160 @@
+"""
+Бенчмарк переходов состояний диалога: таблица против цепочки if/elif
+
+Прежний DialogStateExtractor._get_next_state (цепочка условий по
+состояниям с any(word in message ...)) сохранен здесь как эталон.
+
+Эквивалентность: сообщения эталонного корпуса прогоняются через
+экстракторы, и для каждого сообщения следующее состояние вычисляется из
+КАЖДОГО состояния обоими способами; дополнительно - случайные сочетания
+полей лида, важных для переходов (в том числе is_in_sochi=False).
+
+Скорость: переходов в секунду на тех же тройках (сообщение, состояние,
+лид); извлечение в замер не входит.
+
+Запуск:
+    python benchmarks/bench_dialog_states.py [--rounds 5] [--random 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extractors import load_corpus  # noqa: E402
+from bot.memory.extractors import DialogStateExtractor, LeadDataExtractor  # noqa: E402
+from bot.memory.models import AutomationGoal, DialogState, LeadData, PaymentType  # noqa: E402
+
+
+def legacy_next_state(message: str, current_state: DialogState, lead: LeadData) -> DialogState:
+    """Прежний DialogStateExtractor._get_next_state (message - в нижнем регистре)"""
+    patterns = DialogStateExtractor.STATE_PATTERNS
+    if current_state == DialogState.S0_GREETING:
+        if any(word in message for word in ['инвестиц', 'пмж', 'себя', 'проживан', 'из ', 'сочи']):
+            return DialogState.S1_BUSINESS
+        return DialogState.S0_GREETING
+    elif current_state == DialogState.S1_BUSINESS:
+        if lead.city or lead.is_in_sochi is not None:
+            return DialogState.S2_GOAL
+        if any(word in message for word in patterns[DialogState.S2_GOAL]):
+            return DialogState.S2_GOAL
+        return DialogState.S1_BUSINESS
+    elif current_state == DialogState.S2_GOAL:
+        if lead.automation_goal:
+            return DialogState.S3_PAYMENT
+        return DialogState.S2_GOAL
+    elif current_state == DialogState.S3_PAYMENT:
+        if lead.payment_type or any(word in message for word in ['ипотек', 'наличн', 'рассроч']):
+            return DialogState.S4_REQUIREMENTS
+        return DialogState.S3_PAYMENT
+    elif current_state == DialogState.S4_REQUIREMENTS:
+        if (lead.preferred_locations or
+                getattr(lead, 'property_type', None) or
+                any(word in message for word in ['красная', 'сириус', 'адлер', 'дом', 'квартир', 'апартамент', 'участок'])):
+            return DialogState.S5_BUDGET
+        return DialogState.S4_REQUIREMENTS
+    elif current_state == DialogState.S5_BUDGET:
+        if lead.budget_min or lead.budget_max:
+            return DialogState.S6_URGENCY
+        return DialogState.S5_BUDGET
+    elif current_state == DialogState.S6_URGENCY:
+        if lead.urgency_date or lead.urgency_level:
+            return DialogState.S7_EXPERIENCE
+        return DialogState.S6_URGENCY
+    elif current_state == DialogState.S7_EXPERIENCE:
+        if any(word in message for word in patterns[DialogState.S8_ACTION]):
+            return DialogState.S8_ACTION
+        if lead.sochi_experience:
+            return DialogState.S8_ACTION
+        return DialogState.S7_EXPERIENCE
+    elif current_state == DialogState.S8_ACTION:
+        return DialogState.S8_ACTION
+    return current_state
+
+
+def legacy_determine(message: str, state: DialogState, lead: LeadData) -> DialogState:
+    return legacy_next_state(message.lower(), state, lead)
+
+
+def corpus_cases():
+    """(сообщение, состояние, лид после извлечения) в порядке диалогов корпуса"""
+    cases = []
+    for record in load_corpus():
+        lead = LeadData()
+        for message in record['dialog']:
+            lead = LeadDataExtractor.extract_from_message(message, lead)
+            cases.append((message, lead))
+    return cases
+
+
+def random_leads(count: int, rng: random.Random):
+    """Случайные сочетания полей, от которых зависят переходы"""
+    options = {
+        'city': [None, '', 'Москва'],
+        'is_in_sochi': [None, False, True],
+        'automation_goal': [None, AutomationGoal.LONG_INVESTMENT],
+        'payment_type': [None, PaymentType.CASH],
+        'preferred_locations': [(), ('Адлер',)],
+        'property_type': [None, 'дом'],
+        'budget_min': [None, 0, 5_000_000],
+        'budget_max': [None, 0, 10_000_000],
+        'urgency_level': [None, '', 'high'],
+        'urgency_date': [None, 'завтра'],
+        'sochi_experience': [None, '', 'покупал'],
+    }
+    return [LeadData(**{name: rng.choice(values) for name, values in options.items()}) for _ in range(count)]
+
+
+def check_equivalence(cases, leads, rng: random.Random) -> int:
+    mismatches = 0
+    messages = [message for message, _ in cases]
+    checks = [(message, lead) for message, lead in cases]
+    checks += [(rng.choice(messages), lead) for lead in leads]
+    for message, lead in checks:
+        for state in DialogState:
+            expected = legacy_determine(message, state, lead)
+            actual = DialogStateExtractor.MACHINE.next_state(message, state, lead)
+            if actual != expected:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"❌ {state.value}, {message!r}: ожидалось {expected.value}, получено {actual.value}")
+    print(f"Проверено переходов: {len(checks) * len(DialogState)}")
+    return mismatches
+
+
+def throughput(function, triples, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message, state, lead in triples:
+            function(message, state, lead)
+        best = min(best, time.perf_counter() - started)
+    return len(triples) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--random', type=int, default=20000, help="случайных лидов для проверки")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cases = corpus_cases()
+    mismatches = check_equivalence(cases, random_leads(args.random, rng), rng)
+    if mismatches:
+        print(f"❌ Расхождений с прежними переходами: {mismatches}")
+        return 1
+    print("✅ Переходы совпадают с прежней цепочкой условий")
+
+    triples = [(message, state, lead) for message, lead in cases for state in DialogState]
+    legacy = throughput(legacy_determine, triples, args.rounds)
+    table = throughput(DialogStateExtractor.MACHINE.next_state, triples, args.rounds)
+    print(f"Цепочка if/elif: {legacy:,.0f} переходов/с")
+    print(f"Таблица:         {table:,.0f} переходов/с ({table / legacy:.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
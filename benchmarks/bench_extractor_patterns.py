@@ -0,0 +1,113 @@
+"""
+Бенчмарк семейств регулярных выражений экстрактора
+
+На сообщениях эталонного корпуса (benchmarks/data/extractor_corpus.jsonl)
+сравниваются прежний способ - цикл re.search по списку паттернов до первого
+совпадения, с паттернами комнат и площади в виде строк - и PatternFamily
+из LeadDataExtractor. Для каждого сообщения проверяется, что сработал тот
+же паттерн с теми же группами.
+
+Запуск:
+    python benchmarks/bench_extractor_patterns.py [--rounds 5] [--repeat 10]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extractors import load_corpus  # noqa: E402
+from bot.memory.extractors import LeadDataExtractor  # noqa: E402
+
+# Прежние списки паттернов в порядке проверки
+LEGACY_BUDGET_PATTERNS = [
+    re.compile(r'до\s+(\d+)\s*(?:млн|миллион)', re.IGNORECASE),
+    re.compile(r'до\s+(\d+)\s*(?:тыс|тысяч|k)', re.IGNORECASE),
+    re.compile(r'до\s+(\d+)', re.IGNORECASE),
+    re.compile(r'(\d+)\s*(?:тысяч|тыс|k)', re.IGNORECASE),
+    re.compile(r'(\d+)\s*(?:миллион|млн|m)', re.IGNORECASE),
+    re.compile(r'(\d+)\s*(?:долларов?|\$|usd)', re.IGNORECASE),
+    re.compile(r'(\d+)\s*(?:рублей?|руб|₽)', re.IGNORECASE),
+    re.compile(r'от\s+(\d+)\s+до\s+(\d+)', re.IGNORECASE),
+    re.compile(r'(\d+)\s*-\s*(\d+)', re.IGNORECASE),
+]
+LEGACY_ROOMS_PATTERNS = [
+    r'(\d)\s*комнат', r'(\d)\s*к', r'(\d)-комнат', r'(\d)к',
+    r'студи[яю]', r'однокомнатн', r'двухкомнатн', r'трехкомнатн',
+]
+LEGACY_AREA_PATTERNS = [
+    r'(\d+)\s*кв\.?\s*м', r'(\d+)\s*квадрат', r'(\d+)\s*метр',
+    r'площад[ьь]\s*(\d+)', r'от\s*(\d+)\s*до\s*(\d+)\s*кв',
+]
+
+
+def legacy_scan(message: str):
+    """Все регулярные выражения сообщения по-старому: (паттерн, группы) на семейство"""
+    message_lower = message.lower()
+    results = []
+    for patterns in (LEGACY_BUDGET_PATTERNS, LEGACY_ROOMS_PATTERNS, LEGACY_AREA_PATTERNS):
+        found = None
+        for number, pattern in enumerate(patterns):
+            match = re.search(pattern, message_lower)
+            if match:
+                found = (number, match.group(0), match.groups())
+                break
+        results.append(found)
+    match = re.compile(r'из\s+([А-Яа-яЁё]+)', re.IGNORECASE).search(message)
+    results.append(match.group(1) if match else None)
+    return results
+
+
+FAMILIES = (
+    LeadDataExtractor.BUDGET_PATTERNS,
+    LeadDataExtractor.ROOMS_PATTERNS,
+    LeadDataExtractor.AREA_PATTERNS,
+)
+
+
+def family_scan(message: str):
+    """То же через семейства LeadDataExtractor"""
+    message_lower = message.lower()
+    results = []
+    for family in FAMILIES:
+        match = family.search(message_lower)
+        results.append(None if match is None else (family.names.index(match.name), match.text, match.groups))
+    match = LeadDataExtractor.CITY_PATTERN.search(message)
+    results.append(match.group(1) if match else None)
+    return results
+
+
+def best_rate(scan, messages, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message in messages:
+            scan(message)
+        best = min(best, time.perf_counter() - started)
+    return len(messages) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=10, help="сколько раз повторить сообщения корпуса")
+    args = parser.parse_args()
+
+    messages = [message for record in load_corpus() for message in record['dialog']]
+    for message in messages:
+        assert legacy_scan(message) == family_scan(message), message
+    matched = sum(any(result is not None for result in family_scan(message)) for message in messages)
+    print(f"✅ Совпадения одинаковы: {len(messages)} сообщений, с числами/городом {matched}")
+
+    messages = messages * args.repeat
+    legacy = best_rate(legacy_scan, messages, args.rounds)
+    families = best_rate(family_scan, messages, args.rounds)
+    print(f"Цикл re.search:  {legacy:10,.0f} сообщений/с ({1e6 / legacy:.1f} мкс)")
+    print(f"PatternFamily:   {families:10,.0f} сообщений/с ({1e6 / families:.1f} мкс)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
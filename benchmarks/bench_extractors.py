@@ -0,0 +1,123 @@
+"""
+Бенчмарк LeadDataExtractor на эталонном корпусе диалогов
+
+Корпус (benchmarks/data/extractor_corpus.jsonl) - диалоги клиентов на
+русском: приветствия, цели покупки, оплата, бюджет, локации, параметры
+объекта, сроки, контакты. Для каждого диалога сообщения извлекаются
+последовательно, как в MemoryService, и изменения данных лида после
+каждого сообщения сверяются с эталоном из корпуса. Затем измеряется
+пропускная способность (сообщений в секунду).
+
+Эталон записывается флагом --update-golden; делать это стоит только при
+намеренном изменении результатов извлечения.
+
+Запуск:
+    python benchmarks/bench_extractors.py [--rounds 5] [--update-golden]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.extractors import LeadDataExtractor  # noqa: E402
+from bot.memory.models import LeadData  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'extractor_corpus.jsonl')
+
+# Время извлечения меняется от запуска к запуску и в эталон не входит
+VOLATILE_FIELDS = ('created_at', 'updated_at')
+
+
+def load_corpus() -> List[Dict[str, Any]]:
+    with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+        return [json.loads(line) for line in corpus_file if line.strip()]
+
+
+def extract_dialog(dialog: List[str]) -> List[Dict[str, Any]]:
+    """
+    Изменения данных лида после каждого сообщения диалога.
+
+    Изменение - поля разреженного словаря, отличающиеся от предыдущего
+    шага; None - поле вернулось к значению по умолчанию.
+    """
+    lead = LeadData()
+    previous: Dict[str, Any] = {}
+    changes = []
+    for message in dialog:
+        lead = LeadDataExtractor.extract_from_message(message, lead)
+        snapshot = lead.to_dict(sparse=True)
+        for field_name in VOLATILE_FIELDS:
+            snapshot.pop(field_name, None)
+        changed = {key: value for key, value in snapshot.items() if previous.get(key) != value}
+        changed.update({key: None for key in previous if key not in snapshot})
+        changes.append(changed)
+        previous = snapshot
+    return changes
+
+
+def check_golden(corpus: List[Dict[str, Any]]) -> int:
+    mismatches = 0
+    for number, record in enumerate(corpus):
+        for step, (actual, expected) in enumerate(zip(extract_dialog(record['dialog']), record['expected'])):
+            if actual != expected:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"❌ Диалог {number}, сообщение {step}: {record['dialog'][step]!r}")
+                    for key in sorted(set(actual) | set(expected)):
+                        if actual.get(key) != expected.get(key):
+                            print(f"   {key}: ожидалось {expected.get(key)!r}, получено {actual.get(key)!r}")
+    return mismatches
+
+
+def update_golden(corpus: List[Dict[str, Any]]):
+    with open(CORPUS_PATH, 'w', encoding='utf-8') as corpus_file:
+        for record in corpus:
+            record = {'dialog': record['dialog'], 'expected': extract_dialog(record['dialog'])}
+            corpus_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def throughput(corpus: List[Dict[str, Any]], rounds: int) -> float:
+    """Лучшее из rounds время прогона корпуса, сообщений в секунду"""
+    dialogs = [record['dialog'] for record in corpus]
+    messages = sum(len(dialog) for dialog in dialogs)
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for dialog in dialogs:
+            lead = LeadData()
+            for message in dialog:
+                lead = LeadDataExtractor.extract_from_message(message, lead)
+        best = min(best, time.perf_counter() - started)
+    return messages / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--update-golden', action='store_true')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    if args.update_golden:
+        update_golden(corpus)
+        print(f"Эталон обновлен: {len(corpus)} диалогов")
+        return 0
+
+    messages = sum(len(record['dialog']) for record in corpus)
+    mismatches = check_golden(corpus)
+    if mismatches:
+        print(f"❌ Расхождений с эталоном: {mismatches} из {messages} сообщений")
+        return 1
+    print(f"✅ Совпадает с эталоном: {len(corpus)} диалогов, {messages} сообщений")
+
+    rate = throughput(corpus, args.rounds)
+    print(f"Пропускная способность: {rate:,.0f} сообщений/с ({1e6 / rate:.1f} мкс на сообщение)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
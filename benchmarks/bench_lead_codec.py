@@ -0,0 +1,294 @@
+"""
+Бенчмарк кодека LeadData
+
+Сравнивает прежние рукописные LeadData.to_dict/from_dict с кодеком
+(плотный и разреженный словарь, бинарная форма): пропускную способность
+кодирования и декодирования и размер данных. Лиды генерируются на разных
+стадиях диалога - от почти пустых до заполненных. Перед замерами
+проверяется, что для случайных лидов все три формы кодека декодируются в
+исходный объект (round-trip).
+
+Запуск:
+    python benchmarks/bench_lead_codec.py [--leads 2000] [--rounds 20]
+"""
+import argparse
+import dataclasses
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.lead_codec import SCHEMA_VERSION_KEY  # noqa: E402
+from bot.memory.models import (  # noqa: E402
+    AutomationGoal, ClientType, DialogState, LeadData, PaymentType, lead_codec,
+)
+from bot.memory.question_registry import QUESTION_CATALOG, question_registry  # noqa: E402
+
+LOCATIONS = ['Адлер', 'Сириус', 'Хоста', 'Красная Поляна', 'центр Сочи', 'Дагомыс']
+PROPERTY_TYPES = ['квартира', 'апартаменты', 'дом', 'таунхаус', 'участок']
+
+# Прежний изменяемый LeadData (те же поля, без frozen и slots) для прежнего from_dict
+LegacyLeadData = dataclasses.make_dataclass('LegacyLeadData', [
+    (spec.name, spec.type, dataclasses.field(default=spec.default) if spec.default is not dataclasses.MISSING
+     else dataclasses.field(default_factory=spec.default_factory))
+    for spec in dataclasses.fields(LeadData)
+])
+
+
+def legacy_to_dict(lead: LeadData) -> Dict[str, Any]:
+    """Прежний LeadData.to_dict"""
+    # Вопросы каталога - битами маски, прочие - текстом
+    asked_mask, asked_extra = question_registry.encode(lead.asked_questions_mask)
+    return {
+        'name': lead.name,
+        'phone': lead.phone,
+        'telegram_username': lead.telegram_username,
+        'whatsapp': lead.whatsapp,
+        'city': lead.city,
+        'current_location': lead.current_location,
+        'is_in_sochi': lead.is_in_sochi,
+        'is_local': lead.is_local,
+        'rooms_count': lead.rooms_count,
+        'area_min': lead.area_min,
+        'area_max': lead.area_max,
+        'view_preference': lead.view_preference,
+        'completion_date': lead.completion_date,
+        'need_remote_deal': lead.need_remote_deal,
+        'online_viewing_ready': lead.online_viewing_ready,
+        'need_to_sell_current': lead.need_to_sell_current,
+        'current_property_city': lead.current_property_city,
+        'decision_maker': lead.decision_maker,
+        'business_sphere': lead.business_sphere,
+        'company_size': lead.company_size,
+        'current_automation_tasks': lead.current_automation_tasks,
+        'automation_goal': lead.automation_goal.value if lead.automation_goal else None,
+        'payment_type': lead.payment_type.value if lead.payment_type else None,
+        'budget_min': lead.budget_min,
+        'budget_max': lead.budget_max,
+        'mortgage_bank': lead.mortgage_bank,
+        'needs_sell_own': lead.needs_sell_own,
+        'preferred_locations': lead.preferred_locations,
+        'property_type': lead.property_type,
+        'property_params': lead.property_params,
+        'technical_requirements': lead.technical_requirements,
+        'automation_type': lead.automation_type,
+        'implementation_date': lead.implementation_date.isoformat() if lead.implementation_date else None,
+        'urgency_level': lead.urgency_level,
+        'ready_for_quick_decision': lead.ready_for_quick_decision,
+        'urgency_date': lead.urgency_date,
+        'automation_experience': lead.automation_experience,
+        'needs_remote_setup': lead.needs_remote_setup,
+        'online_show_ready': lead.online_show_ready,
+        'sochi_experience': lead.sochi_experience,
+        'preferred_contact_time': lead.preferred_contact_time,
+        'preferred_contact_method': lead.preferred_contact_method,
+        'agreed_demo_slots': [slot.isoformat() for slot in lead.agreed_demo_slots],
+        'qualification_status': lead.qualification_status.value if lead.qualification_status else None,
+        'current_dialog_state': lead.current_dialog_state.value,
+        'asked_questions_mask': asked_mask,
+        'asked_questions_extra': asked_extra,
+        'last_question_asked': lead.last_question_asked,
+        'questions_answered': lead.questions_answered,
+        'created_at': lead.created_at.isoformat(),
+        'updated_at': lead.updated_at.isoformat(),
+        'utm_source': lead.utm_source,
+        'comments': lead.comments
+    }
+
+def legacy_from_dict(data: Dict[str, Any]) -> LegacyLeadData:
+    """Прежний LeadData.from_dict"""
+    lead = LegacyLeadData()
+
+    # Базовая информация
+    lead.name = data.get('name')
+    lead.phone = data.get('phone')
+    lead.telegram_username = data.get('telegram_username')
+    lead.whatsapp = data.get('whatsapp')
+    lead.city = data.get('city')
+    lead.current_location = data.get('current_location')
+    lead.is_in_sochi = data.get('is_in_sochi')
+    lead.is_local = data.get('is_local')
+
+    # Бизнес-информация
+    lead.business_sphere = data.get('business_sphere')
+    lead.company_size = data.get('company_size')
+    lead.current_automation_tasks = data.get('current_automation_tasks')
+
+    # Потребности и бюджет
+    if data.get('automation_goal'):
+        lead.automation_goal = AutomationGoal(data['automation_goal'])
+    if data.get('payment_type'):
+        lead.payment_type = PaymentType(data['payment_type'])
+
+    lead.budget_min = data.get('budget_min')
+    lead.budget_max = data.get('budget_max')
+    lead.mortgage_bank = data.get('mortgage_bank')
+    lead.needs_sell_own = data.get('needs_sell_own')
+
+    # Недвижимость
+    lead.preferred_locations = data.get('preferred_locations', [])
+    lead.property_type = data.get('property_type')
+    lead.property_params = data.get('property_params', {})
+
+    # Технические требования
+    lead.technical_requirements = data.get('technical_requirements', [])
+    lead.automation_type = data.get('automation_type', [])
+
+    # Временные рамки
+    if data.get('implementation_date'):
+        lead.implementation_date = datetime.fromisoformat(data['implementation_date'])
+
+    lead.urgency_level = data.get('urgency_level')
+    lead.ready_for_quick_decision = data.get('ready_for_quick_decision')
+    lead.urgency_date = data.get('urgency_date')
+
+    # Опыт и готовность
+    lead.automation_experience = data.get('automation_experience')
+    lead.needs_remote_setup = data.get('needs_remote_setup')
+    lead.online_show_ready = data.get('online_show_ready')
+    lead.sochi_experience = data.get('sochi_experience')
+
+    # Коммуникация
+    lead.preferred_contact_time = data.get('preferred_contact_time')
+    lead.preferred_contact_method = data.get('preferred_contact_method')
+
+    if data.get('agreed_demo_slots'):
+        lead.agreed_demo_slots = [
+            datetime.fromisoformat(slot)
+            for slot in data['agreed_demo_slots']
+        ]
+
+    # Статус
+    if data.get('qualification_status'):
+        lead.qualification_status = ClientType(data['qualification_status'])
+    if data.get('current_dialog_state'):
+        lead.current_dialog_state = DialogState(data['current_dialog_state'])
+
+    # История вопросов
+    lead.asked_questions_mask = question_registry.decode(
+        data.get('asked_questions_mask') or 0, data.get('asked_questions_extra') or []
+    )
+    # Прежний формат - список текстов; ZEP объединяет метаданные, поэтому
+    # старый ключ может остаться рядом с маской
+    for question in data.get('asked_questions') or []:
+        lead.asked_questions_mask = question_registry.add(lead.asked_questions_mask, question)
+    lead.last_question_asked = data.get('last_question_asked')
+    lead.questions_answered = data.get('questions_answered', {})
+
+    # Метаданные
+    if data.get('created_at'):
+        lead.created_at = datetime.fromisoformat(data['created_at'])
+    if data.get('updated_at'):
+        lead.updated_at = datetime.fromisoformat(data['updated_at'])
+
+    lead.utm_source = data.get('utm_source')
+    lead.comments = data.get('comments', '')
+
+    return lead
+
+
+def random_lead(rng: random.Random) -> LeadData:
+    """Лид на случайной стадии диалога: чем дальше стадия, тем больше заполненных полей"""
+    states = list(DialogState)
+    stage = rng.randrange(len(states))
+    fill = (stage + 1) / len(states)
+
+    def maybe(value):
+        return value if rng.random() < fill else None
+
+    started = datetime(2025, 1, 1) + timedelta(seconds=rng.randrange(30 * 86400), microseconds=rng.randrange(10 ** 6))
+    lead = LeadData(created_at=started, updated_at=started + timedelta(minutes=rng.randrange(600))).edit()
+    lead.current_dialog_state = states[stage]
+    lead.name = maybe(rng.choice(['Анна', 'Игорь', 'Мария']))
+    lead.city = maybe(rng.choice(['Москва', 'Волгодонск', 'Казань']))
+    lead.is_in_sochi = maybe(rng.random() < 0.5)
+    lead.rooms_count = maybe(rng.randint(1, 4))
+    lead.area_min = maybe(rng.randint(25, 90))
+    lead.automation_goal = maybe(rng.choice(list(AutomationGoal)))
+    lead.payment_type = maybe(rng.choice(list(PaymentType)))
+    lead.budget_min = maybe(rng.randint(3, 20) * 1000000)
+    lead.budget_max = maybe(rng.randint(20, 60) * 1000000)
+    lead.mortgage_bank = maybe('Сбербанк')
+    lead.property_type = maybe(rng.choice(PROPERTY_TYPES))
+    lead.preferred_locations = tuple(rng.sample(LOCATIONS, int(fill * 3)))
+    lead.property_params = {'вид': 'море'} if rng.random() < fill else {}
+    lead.urgency_level = maybe(rng.choice(['high', 'medium', 'low']))
+    lead.sochi_experience = maybe('none')
+    lead.qualification_status = maybe(rng.choice(list(ClientType)))
+    if rng.random() < fill / 2:
+        lead.agreed_demo_slots = (started + timedelta(days=2),)
+    asked = rng.sample(QUESTION_CATALOG, int(fill * 6))
+    if rng.random() < 0.2:
+        asked.append("Уточните, пожалуйста, этаж?")
+    lead.last_question_asked = maybe(rng.choice(QUESTION_CATALOG))
+    lead.questions_answered = {'budget': lead.budget_max} if lead.budget_max else {}
+    return lead.freeze().with_questions_asked(asked)
+
+
+def check_round_trip(leads):
+    for lead in leads:
+        assert lead_codec.from_dict(lead_codec.to_dict(lead)) == lead
+        assert lead_codec.from_dict(lead_codec.to_dict(lead, sparse=True)) == lead
+        assert lead_codec.from_bytes(lead_codec.to_bytes(lead)) == lead
+        # Через JSON, как при записи в хранилище и журнал
+        assert lead_codec.from_dict(json.loads(json.dumps(lead_codec.to_dict(lead, sparse=True)))) == lead
+    # Словарь прежней версии схемы (без schema_version, список asked_questions)
+    lead = leads[-1]
+    legacy = legacy_to_dict(lead)
+    legacy['asked_questions'] = question_registry.questions(legacy.pop('asked_questions_mask'))
+    legacy.pop(SCHEMA_VERSION_KEY, None)
+    assert lead_codec.from_dict(legacy).asked_questions_mask == lead.asked_questions_mask
+
+
+def throughput(function, items, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            function(item)
+    return len(items) * rounds / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    leads = [random_lead(rng) for _ in range(args.leads)]
+    check_round_trip(leads)
+    print(f"Round-trip: {len(leads)} случайных лидов совпадают во всех формах")
+
+    legacy_dicts = [legacy_to_dict(lead) for lead in leads]
+    dense_dicts = [lead.to_dict() for lead in leads]
+    sparse_dicts = [lead.to_dict(sparse=True) for lead in leads]
+    payloads = [lead.to_bytes() for lead in leads]
+
+    rows = [
+        ('прежний словарь', lambda lead: legacy_to_dict(lead), legacy_from_dict, legacy_dicts),
+        ('плотный словарь', lambda lead: lead.to_dict(), LeadData.from_dict, dense_dicts),
+        ('разреженный', lambda lead: lead.to_dict(sparse=True), LeadData.from_dict, sparse_dicts),
+        ('бинарный', LeadData.to_bytes, LeadData.from_bytes, payloads),
+    ]
+    print(f"{'форма':>16} {'encode, тыс/с':>14} {'decode, тыс/с':>14} {'ключей':>7} {'байт':>6}")
+    for title, encode, decode, encoded in rows:
+        encode_rate = throughput(encode, leads, args.rounds) / 1000
+        decode_rate = throughput(decode, encoded, args.rounds) / 1000
+        if isinstance(encoded[0], bytes):
+            keys = '-'
+            size = sum(len(payload) for payload in encoded) / len(encoded)
+        else:
+            keys = f"{sum(len(data) for data in encoded) / len(encoded):.0f}"
+            size = sum(len(json.dumps(data, ensure_ascii=False).encode('utf-8')) for data in encoded) / len(encoded)
+        print(f"{title:>16} {encode_rate:>14.0f} {decode_rate:>14.0f} {keys:>7} {size:>6.0f}")
+    print("Размер словарей - UTF-8 JSON, как при записи в хранилище и журналы")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Бенчмарк индекса лидов
+
+Заполняет LeadIndex случайными лидами, затем измеряет время точечных
+обновлений (как при save_lead_data) и типовых запросов админки (первая
+страница из 50 лидов) в сравнении с перебором всех лидов и частичной
+сортировкой найденных. Результаты каждого запроса сверяются с перебором.
+В конце сравнивается сводка скоринга по колонкам индекса со скорингом
+bulk_scoring, собирающим колонки заново.
+
+Запуск:
+    python benchmarks/bench_lead_index.py [--leads 100000] [--updates 20000]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_lead_scoring import LOCATIONS, random_lead  # noqa: E402
+from bot.memory.bulk_scoring import score_leads  # noqa: E402
+from bot.memory.lead_index import LeadIndex, _budget_interval  # noqa: E402
+from bot.memory.models import ClientType, DialogState  # noqa: E402
+
+QUERIES = [
+    ("HOT, Красная Поляна, до 15 млн",
+     dict(location='Красная Поляна', qualification=ClientType.HOT, budget_to=15_000_000)),
+    ("квартира в Адлере", dict(location='адлер', property_type='Квартира')),
+    ("состояние S5, бюджет 1-3 тыс.", dict(state=DialogState.S5_BUDGET, budget_from=1000, budget_to=3000)),
+    ("бюджет от 10 млн", dict(budget_from=10_000_000)),
+    ("все WARM", dict(qualification=ClientType.WARM)),
+]
+
+
+def scan(leads, location=None, property_type=None, qualification=None, state=None,
+         budget_from=None, budget_to=None):
+    """Перебор всех лидов с теми же условиями, что LeadIndex.query"""
+    found = []
+    for session_id, lead in leads.items():
+        if location is not None and location.lower() not in {item.lower() for item in lead.preferred_locations}:
+            continue
+        if property_type is not None and (lead.property_type or '').lower() != property_type.lower():
+            continue
+        if qualification is not None and lead.qualification_status != qualification:
+            continue
+        if state is not None and lead.current_dialog_state != state:
+            continue
+        if budget_from is not None or budget_to is not None:
+            interval = _budget_interval(lead)
+            if interval is None:
+                continue
+            if budget_to is not None and interval[0] > budget_to:
+                continue
+            if budget_from is not None and interval[1] < budget_from:
+                continue
+        found.append(session_id)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=100_000)
+    parser.add_argument('--updates', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    leads = {f"user{index}_session": random_lead(rng) for index in range(args.leads)}
+
+    index = LeadIndex()
+    started = time.perf_counter()
+    for session_id, lead in leads.items():
+        index.update(session_id, lead)
+    build = time.perf_counter() - started
+    print(f"Заполнение индекса: {build * 1e3:.0f} мс ({build / len(leads) * 1e6:.1f} мкс на лид)")
+
+    # Обновления: новый снимок лида с измененными бюджетом, локацией или статусом
+    session_ids = list(leads)
+    started = time.perf_counter()
+    for _ in range(args.updates):
+        session_id = rng.choice(session_ids)
+        lead = leads[session_id].replace(
+            budget_max=rng.choice([None, 2500, 12_000_000, 20_000_000]),
+            preferred_locations=tuple(rng.sample(LOCATIONS, rng.choice([0, 1, 2]))),
+            qualification_status=rng.choice(list(ClientType)),
+        )
+        leads[session_id] = lead
+        index.update(session_id, lead)
+    updates = time.perf_counter() - started
+    print(f"Обновление лида: {updates / args.updates * 1e6:.1f} мкс (включая replace снимка)")
+
+    for title, filters in QUERIES:
+        started = time.perf_counter()
+        total, page = index.query(**filters, limit=50)
+        indexed = time.perf_counter() - started
+        started = time.perf_counter()
+        expected = scan(leads, **filters)
+        heapq.nlargest(50, expected, key=lambda session_id: (leads[session_id].updated_at, session_id))
+        scanned = time.perf_counter() - started
+        _, everything = index.query(**filters, limit=0)
+        assert total == len(expected) and sorted(sid for sid, _ in everything) == sorted(expected), title
+        assert [sid for sid, _ in page] == [sid for sid, _ in everything[:50]], title
+        print(f"{title:34} найдено {total:6}: индекс {indexed * 1e3:7.2f} мс, перебор {scanned * 1e3:7.2f} мс")
+
+    started = time.perf_counter()
+    summary = index.scores_summary()
+    indexed_scoring = time.perf_counter() - started
+    started = time.perf_counter()
+    scores = score_leads(list(leads.values()))
+    rebuilt_scoring = time.perf_counter() - started
+    assert summary['hot'] == scores.status_counts()[ClientType.HOT]
+    assert summary['should_escalate'] == int(scores.should_escalate.sum())
+    print(f"Сводка скоринга: колонки индекса {indexed_scoring * 1e3:.1f} мс, "
+          f"сбор колонок заново {rebuilt_scoring * 1e3:.1f} мс")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
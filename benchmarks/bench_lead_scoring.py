@@ -0,0 +1,241 @@
+"""
+Бенчмарк скоринга лидов по маске заполненных полей
+
+Сравнивает прежние проверки полей LeadData (цепочки if по атрибутам) с
+lead_scoring: статус квалификации, полнота данных, скор и условия эскалации,
+следующие и запасные вопросы по состоянию. Перед замерами проверяется, что
+для случайных лидов во всех состояниях результаты совпадают.
+
+Запуск:
+    python benchmarks/bench_lead_scoring.py [--leads 5000] [--rounds 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory import lead_scoring  # noqa: E402
+from bot.memory.models import (  # noqa: E402
+    AutomationGoal, ClientType, DialogState, LeadData, PaymentType,
+)
+
+LOCATIONS = ['Адлер', 'Сириус', 'Хоста', 'Красная Поляна', 'центр Сочи']
+
+
+# === Прежние реализации ===
+
+def legacy_qualification_status(lead: LeadData) -> ClientType:
+    """Прежний DialogStateExtractor.calculate_qualification_status"""
+    score = 0
+    if lead.budget_min or lead.budget_max or lead.payment_type:
+        score += 1
+    if lead.urgency_date or lead.ready_for_quick_decision or lead.urgency_level in ['high', 'medium']:
+        score += 1
+    if lead.automation_goal and (lead.property_type or lead.preferred_locations):
+        score += 1
+    if score == 3:
+        return ClientType.HOT
+    elif score == 2:
+        return ClientType.WARM
+    else:
+        return ClientType.COLD
+
+
+def legacy_data_completeness(lead: LeadData) -> float:
+    """Прежний MemoryService._calculate_data_completeness"""
+    total_fields = 20
+    filled_fields = 0
+    if lead.name: filled_fields += 1
+    if lead.phone: filled_fields += 1
+    if lead.business_sphere: filled_fields += 1
+    if lead.automation_goal: filled_fields += 1
+    if lead.payment_type: filled_fields += 1
+    if lead.budget_min or lead.budget_max: filled_fields += 2
+    if lead.technical_requirements: filled_fields += 1
+    if lead.urgency_level: filled_fields += 1
+    if lead.automation_experience: filled_fields += 1
+    if lead.preferred_contact_method: filled_fields += 1
+    return filled_fields / total_fields
+
+
+def legacy_escalation_score(lead: LeadData) -> float:
+    """Прежний MemoryService._calculate_escalation_score"""
+    score = 0.0
+    if lead.qualification_status == ClientType.HOT:
+        score += 0.4
+    elif lead.qualification_status == ClientType.WARM:
+        score += 0.2
+    if lead.phone:
+        score += 0.2
+    if lead.budget_max and lead.budget_max > 1000:
+        score += 0.2
+    if lead.urgency_level == 'high':
+        score += 0.2
+    return min(score, 1.0)
+
+
+def legacy_should_escalate(lead: LeadData) -> bool:
+    """Прежний MemoryService._should_escalate"""
+    escalation_conditions = [
+        lead.qualification_status == ClientType.HOT,
+        bool(lead.phone) and bool(lead.agreed_demo_slots),
+        'презентация' in (lead.comments or '').lower(),
+        len(lead.technical_requirements) > 3,
+        (lead.budget_min and lead.budget_min > 1000) or
+        (lead.budget_max and lead.budget_max > 2000)
+    ]
+    return any(escalation_conditions)
+
+
+def legacy_next_questions(state: DialogState, lead: LeadData) -> List[str]:
+    """Прежняя ветка next_questions из MemoryService._generate_recommendations (без S8)"""
+    if state == DialogState.S0_GREETING:
+        return [
+            "Для себя ищете недвижимость или как инвестицию?",
+            "Вы сейчас в Сочи? Если нет — из какого города?"
+        ]
+    elif state == DialogState.S1_BUSINESS:
+        if not lead.automation_goal:
+            return [
+                "Для себя ищете жилье или как инвестицию?",
+                "Цель покупки: ПМЖ, сдача в аренду или сбережения?"
+            ]
+    elif state == DialogState.S2_GOAL:
+        if not lead.budget_min:
+            return [
+                "На какой бюджет мне ориентироваться?",
+                "Есть решение: AI-ассистент от $350. Такой диапазон рассматриваете?"
+            ]
+    return []
+
+
+def legacy_alternative_questions(state: DialogState, lead: LeadData) -> List[str]:
+    """Прежний MemoryService._get_alternative_questions"""
+    alternative_questions = []
+    if state == DialogState.S0_GREETING:
+        alternative_questions = [
+            "Расскажите, пожалуйста, подробнее о вашей ситуации",
+            "Что вас привело к поиску недвижимости в Сочи?"
+        ]
+    elif state == DialogState.S1_BUSINESS:
+        if not lead.automation_goal:
+            alternative_questions = [
+                "Какие у вас планы на недвижимость?",
+                "Что для вас важнее: доходность или надежность?"
+            ]
+    elif state == DialogState.S2_GOAL:
+        alternative_questions = [
+            "Какие сроки покупки вы рассматриваете?",
+            "Вы уже определились с форматом недвижимости?"
+        ]
+    elif state == DialogState.S4_REQUIREMENTS:
+        alternative_questions = [
+            "Есть ли у вас особые пожелания к объекту?",
+            "Что для вас важнее: локация или характеристики объекта?"
+        ]
+    elif state == DialogState.S5_BUDGET:
+        alternative_questions = [
+            "Какой диапазон цен вы рассматриваете?",
+            "Есть ли у вас предпочтения по форме оплаты?"
+        ]
+    return alternative_questions
+
+
+# === Данные ===
+
+def maybe(rng: random.Random, value, probability: float = 0.5):
+    return value if rng.random() < probability else None
+
+
+def random_lead(rng: random.Random) -> LeadData:
+    """Лид со случайным набором заполненных полей, включая пустые и нулевые значения"""
+    draft = LeadData().edit()
+    draft.name = maybe(rng, rng.choice(['Анна', 'Игорь', '']))
+    draft.phone = maybe(rng, rng.choice(['+79001234567', '']))
+    draft.business_sphere = maybe(rng, 'IT', 0.3)
+    draft.automation_goal = maybe(rng, rng.choice(list(AutomationGoal)))
+    draft.payment_type = maybe(rng, rng.choice(list(PaymentType)), 0.4)
+    draft.budget_min = maybe(rng, rng.choice([0, 500, 1500, 5_000_000]), 0.4)
+    draft.budget_max = maybe(rng, rng.choice([0, 900, 2500, 15_000_000]), 0.4)
+    draft.preferred_locations = tuple(rng.sample(LOCATIONS, rng.choice([0, 0, 1, 2])))
+    draft.property_type = maybe(rng, rng.choice(['квартира', 'дом', '']), 0.4)
+    draft.technical_requirements = tuple(f"req{index}" for index in range(rng.choice([0, 0, 1, 4, 5])))
+    draft.urgency_level = maybe(rng, rng.choice(['high', 'medium', 'low', '']), 0.5)
+    draft.ready_for_quick_decision = maybe(rng, rng.choice([True, False]), 0.3)
+    draft.urgency_date = maybe(rng, 'на неделе', 0.3)
+    draft.automation_experience = maybe(rng, 'some', 0.3)
+    draft.preferred_contact_method = maybe(rng, 'telegram', 0.3)
+    if rng.random() < 0.3:
+        draft.agreed_demo_slots = (datetime(2026, 5, 1) + timedelta(hours=rng.randint(0, 100)),)
+    draft.comments = rng.choice(['', '', 'Хочет презентацию объекта', 'перезвонить'])
+    draft.current_dialog_state = rng.choice(list(DialogState))
+    lead = draft.freeze()
+    return lead.replace(qualification_status=lead_scoring.qualification_status(lead))
+
+
+# === Прогоны ===
+
+def score_all(leads, qualification, completeness, score, escalate, next_questions, alternatives):
+    for lead in leads:
+        state = lead.current_dialog_state
+        qualification(lead)
+        completeness(lead)
+        score(lead)
+        escalate(lead)
+        next_questions(state, lead)
+        alternatives(state, lead)
+
+
+LEGACY = (legacy_qualification_status, legacy_data_completeness, legacy_escalation_score,
+          legacy_should_escalate, legacy_next_questions, legacy_alternative_questions)
+MASKED = (lead_scoring.qualification_status, lead_scoring.data_completeness, lead_scoring.escalation_score,
+          lead_scoring.should_escalate, lead_scoring.next_questions, lead_scoring.alternative_questions)
+
+
+def check_equivalence(leads) -> None:
+    for lead in leads:
+        assert legacy_qualification_status(lead) == lead_scoring.qualification_status(lead), lead
+        assert legacy_data_completeness(lead) == lead_scoring.data_completeness(lead), lead
+        assert legacy_escalation_score(lead) == lead_scoring.escalation_score(lead), lead
+        assert bool(legacy_should_escalate(lead)) == lead_scoring.should_escalate(lead), lead
+        for state in DialogState:
+            assert legacy_next_questions(state, lead) == lead_scoring.next_questions(state, lead), (state, lead)
+            assert legacy_alternative_questions(state, lead) == lead_scoring.alternative_questions(state, lead), (state, lead)
+
+
+def timed(leads, functions, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        score_all(leads, *functions)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    leads = [random_lead(rng) for _ in range(args.leads)]
+    check_equivalence(leads)
+    print(f"Результаты совпадают на {len(leads)} лидах во всех состояниях")
+
+    legacy = timed(leads, LEGACY, args.rounds)
+    masked = timed(leads, MASKED, args.rounds)
+    per_lead = 1e6 / len(leads)
+    print(f"Прежние проверки полей: {legacy * per_lead:.2f} мкс на лид")
+    print(f"Маска полей:            {masked * per_lead:.2f} мкс на лид (x{legacy / masked:.2f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Бенчмарк памяти и времени одного хода MemoryService.process_message
+
+Прогоняет типовой диалог с клиентом для множества сессий без внешнего
+хранилища (локальные кэши, извлечение данных, состояние, рекомендации) и
+измеряет через tracemalloc на каждый ход пик временных выделений и
+прирост удерживаемой памяти, а также время хода без трассировки.
+
+Запуск:
+    python benchmarks/bench_lead_turn.py [--sessions 300]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.memory_service import MemoryService  # noqa: E402
+
+DIALOG = [
+    ("user", "Здравствуйте! Хочу купить квартиру"),
+    ("assistant", "Для себя ищете недвижимость или как инвестицию?"),
+    ("user", "Как инвестицию, сам из Москвы"),
+    ("assistant", "Цель покупки: ПМЖ, сдача в аренду или сбережения?"),
+    ("user", "Под сдачу в аренду, рассматриваю Сириус или Адлер"),
+    ("user", "Оплата наличные, бюджет до 15 млн"),
+    ("user", "Двухкомнатная, от 50 до 70 кв м, с видом на море"),
+    ("user", "Приезжаю на неделе, решаю вместе с женой"),
+    ("user", "Готов на онлайн-показ, мой телефон 8 900 123 45 67"),
+]
+
+
+async def run_dialogs(service: MemoryService, sessions: int, offset: int, trace: bool):
+    peaks, retained = [], []
+    for index in range(sessions):
+        session_id = None
+        for message_type, text in DIALOG:
+            if trace:
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+            result = await service.process_message(
+                f"{offset + index}", text, message_type=message_type, existing_session_id=session_id
+            )
+            if trace:
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+            session_id = result['session_id']
+    return peaks, retained
+
+
+async def main_async(args) -> int:
+    with tempfile.TemporaryDirectory() as path:
+        service = MemoryService('', similarity_index_path=path)
+
+        # Прогрев: импорты, кэши регулярных выражений и нормализации вопросов
+        await run_dialogs(service, 20, 10 ** 6, trace=False)
+
+        started = time.perf_counter()
+        await run_dialogs(service, args.sessions, 0, trace=False)
+        turns = args.sessions * len(DIALOG)
+        turn_time = (time.perf_counter() - started) / turns
+
+        tracemalloc.start()
+        peaks, retained = await run_dialogs(service, args.sessions, 2 * 10 ** 6, trace=True)
+        tracemalloc.stop()
+
+        print(f"Ходов: {turns}, время хода: {turn_time * 1e6:.0f} мкс")
+        print(f"Пик временных выделений за ход: медиана {statistics.median(peaks) / 1024:.1f} КБ, "
+              f"среднее {statistics.mean(peaks) / 1024:.1f} КБ")
+        print(f"Удерживается после хода: среднее {statistics.mean(retained):.0f} байт")
+        if service._similarity_index:
+            service._similarity_index.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=300)
+    args = parser.parse_args()
+    # Логи хода форматируются в любом случае, но не выводятся
+    logging.basicConfig(level=logging.CRITICAL)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
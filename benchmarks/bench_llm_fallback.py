@@ -0,0 +1,100 @@
+"""
+Бенчмарк гибридного извлечения: регулярные выражения + LLM при низкой уверенности
+
+Диалоги эталонного корпуса проходят путь MemoryService: извлечение
+регулярными выражениями, оценка уверенности по слотам текущего
+состояния (LLMFallbackExtractor.submit), переход состояния. LLM
+имитируется задержкой --latency без ответа по существу: измеряется не
+качество извлечения, а нагрузка медленного пути.
+
+Показывает долю сообщений, ушедших в медленный путь, долю попаданий в
+кэш (сообщения корпуса часто повторяются, как и типовые ответы
+клиентов), число вызовов LLM против вызова на каждое сообщение и
+стоимость оценки на критическом пути хода.
+
+Запуск:
+    python benchmarks/bench_llm_fallback.py [--latency 0.3] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extractors import load_corpus  # noqa: E402
+from bot.memory.extractors import DialogStateExtractor, LeadDataExtractor  # noqa: E402
+from bot.memory.llm_fallback import SLOTS, LLMFallbackExtractor, merge_fields  # noqa: E402
+from bot.memory.models import LeadData  # noqa: E402
+
+
+async def run(corpus, latency: float, concurrency: int):
+    leads = {}
+    slow_slots = Counter()
+
+    async def extract(message: str):
+        await asyncio.sleep(latency)
+        return {}
+
+    async def merge(session_id: str, values):
+        lead = leads[session_id]
+        leads[session_id] = merge_fields(lead, values)
+        return len(values)
+
+    fallback = LLMFallbackExtractor(extract, merge, max_concurrency=concurrency, max_pending=10 ** 6)
+    submit_seconds = 0.0
+    messages = 0
+    started = time.perf_counter()
+    for number, record in enumerate(corpus):
+        session_id = f'session_{number}'
+        leads[session_id] = LeadData()
+        for message in record['dialog']:
+            # Фоновое дополнение могло обновить лид между ходами
+            lead = leads[session_id]
+            state = lead.current_dialog_state
+            lead = LeadDataExtractor.extract_from_message(message, lead)
+
+            low = fallback.low_confidence_fields(message, state, lead)
+            slow_slots.update(slot for slot, fields in SLOTS.items() if set(fields) & low)
+            submit_started = time.perf_counter()
+            cached = fallback.submit(session_id, message, state, lead)
+            submit_seconds += time.perf_counter() - submit_started
+            if cached:
+                lead = merge_fields(lead, cached)
+
+            lead = lead.replace(current_dialog_state=DialogStateExtractor.determine_state(message, state, lead))
+            leads[session_id] = lead
+            messages += 1
+            # Ходы разных клиентов чередуются с фоновыми вызовами
+            await asyncio.sleep(0)
+    turns_seconds = time.perf_counter() - started
+    await fallback.drain()
+    total_seconds = time.perf_counter() - started
+    return fallback.get_stats(), slow_slots, messages, submit_seconds, turns_seconds, total_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.3, help="имитируемая задержка LLM, с")
+    parser.add_argument('--concurrency', type=int, default=4, help="параллельных вызовов LLM")
+    args = parser.parse_args()
+
+    stats, slow_slots, messages, submit_seconds, turns_seconds, total_seconds = asyncio.run(
+        run(load_corpus(), args.latency, args.concurrency))
+
+    print(f"Сообщений: {messages}, медленный путь: {stats['slow_path']} ({stats['slow_path_rate']:.1%})")
+    print(f"   по слотам: {dict(slow_slots.most_common())}")
+    print(f"Попаданий в кэш: {stats['cache_hits']} + ожидали идущий вызов {stats['inflight_joined']} "
+          f"({stats['cache_hit_rate']:.1%} медленного пути)")
+    print(f"Вызовов LLM: {stats['llm_calls']} вместо {messages} при вызове на каждое сообщение "
+          f"({stats['llm_calls'] / messages:.1%})")
+    print(f"Оценка уверенности на критическом пути: {submit_seconds / messages * 1e6:.1f} мкс на сообщение")
+    print(f"Ходы: {turns_seconds:.2f} с; фоновые вызовы завершены через {total_seconds:.2f} с "
+          f"(LLM на каждом ходе добавил бы {args.latency * messages:.0f} с ожидания)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Бенчмарк учета заданных вопросов
+
+Сравнивает прежний учет (нормализация строки при каждой проверке,
+множество нормализованных строк в сессии, список полных текстов в
+LeadData) с реестром вопросов: кэшированная нормализация, битовая маска
+id в сессии и маска в метаданных LeadData. Измеряются стоимость
+проверки "вопрос уже задавался?" и размер метаданных, отправляемых в
+хранилище при каждом сохранении.
+
+Запуск:
+    python benchmarks/bench_question_registry.py [--checks 200000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.models import LeadData  # noqa: E402
+from bot.memory.question_registry import QUESTION_CATALOG, question_registry  # noqa: E402
+
+
+def legacy_normalize(question: str) -> str:
+    """Прежний SessionManager._normalize_question"""
+    normalized = question.lower().strip()
+    stop_words = {'для', 'или', 'как', 'вы', 'сейчас', 'в', 'на', 'по'}
+    words = normalized.split()
+    filtered_words = [word for word in words if word not in stop_words]
+    return ' '.join(filtered_words)
+
+
+def time_per_call(func, questions, checks: int) -> float:
+    started = time.perf_counter()
+    for i in range(checks):
+        func(questions[i % len(questions)])
+    return (time.perf_counter() - started) / checks * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checks', type=int, default=200000)
+    args = parser.parse_args()
+
+    questions = list(QUESTION_CATALOG)
+    asked = questions[::2]
+
+    legacy_history = {legacy_normalize(question) for question in asked}
+    mask = 0
+    for question in asked:
+        mask = question_registry.add(mask, question)
+
+    legacy_ns = time_per_call(lambda q: legacy_normalize(q) in legacy_history, questions, args.checks)
+    registry_ns = time_per_call(lambda q: question_registry.contains(mask, q), questions, args.checks)
+    print(f"Проверка вопроса: было {legacy_ns:.0f} нс, стало {registry_ns:.0f} нс "
+          f"(x{legacy_ns / registry_ns:.1f})")
+
+    print(f"\n{'вопросов':>9} {'было, байт':>11} {'стало, байт':>12}")
+    for count in (0, 4, 8, len(questions)):
+        lead = LeadData().with_questions_asked(questions[:count])
+        payload = lead.to_dict()
+        new_size = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+        legacy_payload = dict(payload)
+        del legacy_payload['asked_questions_mask'], legacy_payload['asked_questions_extra']
+        del legacy_payload['schema_version']
+        legacy_payload['asked_questions'] = lead.asked_questions
+        legacy_size = len(json.dumps(legacy_payload, ensure_ascii=False).encode('utf-8'))
+        print(f"{count:>9} {legacy_size:>11} {new_size:>12}")
+
+        # Маска восстанавливается в тот же набор вопросов, в том числе из старого формата
+        assert LeadData.from_dict(payload).asked_questions == lead.asked_questions
+        assert LeadData.from_dict(legacy_payload).asked_questions == lead.asked_questions
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Бенчмарк восстановления сессий из журнала при запуске
+
+Заполняет журнал N пользователями (привязка, создание сессии, данные
+лида), делает снимок, дописывает хвост журнала и измеряет время
+воспроизведения и восстановления кэша SessionManager - то, что
+выполняется в startup-хуке webhook - в двух сценариях: после падения
+процесса (снимок + хвост) и после штатной остановки (только снимок). Активность пользователей
+распределена по суткам: за последний час активна доля --recent-share,
+и только для них данные лида попадают в снимок (--recent-share 1 -
+худший случай, когда все пользователи активны одновременно). Отдельно
+измеряется пауза записи, на которой журнал уходит в фоновый снимок.
+
+Запуск:
+    python benchmarks/bench_session_journal.py [--users 100000] [--tail 20000] [--recent-share 0.2]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.models import LeadData, DialogState  # noqa: E402
+from bot.memory.session_journal import SessionJournal  # noqa: E402
+from bot.memory.session_manager import SessionManager  # noqa: E402
+
+LOCATIONS = ['Адлер', 'Сириус', 'Хоста', 'Мацеста', 'Дагомыс', 'Красная Поляна']
+
+
+def random_lead(rng: random.Random) -> LeadData:
+    return LeadData(
+        name=rng.choice(['Иван', 'Мария', 'Олег', 'Анна', None]),
+        city=rng.choice(['Москва', 'Казань', 'Екатеринбург', None]),
+        budget_max=rng.choice([None, rng.randint(5, 60) * 1000000]),
+        preferred_locations=tuple(rng.sample(LOCATIONS, rng.randint(0, 2))),
+        property_type=rng.choice(['квартира', 'дом', 'апартаменты', None]),
+        current_dialog_state=rng.choice(list(DialogState)),
+    )
+
+
+def fill(journal: SessionJournal, manager: SessionManager, users: int, rng: random.Random) -> list:
+    sessions = []
+    for i in range(users):
+        user_key = str(100000000 + i)
+        session_id = manager.generate_session_id(user_key, user_key)
+        journal.record_mapping(user_key, session_id)
+        manager.set_session_data(session_id, random_lead(rng))
+        sessions.append(session_id)
+    return sessions
+
+
+def restart(path: str, title: str, users: int) -> SessionManager:
+    """Рестарт: новый журнал и пустой SessionManager, как в startup-хуке webhook"""
+    started = time.perf_counter()
+    mappings, states = SessionJournal(path).replay()
+    replay_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    manager = SessionManager()
+    restored = manager.restore_sessions(states)
+    restore_time = time.perf_counter() - started
+
+    print(f"Рестарт {title}: воспроизведение {replay_time * 1000:.0f} мс, "
+          f"восстановление кэша {restore_time * 1000:.0f} мс, итого {(replay_time + restore_time) * 1000:.0f} мс")
+    assert len(mappings) == users and restored == users
+    return manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--tail', type=int, default=20000)
+    parser.add_argument('--recent-share', type=float, default=0.2)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as path:
+        journal = SessionJournal(path, snapshot_every=10 ** 9)
+        manager = SessionManager()
+        manager.attach_journal(journal)
+
+        started = time.perf_counter()
+        sessions = fill(journal, manager, args.users, rng)
+        print(f"Запись: {args.users} пользователей за {time.perf_counter() - started:.2f}с")
+
+        # Сдвигаем активность неактивной доли пользователей на 2-20 часов назад
+        for session_id in sessions[int(args.users * args.recent_share):]:
+            shift = rng.randint(2, 20) * 3600
+            manager.get_session_info(session_id).last_activity -= shift
+            journal._sessions[session_id][3] -= shift
+
+        started = time.perf_counter()
+        journal.snapshot()
+        snapshot_size = os.path.getsize(os.path.join(path, 'snapshot.json'))
+        print(f"Снимок: {time.perf_counter() - started:.2f}с, {snapshot_size / 1024 / 1024:.1f} МБ")
+
+        # Хвост после снимка: обновления данных лидов недавно активных пользователей
+        recent = sessions[:max(1, int(args.users * args.recent_share))]
+        for _ in range(args.tail):
+            manager.set_session_data(rng.choice(recent), random_lead(rng))
+        journal_size = os.path.getsize(os.path.join(path, 'journal.jsonl'))
+        print(f"Хвост журнала: {args.tail} записей, {journal_size / 1024 / 1024:.1f} МБ")
+
+        # Падение процесса: снимок + хвост журнала
+        journal._file.close()
+        journal._file = None
+        fresh_manager = restart(path, "после падения (снимок + хвост)", args.users)
+
+        # Штатный редеплой: при остановке пишется снимок, хвоста нет
+        restarted = SessionJournal(path)
+        restarted.replay()
+        restarted.close()
+        restart(path, "после штатной остановки (только снимок)", args.users)
+        sample = rng.choice(recent)
+        assert fresh_manager.get_session_lead(sample) == manager.get_session_lead(sample)
+
+        # Фоновый снимок: запись, которой накопилось snapshot_every записей, снимка не ждет
+        journal = SessionJournal(path, snapshot_every=1)
+        journal.replay()
+        lead = random_lead(rng)
+        started = time.perf_counter()
+        journal.record_data(sample, lead.to_bytes())
+        pause = time.perf_counter() - started
+        journal.wait_snapshot()
+        print(f"Фоновый снимок: пауза записи {pause * 1000:.1f} мс, "
+              f"снимок готов через {(time.perf_counter() - started) * 1000:.0f} мс")
+        journal.close()
+        background_manager = restart(path, "после фонового снимка", args.users)
+        assert background_manager.get_session_lead(sample) == lead
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
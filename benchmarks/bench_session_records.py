@@ -0,0 +1,104 @@
+"""
+Бенчмарк памяти и скорости доступа к записям сессий
+
+Сравнивает прежнюю раскладку SessionManager (словарь со множеством и
+вложенным словарем на каждую сессию) с SessionRecord на __slots__.
+Для каждой раскладки создается N сессий (user_id повторяются, как у
+реальных пользователей с несколькими сессиями), замеряется прирост
+памяти через tracemalloc и время случайных обращений вида
+"найти сессию и обновить last_activity".
+
+Запуск:
+    python benchmarks/bench_session_records.py [--sessions 100000 1000000] [--lookups 1000000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.session_manager import SessionRecord  # noqa: E402
+
+
+def legacy_session(user_id: str, chat_id: str, timestamp: int) -> dict:
+    """Запись сессии в прежнем формате SessionManager"""
+    return {
+        'user_id': user_id,
+        'chat_id': chat_id,
+        'created_at': timestamp,
+        'last_activity': timestamp,
+        'question_history': set(),
+        'data_collected': {}
+    }
+
+
+def build(count: int, factory, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    base = int(time.time())
+    sessions = {}
+    for i in range(count):
+        # ~3 сессии на пользователя; id приходят из Telegram как новые строки
+        user_id = str(100000000 + i // 3)
+        session_id = f"{user_id}_{base + i}_{rng.getrandbits(32):08x}"
+        sessions[session_id] = factory(str(user_id), str(user_id), base + rng.randint(0, 86400))
+    return sessions
+
+
+def measure(count: int, lookups: int, factory, touch) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    sessions = build(count, factory)
+    # Ключи словаря и сами строки session_id одинаковы для обеих раскладок,
+    # поэтому в сравнении участвует полный прирост памяти
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    keys = list(sessions)
+    rng = random.Random(7)
+    probe = [keys[rng.randrange(count)] for _ in range(lookups)]
+    now = int(time.time())
+    started = time.perf_counter()
+    for session_id in probe:
+        touch(sessions[session_id], now)
+    elapsed = time.perf_counter() - started
+
+    del sessions, keys, probe
+    gc.collect()
+    return current / count, elapsed / lookups * 1e9
+
+
+def touch_legacy(session: dict, now: int):
+    if now - session['last_activity'] >= 0:
+        session['last_activity'] = now
+
+
+def touch_record(session: SessionRecord, now: int):
+    if now - session.last_activity >= 0:
+        session.last_activity = now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"{'сессий':>10} {'раскладка':>14} {'байт/сессию':>12} {'доступ, нс':>11}")
+    for count in args.sessions:
+        results = {
+            'dict': measure(count, args.lookups, legacy_session, touch_legacy),
+            'SessionRecord': measure(count, args.lookups, SessionRecord, touch_record),
+        }
+        for layout, (bytes_per_session, ns_per_lookup) in results.items():
+            print(f"{count:>10} {layout:>14} {bytes_per_session:>12.0f} {ns_per_lookup:>11.0f}")
+        saved = 1 - results['SessionRecord'][0] / results['dict'][0]
+        print(f"{'':>10} {'экономия':>14} {saved:>12.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Бенчмарк локального индекса похожих кейсов
+
+Наполняет индекс синтетическими репликами клиентов (с периодическими
+компактизациями), измеряет скорость вставки, время финальной
+компактизации в memory-mapped файл и задержку поиска top-k (p50/p99)
+до и после перезапуска индекса с диска.
+
+Отдельно - вставка внутри event loop, как в MemoryService: компактизация
+идет в фоне, а поиск - в потоке; измеряется самая долгая остановка
+event loop (задержка тикера с периодом 1 мс).
+
+Запуск:
+    python benchmarks/bench_similarity_index.py [--documents 100000] [--queries 500]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.similarity_index import SimilarityIndex, numpy_available  # noqa: E402
+
+PROPERTY_TYPES = ['квартира', 'апартаменты', 'дом', 'таунхаус', 'участок', 'студия']
+LOCATIONS = ['Адлер', 'Сириус', 'Хоста', 'Мацеста', 'Дагомыс', 'Лоо', 'Красная Поляна', 'центр Сочи']
+GOALS = ['для себя', 'под сдачу в аренду', 'как инвестицию', 'для переезда на ПМЖ', 'для родителей']
+DETAILS = ['с видом на море', 'рядом с парком', 'в новостройке', 'с ремонтом', 'у моря', 'в тихом районе']
+PAYMENTS = ['ипотека', 'наличные', 'рассрочка', 'продаю квартиру в Москве']
+
+
+def random_message(rng: random.Random) -> str:
+    return (f"Ищу {rng.choice(PROPERTY_TYPES)} {rng.choice(DETAILS)} в районе {rng.choice(LOCATIONS)}, "
+            f"{rng.choice(GOALS)}, бюджет {rng.randint(5, 60)} млн, {rng.choice(PAYMENTS)}")
+
+
+def measure_search(index: SimilarityIndex, queries, limit: int):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, limit=limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+async def measure_loop_stalls(path: str, documents: int, queries, limit: int, rng: random.Random):
+    index = SimilarityIndex(path)
+    lags = []
+    running = True
+
+    async def ticker():
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append((time.perf_counter() - started - 0.001) * 1000)
+
+    ticker_task = asyncio.create_task(ticker())
+    searches = []
+    for i in range(documents):
+        index.add(random_message(rng), f"user{i % 5000}_session{i // 5000}")
+        if i % 200 == 0:
+            searches.append(asyncio.create_task(asyncio.to_thread(index.search, queries[i % len(queries)], limit)))
+        # Каждая вставка - отдельный ход клиента
+        await asyncio.sleep(0)
+    await asyncio.gather(*searches)
+    await index.drain()
+    running = False
+    await ticker_task
+    index.close()
+    lags.sort()
+    return lags[int(len(lags) * 0.99) - 1], lags[-1], len(searches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=5)
+    args = parser.parse_args()
+
+    if not numpy_available():
+        print("numpy не установлен: pip install numpy")
+        return 1
+
+    rng = random.Random(42)
+    queries = [random_message(rng) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as path:
+        index = SimilarityIndex(path)
+
+        started = time.perf_counter()
+        for i in range(args.documents):
+            index.add(random_message(rng), f"user{i % 5000}_session{i // 5000}")
+        insert_time = time.perf_counter() - started
+        print(f"Вставка: {args.documents} документов за {insert_time:.2f}с "
+              f"({args.documents / insert_time:.0f} док/с)")
+
+        p50, p99 = measure_search(index, queries, args.limit)
+        print(f"Поиск (с некомпактизированным хвостом): p50 {p50:.2f} мс, p99 {p99:.2f} мс")
+
+        started = time.perf_counter()
+        index.compact()
+        print(f"Компактизация в memory map: {time.perf_counter() - started:.2f}с")
+        index.close()
+
+        started = time.perf_counter()
+        reopened = SimilarityIndex(path)
+        print(f"Открытие с диска: {(time.perf_counter() - started) * 1000:.0f} мс, {len(reopened)} документов")
+
+        p50, p99 = measure_search(reopened, queries, args.limit)
+        print(f"Поиск после перезапуска: p50 {p50:.2f} мс, p99 {p99:.2f} мс")
+
+        print("\nПример выдачи:")
+        for result in reopened.search(queries[0], limit=3):
+            print(f"  {result['score']:.3f}  {result['content']}")
+        reopened.close()
+
+    with tempfile.TemporaryDirectory() as path:
+        p99, worst, searches = asyncio.run(measure_loop_stalls(path, args.documents, queries, args.limit, rng))
+        print(f"\nВставка в event loop с фоновой компактизацией и {searches} поисками в потоке: "
+              f"задержка loop p99 {p99:.2f} мс, максимум {worst:.1f} мс")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
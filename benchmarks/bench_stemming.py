@@ -0,0 +1,165 @@
+"""
+Бенчмарк поиска словарей экстрактора по основам слов
+
+Полнота: размеченные фразы с разными падежными формами типов
+недвижимости, способов оплаты и локаций прогоняются через
+LeadDataExtractor и через прежний вариант - словари с перечисленными
+формами без поиска по основам. Полнота - доля фраз, из которых извлечено
+ожидаемое значение.
+
+Стоимость: время сканирования сообщений эталонного корпуса автоматом
+с основами и без них, а также время всего извлечения; кэш основ
+(lru_cache) прогрет, как в работающем процессе.
+
+Запуск:
+    python benchmarks/bench_stemming.py [--rounds 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extractors import load_corpus  # noqa: E402
+from bot.memory.extraction_plan import ExtractionPlanner  # noqa: E402
+from bot.memory.extractors import LeadDataExtractor  # noqa: E402
+from bot.memory.keyword_automaton import KeywordAutomaton  # noqa: E402
+from bot.memory.models import LeadData, PaymentType  # noqa: E402
+from bot.memory.russian_stemmer import stem  # noqa: E402
+
+
+class LegacyExtractor(LeadDataExtractor):
+    """Словари до поиска по основам: формы перечислены вручную"""
+    PAYMENT_TYPES = {
+        'наличные': PaymentType.CASH, 'наличными': PaymentType.CASH,
+        'карта': PaymentType.CARDS, 'карты': PaymentType.CARDS, 'картой': PaymentType.CARDS,
+        'безнал': PaymentType.BANK_TRANSFER, 'безналичный': PaymentType.BANK_TRANSFER,
+        'банк': PaymentType.BANK_TRANSFER, 'перевод': PaymentType.BANK_TRANSFER,
+        'ипотека': PaymentType.BANK_TRANSFER, 'ипотеку': PaymentType.BANK_TRANSFER,
+        'ипотечный': PaymentType.BANK_TRANSFER, 'рассрочка': PaymentType.BANK_TRANSFER,
+        'рассрочку': PaymentType.BANK_TRANSFER, 'кредит': PaymentType.BANK_TRANSFER,
+        'крипта': PaymentType.CRYPTO, 'криптовалюта': PaymentType.CRYPTO, 'биткоин': PaymentType.CRYPTO,
+    }
+    PROPERTY_TYPES = {
+        'дом': 'дом', 'дома': 'дом', 'дому': 'дом', 'коттедж': 'дом', 'таунхаус': 'дом', 'особняк': 'дом',
+        'квартира': 'квартира', 'квартиру': 'квартира', 'квартиры': 'квартира',
+        'студия': 'квартира', 'студию': 'квартира', 'студии': 'квартира',
+        'однокомнатную': 'квартира', 'двухкомнатную': 'квартира', 'трехкомнатную': 'квартира',
+        'апартаменты': 'апартаменты', 'апарт': 'апартаменты',
+        'участок': 'участок', 'участка': 'участок', 'земля': 'участок', 'земельный': 'участок',
+        'под застройку': 'участок',
+    }
+    KEYWORDS = KeywordAutomaton({
+        **LeadDataExtractor.KEYWORD_GROUPS,
+        'payment_types': list(PAYMENT_TYPES),
+        'property_types': list(PROPERTY_TYPES),
+        'krasnaya_polyana': ['красная поляна', 'красную поляну', 'красной поляне', 'красной поляны'],
+    })
+    PLANNER = ExtractionPlanner(KEYWORDS, LeadDataExtractor.EXTRACTION_STEPS)
+
+
+# (фраза, поле, ожидаемое значение; для локаций - одна из preferred_locations)
+LABELED = [
+    *[(f"ищу {form} в Сочи", 'property_type', 'квартира') for form in
+      ('квартиру', 'квартира', 'квартиры')],
+    *[(f"думаем о {form}", 'property_type', 'квартира') for form in ('квартире', 'студии')],
+    ("интересуют варианты с квартирами у моря", 'property_type', 'квартира'),
+    ("что есть по квартирам?", 'property_type', 'квартира'),
+    ("готовы жить в студии", 'property_type', 'квартира'),
+    ("хотим поселиться в доме с садом", 'property_type', 'дом'),
+    ("присматриваемся к домам", 'property_type', 'дом'),
+    ("ищем коттедж", 'property_type', 'дом'),
+    ("нужен участок под дом", 'property_type', 'дом'),
+    ("думаем об участке", 'property_type', 'участок'),
+    ("интересуют участки", 'property_type', 'участок'),
+    ("а что с землей?", 'property_type', 'участок'),
+    ("смотрим апартаменты", 'property_type', 'апартаменты'),
+    *[(f"платить будем {form}", 'payment_type', 'cash') for form in ('наличными', 'наличкой')],
+    ("есть сумма наличных", 'payment_type', 'cash'),
+    ("оплата наличные", 'payment_type', 'cash'),
+    *[(f"оплатим {form}", 'payment_type', 'cards') for form in ('картой', 'картами')],
+    ("по карте можно?", 'payment_type', 'cards'),
+    *[(f"хотим {form}", 'payment_type', 'bank_transfer') for form in
+      ('ипотеку', 'рассрочку', 'кредит')],
+    *[(f"рассматриваем вариант с {form}", 'payment_type', 'bank_transfer') for form in
+      ('ипотекой', 'рассрочкой')],
+    *[(f"вопрос по {form}", 'payment_type', 'bank_transfer') for form in ('ипотеке', 'рассрочке')],
+    ("условия ипотеки какие?", 'payment_type', 'bank_transfer'),
+    ("оплатим криптовалютой", 'payment_type', 'crypto'),
+    *[(f"квартира в {form}", 'preferred_locations', 'Красная Поляна') for form in
+      ('Красной Поляне', 'красной поляне')],
+    ("под Красной Поляной", 'preferred_locations', 'Красная Поляна'),
+    ("едем на Красную Поляну", 'preferred_locations', 'Красная Поляна'),
+    ("около Красной поляны", 'preferred_locations', 'Красная Поляна'),
+    ("хочу в Хосте", 'preferred_locations', 'Хоста'),
+    ("ближе к Хосте", 'preferred_locations', 'Хоста'),
+    ("в Мацесте", 'preferred_locations', 'Мацеста'),
+    ("в Лазаревском", 'preferred_locations', 'Лазаревское'),
+    ("в Головинке", 'preferred_locations', 'Головинка'),
+    ("в Дагомысе", 'preferred_locations', 'Дагомыс'),
+    ("в Адлере", 'preferred_locations', 'Адлер'),
+    ("в центре", 'preferred_locations', 'Центр'),
+    ("в Сириусе", 'preferred_locations', 'Сириус'),
+]
+
+
+def extracted_value(extractor, phrase: str, field_name: str):
+    lead = extractor.extract_from_message(phrase, LeadData())
+    value = getattr(lead, field_name)
+    return getattr(value, 'value', value)
+
+
+def recall(extractor):
+    hits = 0
+    missed = []
+    for phrase, field_name, expected in LABELED:
+        value = extracted_value(extractor, phrase, field_name)
+        if value == expected or (isinstance(value, tuple) and expected in value):
+            hits += 1
+        else:
+            missed.append(phrase)
+    return hits / len(LABELED), missed
+
+
+def best_time(function, messages, rounds: int) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message in messages:
+            function(message)
+        best = min(best, time.perf_counter() - started)
+    return best / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_recall, legacy_missed = recall(LegacyExtractor)
+    stem_recall, stem_missed = recall(LeadDataExtractor)
+    print(f"Полнота на {len(LABELED)} размеченных фразах: перечисленные формы {legacy_recall:.0%}, "
+          f"основы {stem_recall:.0%}")
+    if stem_missed:
+        print(f"   Не найдено по основам: {stem_missed}")
+
+    messages = [message for record in load_corpus() for message in record['dialog']]
+    lowered = [message.lower() for message in messages]
+    plain = KeywordAutomaton(LeadDataExtractor.KEYWORD_GROUPS)
+    for message in lowered:
+        LeadDataExtractor.KEYWORDS.scan(message)  # прогрев кэша основ
+
+    plain_scan = best_time(plain.scan, lowered, args.rounds)
+    stem_scan = best_time(LeadDataExtractor.KEYWORDS.scan, lowered, args.rounds)
+    legacy_extract = best_time(LegacyExtractor.extract_from_message, messages, args.rounds)
+    stem_extract = best_time(LeadDataExtractor.extract_from_message, messages, args.rounds)
+    cache = stem.cache_info()
+    print(f"Сканирование сообщения: без основ {plain_scan:.1f} мкс, с основами {stem_scan:.1f} мкс")
+    print(f"Извлечение сообщения: перечисленные формы {legacy_extract:.1f} мкс, основы {stem_extract:.1f} мкс")
+    print(f"Кэш основ: {cache.currsize} слов, попаданий {cache.hits / max(1, cache.hits + cache.misses):.1%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
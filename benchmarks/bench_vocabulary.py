@@ -0,0 +1,93 @@
+"""
+Бенчмарк загрузки словарей экстракторов: построение автомата против кэша
+
+Холодный старт: чтение data/extractor_vocabulary.json и построение
+KeywordAutomaton (use_cache=False) с пустым кэшем основ слов. Теплый
+старт: те же словари, автомат из скомпилированного кэша (.marshal во
+временном каталоге).
+
+Эквивалентность: автомат из кэша и построенный заново находят одни и те
+же ключевые слова и группы во всех сообщениях эталонного корпуса, а
+повторное подключение словарей (reload_vocabulary) не меняет результат
+извлечения.
+
+Запуск:
+    python benchmarks/bench_vocabulary.py [--rounds 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extractors import extract_dialog, load_corpus  # noqa: E402
+from bot.memory.extractors import LeadDataExtractor  # noqa: E402
+from bot.memory.russian_stemmer import stem  # noqa: E402
+from bot.memory.vocabulary import load_vocabulary  # noqa: E402
+
+
+def best_time(function, rounds: int, setup=None) -> float:
+    best = float('inf')
+    for _ in range(rounds):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def extract_all(corpus):
+    return [extract_dialog(record['dialog']) for record in corpus]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    messages = [message.lower() for record in corpus for message in record['dialog']]
+    markers = LeadDataExtractor.MARKERS
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        built = load_vocabulary(cache_dir=cache_dir, extra_groups=markers)
+        cached = load_vocabulary(cache_dir=cache_dir, extra_groups=markers)
+        if built.from_cache or not cached.from_cache:
+            print("❌ Кэш не записан или не прочитан")
+            return 1
+
+        mismatches = 0
+        for message in messages:
+            fresh, restored = built.automaton.scan(message), cached.automaton.scan(message)
+            if fresh.found != restored.found or fresh.groups != restored.groups:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"❌ {message!r}: {sorted(fresh.found)} != {sorted(restored.found)}")
+        if mismatches:
+            print(f"❌ Расхождений автомата из кэша: {mismatches}")
+            return 1
+        print(f"✅ Автомат из кэша совпадает с построенным: {len(messages)} сообщений, "
+              f"{len(built.keyword_groups)} групп, {built.automaton.states} состояний")
+
+        # Кэш основ очищается, как в только что запущенном процессе
+        cold = best_time(lambda: load_vocabulary(extra_groups=markers, use_cache=False), args.rounds,
+                         setup=stem.cache_clear)
+        warm = best_time(lambda: load_vocabulary(cache_dir=cache_dir, extra_groups=markers), args.rounds,
+                         setup=stem.cache_clear)
+    print(f"Построение автомата: {cold * 1000:.2f} мс")
+    print(f"Загрузка из кэша:    {warm * 1000:.2f} мс ({cold / warm:.1f}x)")
+
+    before = extract_all(corpus)
+    LeadDataExtractor.reload_vocabulary()
+    if extract_all(corpus) != before:
+        print("❌ После перезагрузки словарей извлечение изменилось")
+        return 1
+    print("✅ Перезагрузка словарей не меняет извлечение")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
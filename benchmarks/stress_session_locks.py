@@ -0,0 +1,107 @@
+"""
+Стресс-тест сериализации process_message по сессиям
+
+Много сессий обрабатываются параллельно, а внутри каждой сессии
+одновременно приходят сообщения с разными локациями. Чтение и запись
+LeadData искусственно замедлены, чтобы спровоцировать гонку. После
+прогона каждая сессия должна содержать все локации - иначе часть
+обновлений потеряна.
+
+Запуск:
+    python benchmarks/stress_session_locks.py [--sessions 200] [--no-lock]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.memory.memory_service import MemoryService  # noqa: E402
+from bot.memory.session_manager import session_manager  # noqa: E402
+
+LOCATION_MESSAGES = {
+    'Адлер': 'Смотрю варианты в Адлере',
+    'Сириус': 'Интересует сириус',
+    'Хоста': 'Может быть хоста',
+    'Мацеста': 'Рассматриваю мацеста',
+    'Дагомыс': 'Дагомыс тоже подойдет',
+    'Лоо': 'А что есть в лоо?',
+    'Красная Поляна': 'Хочу в Красную Поляну',
+    'Центр': 'Лучше центр города',
+}
+
+
+class SlowMemoryService(MemoryService):
+    """MemoryService с имитацией сетевых задержек хранилища"""
+
+    async def get_lead_data(self, session_id):
+        await asyncio.sleep(random.uniform(0, 0.002))
+        return await super().get_lead_data(session_id)
+
+    async def save_lead_data(self, session_id, lead_data):
+        await asyncio.sleep(random.uniform(0, 0.002))
+        await super().save_lead_data(session_id, lead_data)
+
+
+class _NoLock:
+    """Заглушка реестра для демонстрации гонки без блокировок"""
+
+    @asynccontextmanager
+    async def acquire(self, session_id):
+        yield
+
+
+async def run(sessions: int, use_lock: bool) -> int:
+    service = SlowMemoryService('', enable_memory=False)
+    if not use_lock:
+        service._session_locks = _NoLock()
+
+    session_ids = [
+        session_manager.get_or_create_session(f"stress{i}", existing_session_id=f"stress{i}_session")
+        for i in range(sessions)
+    ]
+
+    tasks = [
+        service.process_message(user_id=sid, message_text=text, existing_session_id=sid)
+        for sid in session_ids
+        for text in LOCATION_MESSAGES.values()
+    ]
+    random.shuffle(tasks)
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    expected = set(LOCATION_MESSAGES)
+    lost = 0
+    for sid in session_ids:
+        lead = await service.get_lead_data(sid)
+        lost += len(expected - set(lead.preferred_locations))
+
+    print(f"Сессий: {sessions}, сообщений: {len(tasks)}, время: {elapsed:.2f}с, "
+          f"блокировки: {'да' if use_lock else 'нет'}")
+    print(f"Потерянных обновлений: {lost}")
+    print(f"Блокировок в реестре после прогона: {len(getattr(service._session_locks, '_locks', ()))}")
+    return lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--no-lock', action='store_true', help='отключить блокировки и показать гонку')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    lost = asyncio.run(run(args.sessions, use_lock=not args.no_lock))
+
+    if not args.no_lock and lost:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
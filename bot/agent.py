@@ -12,9 +12,12 @@ from zep_cloud.types import Message
 from .config import (
     INSTRUCTION_FILE, OPENAI_API_KEY, OPENAI_MODEL, ZEP_API_KEY, ANTHROPIC_API_KEY, ANTHROPIC_MODEL,
     OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, OPENAI_PRESENCE_PENALTY, OPENAI_FREQUENCY_PENALTY, OPENAI_TOP_P,
-    ANTHROPIC_TEMPERATURE, ANTHROPIC_MAX_TOKENS, GOOGLE_SHEETS_ENABLED, GOOGLE_SHEETS_SYNC_INTERVAL
+    ANTHROPIC_TEMPERATURE, ANTHROPIC_MAX_TOKENS, GOOGLE_SHEETS_ENABLED, GOOGLE_SHEETS_SYNC_INTERVAL,
+    MEMORY_BACKEND, MEMORY_SQLITE_PATH, MEMORY_OUTBOX_PATH, SIMILARITY_INDEX_DIR,
+    LLM_EXTRACTION_ENABLED, LLM_EXTRACTION_MODEL
 )
 from .memory import MemoryService, DialogState, ClientType
+from .memory.llm_fallback import openai_field_extractor
 from .dialog_logger import dialog_logger
 
 # Настройка логирования
@@ -51,9 +54,25 @@ class AlenaAgent:
         
         # Инициализируем интеллектуальную систему памяти
         enable_memory = bool(ZEP_API_KEY and ZEP_API_KEY != "test_key")
-        self.memory_service = MemoryService(ZEP_API_KEY or "", enable_memory=enable_memory)
+        memory_backend = None
+        if MEMORY_BACKEND == 'sqlite':
+            from .memory.backends import SQLiteMemoryBackend
+            memory_backend = SQLiteMemoryBackend(MEMORY_SQLITE_PATH)
+            enable_memory = True
+        # LLM дополняет извлечение данных лида там, где регулярные выражения не уверены
+        llm_extractor = None
+        if LLM_EXTRACTION_ENABLED and self.openai_client:
+            llm_extractor = openai_field_extractor(self.openai_client, LLM_EXTRACTION_MODEL)
+
+        self.memory_service = MemoryService(
+            ZEP_API_KEY or "", enable_memory=enable_memory, backend=memory_backend,
+            outbox_path=MEMORY_OUTBOX_PATH, similarity_index_path=SIMILARITY_INDEX_DIR,
+            llm_extractor=llm_extractor
+        )
         
-        if enable_memory:
+        if memory_backend is not None:
+            print(f"✅ Интеллектуальная система памяти активирована (SQLite: {MEMORY_SQLITE_PATH})")
+        elif enable_memory:
             print(f"✅ Интеллектуальная система памяти активирована")
             print(f"🧠 ZEP API Key: {ZEP_API_KEY[:8]}...{ZEP_API_KEY[-4:]}")
         else:
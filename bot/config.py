@@ -16,6 +16,16 @@ GOOGLE_SHEETS_SYNC_INTERVAL = int(os.getenv('GOOGLE_SHEETS_SYNC_INTERVAL', '3600
 # Абсолютный путь к файлу инструкций
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 INSTRUCTION_FILE = os.path.join(BASE_DIR, 'data', 'instruction.json')
+
+# Хранилище памяти: zep (ZEP Cloud) или sqlite (локальный файл)
+MEMORY_BACKEND = os.getenv('MEMORY_BACKEND', 'zep').lower()
+MEMORY_SQLITE_PATH = os.getenv('MEMORY_SQLITE_PATH', os.path.join(BASE_DIR, 'data', 'memory.db'))
+# Журнал неотправленных записей на время недоступности хранилища
+MEMORY_OUTBOX_PATH = os.getenv('MEMORY_OUTBOX_PATH', os.path.join(BASE_DIR, 'data', 'outbox', 'memory_outbox.jsonl'))
+# Журнал сессий для восстановления привязок пользователей после рестарта
+SESSION_JOURNAL_DIR = os.getenv('SESSION_JOURNAL_DIR', os.path.join(BASE_DIR, 'data', 'sessions'))
+# Локальный индекс похожих кейсов (нужен numpy)
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', os.path.join(BASE_DIR, 'data', 'similarity'))
 OPENAI_MODEL = 'gpt-4o'
 ANTHROPIC_MODEL = 'claude-3-5-sonnet-20241022'
 
@@ -31,6 +41,12 @@ OPENAI_TOP_P = float(os.getenv('OPENAI_TOP_P', '0.9'))  # Контроль кр
 ANTHROPIC_TEMPERATURE = float(os.getenv('ANTHROPIC_TEMPERATURE', '0.8'))
 ANTHROPIC_MAX_TOKENS = int(os.getenv('ANTHROPIC_MAX_TOKENS', '1000'))
 
+# Дополнение извлеченных данных лида через LLM, когда регулярные выражения
+# не уверены (в фоне, результаты кэшируются). Платные вызовы API и передача
+# сообщений клиентов в LLM - поэтому выключено, пока не включено явно
+LLM_EXTRACTION_ENABLED = os.getenv('LLM_EXTRACTION_ENABLED', 'false').lower() == 'true'
+LLM_EXTRACTION_MODEL = os.getenv('LLM_EXTRACTION_MODEL', 'gpt-4o-mini')
+
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
 # === AI AGENT SETTINGS ===
@@ -21,6 +21,8 @@ from .sheets_config import (
     TARGET_EMAIL
 )
 from ..memory.memory_service import MemoryService
+from ..memory.models import LeadData
+from ..memory import lead_scoring
 from ..memory.analytics import AnalyticsService
 
 logger = logging.getLogger(__name__)
@@ -232,9 +234,8 @@ class GoogleSheetsService:
             return False
         
         try:
-            # Получаем данные из ZEP Cloud через memory_service
-            # Пока используем заглушку - в реальности нужно получать из ZEP
-            leads_data = await self._get_leads_from_zep(days)
+            # Данные лидов из индекса memory_service
+            leads_data = await self._get_indexed_leads(days)
             
             if not leads_data:
                 logger.info("📭 Нет данных лидов для синхронизации")
@@ -420,56 +421,73 @@ class GoogleSheetsService:
         except Exception as e:
             logger.error(f"❌ Ошибка обновления диапазона {range_name}: {e}")
     
-    async def _get_leads_from_zep(self, days: int) -> List[Dict[str, Any]]:
-        """Получает данные лидов из ZEP Cloud через MemoryService"""
+    async def _get_indexed_leads(self, days: int) -> List[Dict[str, Any]]:
+        """
+        Данные лидов из индекса MemoryService, обновленных за последние days дней.
+
+        Индекс обновляется при каждом сохранении данных лида и не требует
+        перебора сессий в ZEP, но знает только лиды, сохраненные после
+        запуска процесса или восстановленные из журнала сессий: если период
+        выгрузки начинается раньше, более старые лиды в нее не попадут.
+        """
         try:
-            # Пока заглушка - нужно реализовать получение данных из ZEP
-            # В реальности здесь будет вызов memory_service для получения всех сессий
-            # и их данных за указанный период
-            
-            leads = []
-            # Пример структуры данных лида
-            sample_lead = {
-                'session_id': 'example_session',
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat(),
-                'name': '',
-                'phone': '',
-                'telegram_username': '',
-                'whatsapp': '',
-                'city': '',
-                'in_sochi_now': '',
-                'arrival_date': '',
-                'local_resident': '',
-                'purchase_goal': '',
-                'payment_type': '',
-                'bank': '',
-                'need_to_sell': '',
-                'budget_min': '',
-                'budget_max': '',
-                'locations': '',
-                'property_type': '',
-                'parameters': '',
-                'experience_in_sochi': '',
-                'urgency': '',
-                'remote_deal': '',
-                'online_showing_readiness': '',
-                'preferred_slots': '',
-                'communication_channel': '',
-                'qualification': '',
-                'next_action': '',
-                'assigned_manager': '',
-                'utm_source': '',
-                'comments': '',
-                'dialog_state': ''
-            }
-            
-            return leads
-            
+            lead_index = self.memory_service.lead_index
+            since = datetime.now() - timedelta(days=days)
+            total, leads = lead_index.query(updated_since=since, limit=0)
+            logger.info(f"📋 Для выгрузки найдено {total} лидов за {days} дней "
+                        f"(в индексе {len(lead_index)} лидов)")
+            if since < lead_index.complete_since:
+                logger.warning(f"⚠️ Индекс лидов полон только с {lead_index.complete_since:%d.%m.%Y %H:%M}: "
+                               f"лиды, не обновлявшиеся с тех пор, в выгрузку за {days} дней не попадут")
+            return [self._lead_to_sheet_dict(session_id, lead) for session_id, lead in leads]
+
         except Exception as e:
-            logger.error(f"❌ Ошибка получения лидов из ZEP: {e}")
+            logger.error(f"❌ Ошибка получения лидов из индекса: {e}")
             return []
-    
+
+    @staticmethod
+    def _lead_to_sheet_dict(session_id: str, lead: LeadData) -> Dict[str, Any]:
+        """Поля лида в формате строки листа клиентов"""
+        def yes_no(value: Optional[bool]) -> str:
+            return '' if value is None else ('Да' if value else 'Нет')
+
+        return {
+            'session_id': session_id,
+            'created_at': lead.created_at.isoformat() if lead.created_at else '',
+            'updated_at': lead.updated_at.isoformat() if lead.updated_at else '',
+            'name': lead.name,
+            'phone': lead.phone,
+            'telegram_username': lead.telegram_username,
+            'whatsapp': lead.whatsapp,
+            'city': lead.city,
+            'in_sochi_now': yes_no(lead.is_in_sochi),
+            'arrival_date': lead.urgency_date,
+            'local_resident': yes_no(lead.is_local),
+            'purchase_goal': lead.automation_goal.value if lead.automation_goal else '',
+            'payment_type': lead.payment_type.value if lead.payment_type else '',
+            'bank': lead.mortgage_bank,
+            'need_to_sell': yes_no(lead.needs_sell_own if lead.needs_sell_own is not None
+                                   else lead.need_to_sell_current),
+            'budget_min': lead.budget_min,
+            'budget_max': lead.budget_max,
+            'locations': ', '.join(lead.preferred_locations),
+            'property_type': lead.property_type,
+            'parameters': ', '.join(f"{key}: {value}" for key, value in lead.property_params.items()),
+            'experience_in_sochi': lead.sochi_experience,
+            'urgency': lead.urgency_level,
+            'remote_deal': yes_no(lead.need_remote_deal),
+            'online_showing_readiness': yes_no(lead.online_viewing_ready if lead.online_viewing_ready is not None
+                                               else lead.online_show_ready),
+            'preferred_slots': ', '.join(slot.strftime('%d.%m.%Y %H:%M') for slot in lead.agreed_demo_slots),
+            'communication_channel': lead.preferred_contact_method,
+            'qualification': lead.qualification_status.value if lead.qualification_status else '',
+            'next_action': 'Передать менеджеру' if lead_scoring.should_escalate(lead) else '',
+            'assigned_manager': '',
+            'utm_source': lead.utm_source,
+            'comments': lead.comments,
+            'dialog_state': lead.current_dialog_state.value if lead.current_dialog_state else ''
+        }
+
     def _convert_lead_to_row(self, lead_data: Dict[str, Any]) -> List[str]:
         """Конвертирует данные лида в строку для Google Sheets"""
         headers = SHEET_CONFIGURATIONS['clients']['headers']
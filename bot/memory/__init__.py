@@ -8,6 +8,7 @@ from .models import (
     AutomationGoal,
     PaymentType,
     LeadData,
+    LeadDraft,
     ReminderTask,
     AnalyticsData
 )
@@ -20,7 +21,13 @@ from .extractors import (
 from .memory_service import MemoryService
 from .analytics import AnalyticsService
 from .reminders import ReminderService
-from .session_manager import SessionManager, session_manager
+from .session_manager import SessionManager, SessionRecord, session_manager
+from .session_locks import SessionLockRegistry
+from .question_registry import QuestionRegistry, question_registry
+from .lead_codec import LeadDataCodec
+from .lead_index import LeadIndex
+from .outbox import DurableOutbox
+from .backends import MemoryBackend, ZepMemoryBackend, SQLiteMemoryBackend
 
 __all__ = [
     # Models
@@ -29,6 +36,7 @@ __all__ = [
     'AutomationGoal',
     'PaymentType',
     'LeadData',
+    'LeadDraft',
     'ReminderTask',
     'AnalyticsData',
 
@@ -37,7 +45,19 @@ __all__ = [
     'AnalyticsService',
     'ReminderService',
     'SessionManager',
+    'SessionRecord',
     'session_manager',
+    'SessionLockRegistry',
+    'QuestionRegistry',
+    'question_registry',
+    'LeadDataCodec',
+    'LeadIndex',
+    'DurableOutbox',
+
+    # Backends
+    'MemoryBackend',
+    'ZepMemoryBackend',
+    'SQLiteMemoryBackend',
 
     # Extractors
     'LeadDataExtractor',
@@ -0,0 +1,13 @@
+"""
+Хранилища для системы памяти: ZEP Cloud и локальный SQLite
+"""
+
+from .base import MemoryBackend
+from .zep_backend import ZepMemoryBackend
+from .sqlite_backend import SQLiteMemoryBackend
+
+__all__ = [
+    'MemoryBackend',
+    'ZepMemoryBackend',
+    'SQLiteMemoryBackend',
+]
@@ -0,0 +1,41 @@
+"""
+Базовый интерфейс хранилища памяти
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+
+class MemoryBackend(ABC):
+    """
+    Хранилище метаданных сессий и истории сообщений.
+
+    Сообщения передаются словарями с ключами role, role_type, content,
+    metadata и (необязательно) created_at. История возвращается в формате
+    MemoryService.get_dialog_history: role, content, timestamp, metadata,
+    speaker_name.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Возвращает метаданные сессии или None, если сессии нет"""
+
+    @abstractmethod
+    async def update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        """Сохраняет метаданные сессии, создавая ее при необходимости"""
+
+    @abstractmethod
+    async def add_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        """Добавляет сообщения в историю сессии одним вызовом"""
+
+    @abstractmethod
+    async def get_messages(self, session_id: str, last_n: int = 10) -> List[Dict[str, Any]]:
+        """Возвращает последние last_n сообщений сессии в хронологическом порядке"""
+
+    @abstractmethod
+    async def search_messages(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Ищет сообщения по всем сессиям: session_id, content, score, metadata"""
+
+    async def close(self):
+        """Освобождает ресурсы хранилища"""
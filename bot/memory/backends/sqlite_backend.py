@@ -0,0 +1,194 @@
+"""
+Локальное хранилище памяти на SQLite (WAL) для self-hosted развертываний и тестов
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .base import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    role_type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    content_lower TEXT NOT NULL,
+    metadata TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session_created ON messages (session_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at);
+"""
+
+
+class SQLiteMemoryBackend(MemoryBackend):
+    """
+    Хранилище памяти в локальном файле SQLite.
+
+    Используется одно соединение под блокировкой, поэтому запросы
+    выполняются по одному. Режим WAL с synchronous=NORMAL убирает fsync на
+    каждый коммит. Запросы выполняются в пуле потоков, чтобы не блокировать
+    event loop.
+    Путь ":memory:" дает быстрое хранилище без диска для тестов и бенчмарков.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = "data/memory.db"):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        logger.info(f"✅ SQLite хранилище памяти: {db_path}")
+
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_session_metadata, session_id)
+
+    async def update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        await asyncio.to_thread(self._update_session_metadata, session_id, metadata)
+
+    async def add_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._add_messages, session_id, messages)
+
+    async def get_messages(self, session_id: str, last_n: int = 10) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get_messages, session_id, last_n)
+
+    async def search_messages(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._search_messages, query, limit)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Синхронные реализации, выполняются в пуле потоков
+
+    def _get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row['metadata']) if row else None
+
+    def _update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        now = time.time()
+        payload = json.dumps(metadata, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO sessions (session_id, metadata, created_at, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    metadata = excluded.metadata,
+                    updated_at = excluded.updated_at
+                """,
+                (session_id, payload, now, now)
+            )
+            self._conn.commit()
+
+    def _add_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        now = time.time()
+        rows = [
+            (
+                session_id,
+                msg['role'],
+                msg['role_type'],
+                msg['content'],
+                msg['content'].lower(),
+                json.dumps(msg.get('metadata') or {}, ensure_ascii=False),
+                msg.get('created_at') or now,
+            )
+            for msg in messages
+        ]
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO messages (session_id, role, role_type, content, content_lower, metadata, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            self._conn.commit()
+
+    def _get_messages(self, session_id: str, last_n: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT role, role_type, content, metadata, created_at FROM messages
+                WHERE session_id = ?
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+                """,
+                (session_id, last_n)
+            ).fetchall()
+        return [self._row_to_history(row) for row in reversed(rows)]
+
+    def _search_messages(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        terms = [term for term in query.lower().split() if len(term) > 2]
+        if not terms:
+            return []
+
+        # SQLite LOWER() не понимает кириллицу, поэтому ищем по content_lower,
+        # заполненному в Python, а релевантность считаем по доле совпавших слов
+        where = " OR ".join("content_lower LIKE ?" for _ in terms)
+        params = [f"%{term}%" for term in terms]
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT session_id, content, content_lower, metadata FROM messages
+                WHERE {where}
+                ORDER BY created_at DESC
+                LIMIT 500
+                """,
+                params
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            content_lower = row['content_lower']
+            matched = sum(1 for term in terms if term in content_lower)
+            if matched:
+                results.append({
+                    'session_id': row['session_id'],
+                    'content': row['content'],
+                    'score': matched / len(terms),
+                    'metadata': json.loads(row['metadata']) if row['metadata'] else {}
+                })
+
+        results.sort(key=lambda item: item['score'], reverse=True)
+        return results[:limit]
+
+    @staticmethod
+    def _row_to_history(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'role': row['role_type'],
+            'content': row['content'],
+            'timestamp': datetime.fromtimestamp(row['created_at']).isoformat(),
+            'metadata': json.loads(row['metadata']) if row['metadata'] else {},
+            'speaker_name': row['role']
+        }
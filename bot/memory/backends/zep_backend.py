@@ -0,0 +1,75 @@
+"""
+Хранилище памяти на базе ZEP Cloud
+"""
+from typing import Any, Dict, List, Optional
+
+from zep_cloud.client import AsyncZep
+from zep_cloud.types import Message
+
+from .base import MemoryBackend
+
+
+class ZepMemoryBackend(MemoryBackend):
+    """Адаптер AsyncZep к интерфейсу MemoryBackend"""
+
+    name = "zep"
+
+    def __init__(self, zep_client: AsyncZep):
+        self.zep_client = zep_client
+
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = await self.zep_client.memory.get_session(session_id)
+        if session and getattr(session, 'metadata', None):
+            return session.metadata
+        return None
+
+    async def update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        await self.zep_client.memory.update_session(
+            session_id=session_id,
+            metadata=metadata
+        )
+
+    async def add_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        await self.zep_client.memory.add(
+            session_id=session_id,
+            messages=[
+                Message(
+                    role=msg['role'],
+                    role_type=msg['role_type'],
+                    content=msg['content'],
+                    metadata=msg.get('metadata')
+                )
+                for msg in messages
+            ]
+        )
+
+    async def get_messages(self, session_id: str, last_n: int = 10) -> List[Dict[str, Any]]:
+        memory = await self.zep_client.memory.get(session_id=session_id, lastn=last_n)
+        if not memory or not memory.messages:
+            return []
+        return [
+            {
+                'role': msg.role_type,  # Используем role_type для стандартных ролей user/assistant
+                'content': msg.content,
+                'timestamp': msg.created_at,
+                'metadata': getattr(msg, 'metadata', {}),
+                'speaker_name': msg.role  # Сохраняем имя говорящего отдельно
+            }
+            for msg in memory.messages[-last_n:]
+        ]
+
+    async def search_messages(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        results = await self.zep_client.memory.search_memory(
+            session_ids=[],  # Поиск по всем сессиям
+            text=query,
+            limit=limit
+        )
+        return [
+            {
+                'session_id': result.session_id,
+                'content': result.message.content,
+                'score': result.distance,
+                'metadata': getattr(result.message, 'metadata', {})
+            }
+            for result in results
+        ] if results else []
@@ -0,0 +1,330 @@
+"""
+Пересчет данных лидов по истории диалогов
+
+Читает журналы DialogLogger (logs/dialogs/dialogs_*.jsonl), заново
+прогоняет сообщения каждой сессии через экстракторы и переходы состояний
+(как MemoryService.process_message) и сравнивает результат с последними
+сохраненными данными лида из журнала (записи zep_save). Сессии делятся
+на шарды по session_id и обрабатываются в пуле процессов. С флагом --push
+измененные поля записываются в хранилище памяти с ограниченной
+параллельностью.
+
+--push пишет в хранилище напрямую, в обход MemoryService работающего бота:
+его локальных кэшей, кэша сессий, журнала сессий и индекса лидов. Бот
+должен быть остановлен (штатно, чтобы outbox успел дослать записи), иначе
+он перезапишет пересчитанные поля данными из своих кэшей. Журнал сессий
+(--journal) обновляется вместе с хранилищем, поэтому после запуска бот
+восстановит уже пересчитанные данные лидов.
+
+Запуск:
+    python -m bot.memory.backfill [--logs logs/dialogs] [--workers 4]
+                                  [--push] [--backend sqlite|zep] [--concurrency 8]
+                                  [--journal data/sessions]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .extractors import LeadDataExtractor
+from .models import DialogState, LeadData
+from .session_journal import SessionJournal
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые пишут экстракторы и переходы состояний. Остальные поля
+# (имя, заданные вопросы, комментарии менеджера, даты) пересчетом не
+# восстанавливаются и в хранилище не трогаются
+REPLAYED_FIELDS = (
+    'phone', 'telegram_username', 'city', 'current_location', 'is_in_sochi', 'is_local',
+    'rooms_count', 'area_min', 'area_max', 'view_preference', 'need_remote_deal',
+    'online_viewing_ready', 'need_to_sell_current', 'decision_maker',
+    'business_sphere', 'company_size', 'automation_goal', 'payment_type',
+    'budget_min', 'budget_max', 'mortgage_bank', 'preferred_locations', 'property_type',
+    'technical_requirements', 'urgency_level', 'urgency_date',
+    'qualification_status', 'current_dialog_state',
+)
+
+# Типы записей журнала, которые проходят через process_message
+_DIALOG_MESSAGE_TYPES = ('user', 'assistant')
+
+
+@dataclass
+class SessionHistory:
+    """История сессии из журналов диалогов"""
+    messages: List[str] = field(default_factory=list)
+    transitions: List[Tuple[str, str]] = field(default_factory=list)  # (из, в) по журналу
+    stored: Optional[Dict[str, Any]] = None  # последние сохраненные данные лида
+
+
+@dataclass
+class SessionResult:
+    """Результат пересчета сессии"""
+    session_id: str
+    messages: int
+    changes: Dict[str, Tuple[Any, Any]]  # поле -> (сохранено, пересчитано)
+    transitions: List[Tuple[str, str]]
+    transitions_match: bool
+    had_stored: bool  # в журнале были сохраненные данные лида
+    replayed: Dict[str, Any]  # значения REPLAYED_FIELDS в форме to_dict
+
+
+def read_dialog_logs(paths: Iterable[str]) -> Tuple[Dict[str, SessionHistory], int]:
+    """
+    Истории сессий из журналов в порядке времени записей.
+
+    Returns:
+        (session_id -> SessionHistory, число пропущенных битых строк)
+    """
+    records = []
+    skipped = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as log_file:
+            for line in log_file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    skipped += 1
+                    continue
+                if isinstance(record, dict) and record.get('session_id'):
+                    records.append(record)
+
+    # Буфер DialogLogger сбрасывается пачками, порядок строк и файлов не гарантирован
+    records.sort(key=lambda record: record.get('timestamp') or '')
+
+    sessions: Dict[str, SessionHistory] = defaultdict(SessionHistory)
+    for record in records:
+        history = sessions[record['session_id']]
+        message_type = record.get('message_type')
+        if message_type in _DIALOG_MESSAGE_TYPES and record.get('text'):
+            history.messages.append(record['text'])
+        elif message_type == 'zep_save' and record.get('zep_data'):
+            history.stored = record['zep_data']
+        elif 'transition' in record:
+            transition = record['transition']
+            history.transitions.append((transition.get('from'), transition.get('to')))
+    return dict(sessions), skipped
+
+
+def shard_of(session_id: str, shards: int) -> int:
+    """Шард сессии: стабилен между запусками и процессами (в отличие от hash())"""
+    return zlib.crc32(session_id.encode('utf-8')) % shards
+
+
+def replay_shard(shard: List[Tuple[str, SessionHistory]]) -> List[SessionResult]:
+    """Пересчет сессий шарда; выполняется в процессе пула"""
+    transitions: Dict[str, List[Tuple[str, str]]] = defaultdict(list)
+
+    def on_transition(session_id: str, from_state: DialogState, to_state: DialogState):
+        transitions[session_id].append((from_state.value, to_state.value))
+
+    leads = LeadDataExtractor.extract_many(
+        ((session_id, message) for session_id, history in shard for message in history.messages),
+        track_state=True, on_transition=on_transition,
+    )
+
+    results = []
+    for session_id, history in shard:
+        replayed = _replayed_values(leads.get(session_id) or LeadData())
+        stored = _replayed_values(LeadData.from_dict(history.stored)) if history.stored else {}
+        changes = {
+            name: (stored.get(name), value) for name, value in replayed.items()
+            if stored.get(name) != value
+        }
+        results.append(SessionResult(
+            session_id=session_id,
+            messages=len(history.messages),
+            changes=changes,
+            transitions=transitions.get(session_id, []),
+            transitions_match=transitions.get(session_id, []) == history.transitions,
+            had_stored=history.stored is not None,
+            replayed=replayed,
+        ))
+    return results
+
+
+def _replayed_values(lead: LeadData) -> Dict[str, Any]:
+    data = lead.to_dict()
+    return {name: data.get(name) for name in REPLAYED_FIELDS}
+
+
+def run_backfill(sessions: Dict[str, SessionHistory], workers: int,
+                 shards_per_worker: int = 4) -> List[SessionResult]:
+    """Пересчет всех сессий в пуле процессов с отчетом о ходе работы"""
+    shard_count = max(1, workers * shards_per_worker)
+    shards: List[List[Tuple[str, SessionHistory]]] = [[] for _ in range(shard_count)]
+    for session_id, history in sessions.items():
+        shards[shard_of(session_id, shard_count)].append((session_id, history))
+    shards = [shard for shard in shards if shard]
+
+    total_messages = sum(len(history.messages) for history in sessions.values())
+    results: List[SessionResult] = []
+    processed = 0
+    started = time.perf_counter()
+
+    if workers <= 1:
+        completed = (replay_shard(shard) for shard in shards)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        completed = (future.result() for future in
+                     as_completed([executor.submit(replay_shard, shard) for shard in shards]))
+    try:
+        for number, shard_results in enumerate(completed, 1):
+            results.extend(shard_results)
+            processed += sum(result.messages for result in shard_results)
+            elapsed = time.perf_counter() - started
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            print(f"🔄 Шардов {number}/{len(shards)}, сообщений {processed}/{total_messages}, "
+                  f"{rate:,.0f} сообщений/с", file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+async def push_updates(backend, results: List[SessionResult], concurrency: int = 8,
+                       journal: Optional[SessionJournal] = None) -> Counter:
+    """
+    Записывает пересчитанные поля измененных сессий в хранилище.
+
+    Метаданные сессии читаются из хранилища заново: журналы могут отставать,
+    а поля вне REPLAYED_FIELDS должны сохраниться. Записываются только
+    непустые пересчитанные значения, отличные от сохраненных: пустое
+    значение пересчета не затирает поле, заполненное иначе (например,
+    LLM-извлечением, которого при пересчете нет). Если передан журнал
+    сессий, записанные данные фиксируются и в нем.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    outcome: Counter = Counter()
+
+    async def push(result: SessionResult):
+        async with semaphore:
+            try:
+                current = await backend.get_session_metadata(result.session_id)
+                stored = (LeadData.from_dict(current) if current else LeadData()).to_dict()
+                updates = {name: value for name, value in result.replayed.items()
+                           if value not in (None, '', [], {}) and value != stored.get(name)}
+                if not updates:
+                    outcome['unchanged'] += 1
+                    return
+                # Через to_dict/from_dict значения приводятся к типам полей
+                merged = LeadData.from_dict({**stored, **updates})
+                await backend.update_session_metadata(result.session_id, merged.to_dict())
+                outcome['pushed'] += 1
+                if journal is not None and result.session_id in journal:
+                    journal.record_data(result.session_id, merged.to_bytes())
+                    outcome['journaled'] += 1
+            except Exception as e:
+                outcome['failed'] += 1
+                logger.error(f"❌ Не удалось записать данные лида {result.session_id}: {e}")
+
+    await asyncio.gather(*(push(result) for result in results if result.changes))
+    return outcome
+
+
+def _create_backend(name: str):
+    from bot.config import MEMORY_SQLITE_PATH, ZEP_API_KEY
+    if name == 'sqlite':
+        from .backends import SQLiteMemoryBackend
+        return SQLiteMemoryBackend(MEMORY_SQLITE_PATH)
+    from zep_cloud.client import AsyncZep
+    from .backends import ZepMemoryBackend
+    if not ZEP_API_KEY:
+        raise RuntimeError("ZEP_API_KEY не задан")
+    return ZepMemoryBackend(AsyncZep(api_key=ZEP_API_KEY))
+
+
+async def _push_with_backend(name: str, results: List[SessionResult], concurrency: int,
+                             journal_dir: str) -> Counter:
+    backend = _create_backend(name)
+    journal = None
+    if journal_dir and os.path.isdir(journal_dir):
+        journal = SessionJournal(journal_dir)
+        journal.replay()
+    try:
+        return await push_updates(backend, results, concurrency, journal)
+    finally:
+        await backend.close()
+        if journal is not None:
+            journal.close()
+
+
+def print_summary(results: List[SessionResult], elapsed: float, skipped_lines: int):
+    messages = sum(result.messages for result in results)
+    changed = [result for result in results if result.changes]
+    field_changes = Counter(name for result in changed for name in result.changes)
+
+    print(f"Сессий: {len(results)}, сообщений: {messages}, время: {elapsed:.1f} с "
+          f"({messages / elapsed if elapsed > 0 else 0:,.0f} сообщений/с)")
+    if skipped_lines:
+        print(f"⚠️ Пропущено битых строк журнала: {skipped_lines}")
+    print(f"Сессий с изменениями: {len(changed)} "
+          f"(без сохраненных данных: {sum(1 for result in changed if not result.had_stored)})")
+    for name, count in field_changes.most_common():
+        print(f"   {name}: {count}")
+    mismatched = sum(1 for result in results if not result.transitions_match)
+    print(f"Сессий с переходами состояний, отличными от журнала: {mismatched}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logs', default='logs/dialogs', help="каталог журналов диалогов")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--push', action='store_true',
+                        help="записать изменения в хранилище (только при остановленном боте)")
+    parser.add_argument('--backend', choices=('sqlite', 'zep'),
+                        default=os.getenv('MEMORY_BACKEND', 'zep').lower())
+    parser.add_argument('--concurrency', type=int, default=8, help="параллельных записей в хранилище")
+    parser.add_argument('--journal', default=None,
+                        help="каталог журнала сессий бота, обновляемого при --push "
+                             "(по умолчанию SESSION_JOURNAL_DIR; пустая строка - не обновлять)")
+    parser.add_argument('--show', type=int, default=0, help="показать изменения первых N сессий")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    paths = sorted(glob.glob(os.path.join(args.logs, 'dialogs_*.jsonl')))
+    if not paths:
+        print(f"❌ Нет журналов диалогов в {args.logs}")
+        return 1
+
+    started = time.perf_counter()
+    sessions, skipped_lines = read_dialog_logs(paths)
+    results = run_backfill(sessions, args.workers)
+    elapsed = time.perf_counter() - started
+    print_summary(results, elapsed, skipped_lines)
+
+    for result in [result for result in results if result.changes][:args.show]:
+        print(f"📋 {result.session_id}:")
+        for name, (old, new) in result.changes.items():
+            print(f"   {name}: {old!r} → {new!r}")
+
+    if args.push:
+        print("⚠️ --push пишет в хранилище в обход работающего бота: бот должен быть остановлен, "
+              "иначе его кэши перезапишут пересчитанные поля", file=sys.stderr)
+        journal_dir = args.journal
+        if journal_dir is None:
+            from bot.config import SESSION_JOURNAL_DIR
+            journal_dir = SESSION_JOURNAL_DIR
+        outcome = asyncio.run(_push_with_backend(args.backend, results, args.concurrency, journal_dir))
+        print(f"💾 Записано в хранилище: {outcome['pushed']}, без изменений: {outcome['unchanged']}, "
+              f"ошибок: {outcome['failed']}, обновлено в журнале сессий: {outcome['journaled']}")
+        return 1 if outcome['failed'] else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Векторный скоринг множества лидов для админки и выгрузок
+
+Лиды раскладываются по колонкам NumPy (маска заполненных полей, бюджет,
+коды перечислений, признаки из строк), после чего статус квалификации,
+полнота данных, скор и условия эскалации считаются одним проходом по
+массивам. Результаты совпадают с функциями lead_scoring для каждого лида.
+"""
+from dataclasses import dataclass
+from itertools import repeat
+from operator import attrgetter, contains
+from typing import Any, Dict, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость
+    np = None
+
+from .lead_scoring import (
+    _BUDGET, _COMPLETENESS_SINGLE, _COMPLETENESS_TOTAL, _DEMO_CONTACT, _GOAL, _MONEY, _PHONE,
+    _REQUEST_OBJECT, _URGENCY,
+)
+from .models import ClientType, LeadData
+
+# Коды статуса квалификации: 0 - не определен
+_QUALIFICATION_CODES = {None: 0, ClientType.COLD: 1, ClientType.WARM: 2, ClientType.HOT: 3}
+_STATUS_BY_CODE = (None, ClientType.COLD, ClientType.WARM, ClientType.HOT)
+# Код статуса по числу выполненных критериев (0-3), как _STATUS_BY_SCORE
+_STATUS_CODE_BY_SCORE = (1, 1, 2, 3)
+
+# Коды срочности: 0 - не указана или неизвестное значение
+_URGENCY_CODES = {'low': 1, 'medium': 2, 'high': 3}
+
+_COMPLETENESS_BITS = tuple(bit for bit in range(_COMPLETENESS_SINGLE.bit_length()) if _COMPLETENESS_SINGLE >> bit & 1)
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+@dataclass
+class LeadColumns:
+    """Поля лидов, нужные для скоринга, по колонкам"""
+    filled_mask: Any             # uint64
+    urgency: Any                 # int8, _URGENCY_CODES
+    budget_min: Any              # float64, NaN - не указан
+    budget_max: Any              # float64, NaN - не указан
+    qualification: Any           # int8, _QUALIFICATION_CODES (сохраненный статус)
+    requirements_count: Any      # int32
+    presentation_requested: Any  # bool
+
+    @classmethod
+    def from_leads(cls, leads: Sequence[LeadData]) -> 'LeadColumns':
+        if np is None:
+            raise RuntimeError("Для векторного скоринга лидов нужен numpy")
+
+        # Колонки собираются через map/attrgetter: цикл по лидам идет в C
+        count = len(leads)
+        return cls(
+            filled_mask=np.fromiter(map(attrgetter('filled_mask'), leads), dtype=np.uint64, count=count),
+            urgency=_codes(attrgetter('urgency_level'), leads, _URGENCY_CODES),
+            # None становится NaN, а сравнения с NaN ложны - как проверка "budget and budget > X"
+            budget_min=np.array(list(map(attrgetter('budget_min'), leads)), dtype=np.float64),
+            budget_max=np.array(list(map(attrgetter('budget_max'), leads)), dtype=np.float64),
+            qualification=_codes(attrgetter('qualification_status'), leads, _QUALIFICATION_CODES),
+            requirements_count=np.fromiter(
+                map(len, map(attrgetter('technical_requirements'), leads)), dtype=np.int32, count=count
+            ),
+            # str() превращает None в 'None' и не копирует строки
+            presentation_requested=np.fromiter(
+                map(contains, map(str.lower, map(str, map(attrgetter('comments'), leads))), repeat('презентация')),
+                dtype=np.bool_, count=count,
+            ),
+        )
+
+    @classmethod
+    def allocate(cls, capacity: int) -> 'LeadColumns':
+        """Пустые колонки на capacity строк для построчного заполнения"""
+        if np is None:
+            raise RuntimeError("Для векторного скоринга лидов нужен numpy")
+        return cls(**{
+            name: np.zeros(capacity, dtype=dtype) for name, dtype in _COLUMN_DTYPES.items()
+        })
+
+    def set_row(self, row: int, lead: LeadData):
+        """Записывает лид в строку row"""
+        self.filled_mask[row] = lead.filled_mask
+        self.urgency[row] = _URGENCY_CODES.get(lead.urgency_level, 0)
+        self.budget_min[row] = lead.budget_min or np.nan
+        self.budget_max[row] = lead.budget_max or np.nan
+        self.qualification[row] = _QUALIFICATION_CODES.get(lead.qualification_status, 0)
+        self.requirements_count[row] = len(lead.technical_requirements)
+        self.presentation_requested[row] = 'презентация' in (lead.comments or '').lower()
+
+    def copy_row(self, source: int, target: int):
+        for name in _COLUMN_DTYPES:
+            column = getattr(self, name)
+            column[target] = column[source]
+
+    def resized(self, capacity: int) -> 'LeadColumns':
+        """Копия с другой емкостью; строки сверх старой длины нулевые"""
+        resized = LeadColumns.allocate(capacity)
+        for name in _COLUMN_DTYPES:
+            source = getattr(self, name)
+            count = min(len(source), capacity)
+            getattr(resized, name)[:count] = source[:count]
+        return resized
+
+    def head(self, count: int) -> 'LeadColumns':
+        """Первые count строк (представления, без копирования)"""
+        return LeadColumns(**{name: getattr(self, name)[:count] for name in _COLUMN_DTYPES})
+
+    def __len__(self) -> int:
+        return len(self.filled_mask)
+
+
+_COLUMN_DTYPES = {
+    'filled_mask': 'uint64',
+    'urgency': 'int8',
+    'budget_min': 'float64',
+    'budget_max': 'float64',
+    'qualification': 'int8',
+    'requirements_count': 'int32',
+    'presentation_requested': 'bool',
+}
+
+
+def _codes(getter, leads: Sequence[LeadData], codes: dict):
+    """
+    Колонка кодов значения поля.
+
+    Сравнение массива объектов с константой идет без хэширования (хэш Enum
+    считается в Python), значения вне codes получают код 0.
+    """
+    values = np.array(list(map(getter, leads)), dtype=object)
+    column = np.zeros(len(values), dtype=np.int8)
+    for value, code in codes.items():
+        if value is not None:
+            column[values == value] = code
+    return column
+
+
+@dataclass
+class LeadScores:
+    """Результаты скоринга по колонкам, в порядке входных лидов"""
+    qualification: Any    # int8, _QUALIFICATION_CODES (вычисленный статус)
+    completeness: Any     # float64
+    escalation_score: Any  # float64
+    should_escalate: Any  # bool
+
+    def qualification_statuses(self) -> List[ClientType]:
+        return [_STATUS_BY_CODE[code] for code in self.qualification.tolist()]
+
+    def status_counts(self) -> Dict[ClientType, int]:
+        counts = np.bincount(self.qualification, minlength=len(_STATUS_BY_CODE))
+        return {status: int(counts[code]) for code, status in enumerate(_STATUS_BY_CODE) if status is not None}
+
+    def __len__(self) -> int:
+        return len(self.qualification)
+
+
+def _has_any(mask, fields: int):
+    return (mask & np.uint64(fields)) != 0
+
+
+def score_columns(columns: LeadColumns) -> LeadScores:
+    """Скоринг лидов, разложенных по колонкам"""
+    mask = columns.filled_mask
+
+    # Квалификация: деньги + срочность + понимание запроса
+    criteria = (
+        _has_any(mask, _MONEY).astype(np.int8)
+        + (_has_any(mask, _URGENCY) | (columns.urgency >= _URGENCY_CODES['medium']))
+        + (_has_any(mask, _GOAL) & _has_any(mask, _REQUEST_OBJECT))
+    )
+    qualification = np.asarray(_STATUS_CODE_BY_SCORE, dtype=np.int8)[criteria]
+
+    # Полнота данных: numpy 1.26 не умеет popcount, битов всего несколько
+    filled = np.zeros(len(mask), dtype=np.int64)
+    for bit in _COMPLETENESS_BITS:
+        filled += ((mask >> np.uint64(bit)) & np.uint64(1)).astype(np.int64)
+    filled += 2 * _has_any(mask, _BUDGET)
+    completeness = filled / _COMPLETENESS_TOTAL
+
+    # Скор эскалации: слагаемые в том же порядке, что в escalation_score,
+    # чтобы суммы с плавающей точкой совпадали бит в бит
+    stored = columns.qualification
+    hot = stored == _QUALIFICATION_CODES[ClientType.HOT]
+    score = np.zeros(len(mask), dtype=np.float64)
+    score += np.where(hot, 0.4, np.where(stored == _QUALIFICATION_CODES[ClientType.WARM], 0.2, 0.0))
+    score += np.where(_has_any(mask, _PHONE), 0.2, 0.0)
+    score += np.where(columns.budget_max > 1000, 0.2, 0.0)
+    score += np.where(columns.urgency == _URGENCY_CODES['high'], 0.2, 0.0)
+    np.minimum(score, 1.0, out=score)
+
+    should_escalate = (
+        hot
+        | ((mask & np.uint64(_DEMO_CONTACT)) == np.uint64(_DEMO_CONTACT))
+        | (columns.budget_min > 1000)
+        | (columns.budget_max > 2000)
+        | (columns.requirements_count > 3)
+        | columns.presentation_requested
+    )
+
+    return LeadScores(
+        qualification=qualification,
+        completeness=completeness,
+        escalation_score=score,
+        should_escalate=should_escalate,
+    )
+
+
+def score_leads(leads: Sequence[LeadData]) -> LeadScores:
+    """Скоринг множества лидов одним векторным проходом"""
+    return score_columns(LeadColumns.from_leads(leads))
@@ -0,0 +1,68 @@
+"""
+Переходы состояний диалога по таблице
+"""
+from dataclasses import dataclass
+from typing import Dict, Mapping, Sequence, Tuple
+
+from .models import DialogState, LeadData, lead_fields_mask
+
+
+@dataclass(frozen=True)
+class Transition:
+    """
+    Строка таблицы переходов: переход в target, если выполнено хотя бы
+    одно из условий.
+
+    Attributes:
+        target: Следующее состояние
+        fields: Заполнено (истинно) одно из полей лида
+        defined: Одно из полей лида не None (для Optional[bool] False - тоже ответ)
+        keywords: Подстрока из списка есть в сообщении в нижнем регистре
+    """
+    target: DialogState
+    fields: Sequence[str] = ()
+    defined: Sequence[str] = ()
+    keywords: Sequence[str] = ()
+
+
+# Скомпилированная строка: (маска полей, поля "не None", слова, следующее состояние)
+CompiledTransition = Tuple[int, Tuple[str, ...], Tuple[str, ...], DialogState]
+
+
+class DialogStateMachine:
+    """
+    Автомат состояний диалога по таблице состояние -> строки Transition.
+    Первая выполненная строка задает следующее состояние, иначе состояние
+    не меняется.
+    """
+
+    def __init__(self, table: Mapping[DialogState, Sequence[Transition]]):
+        self._steps: Dict[DialogState, Tuple[CompiledTransition, ...]] = {
+            state: tuple(
+                (lead_fields_mask(*transition.fields), tuple(transition.defined),
+                 tuple(transition.keywords), transition.target)
+                for transition in transitions
+            )
+            for state, transitions in table.items()
+            if transitions
+        }
+
+    def next_state(self, message: str, state: DialogState, lead: LeadData) -> DialogState:
+        """Следующее состояние после сообщения (данные лида - уже после извлечения)"""
+        steps = self._steps.get(state)
+        if steps is None:
+            return state
+        lowered = None
+        for mask, defined, keywords, target in steps:
+            if lead.filled_mask & mask:
+                return target
+            for field_name in defined:
+                if getattr(lead, field_name) is not None:
+                    return target
+            if keywords:
+                if lowered is None:
+                    lowered = message.lower()
+                for word in keywords:
+                    if word in lowered:
+                        return target
+        return state
@@ -0,0 +1,50 @@
+"""
+План извлечения: какие экстракторы могут что-то изменить в лиде
+"""
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Sequence, Tuple
+
+from .keyword_automaton import KeywordAutomaton
+from .models import lead_fields_mask
+
+# Условие шага: (группы слов, поля). Условие активно, если в сообщении есть
+# слово одной из групп и не все поля уже заполнены; пустые поля - шаг
+# перезаписывает значения и от заполненности не зависит
+StepTrigger = Tuple[Sequence[str], Sequence[str]]
+
+
+class ExtractionPlanner:
+    """
+    Отбор экстракторов для сообщения по маске заполненных полей лида и
+    группам ключевых слов, найденным автоматом.
+
+    Шаг выполняется, если активно хотя бы одно из его условий. Шаги, все
+    значения которых пишутся только в пустые поля, отключаются после
+    заполнения полей; шаги без нужных слов в сообщении (или цифр для
+    регулярных выражений) не выполняются вовсе. План зависит только от
+    масок, поэтому кэшируется.
+    """
+
+    def __init__(self, automaton: KeywordAutomaton, steps: Dict[str, Sequence[StepTrigger]],
+                 cache_size: int = 4096):
+        self._triggers: List[Tuple[str, int, int]] = []
+        self._fields = 0
+        self._groups = 0
+        for name, triggers in steps.items():
+            for groups, fields in triggers:
+                groups_mask = automaton.group_mask(*groups)
+                fields_mask = lead_fields_mask(*fields)
+                self._triggers.append((name, groups_mask, fields_mask))
+                self._groups |= groups_mask
+                self._fields |= fields_mask
+        self._plan = lru_cache(maxsize=cache_size)(self._build_plan)
+
+    def plan(self, filled_mask: int, groups: int) -> FrozenSet[str]:
+        """Имена шагов, которые нужно выполнить для сообщения"""
+        return self._plan(filled_mask & self._fields, groups & self._groups)
+
+    def _build_plan(self, filled_mask: int, groups: int) -> FrozenSet[str]:
+        return frozenset(
+            name for name, groups_mask, fields_mask in self._triggers
+            if groups & groups_mask and (not fields_mask or filled_mask & fields_mask != fields_mask)
+        )
@@ -2,14 +2,20 @@
 Экстракторы данных из диалогов для системы памяти
 """
 import re
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Iterable, Callable
 from datetime import datetime, timedelta
 import logging
 
 from .models import (
     DialogState, ClientType, AutomationGoal,
-    PaymentType, LeadData
+    PaymentType, LeadData, LeadDraft
 )
+from . import lead_scoring
+from .keyword_automaton import KeywordAutomaton, KeywordHits
+from .pattern_family import PatternFamily
+from .extraction_plan import ExtractionPlanner
+from .dialog_state_machine import DialogStateMachine, Transition
+from .vocabulary import Vocabulary, load_vocabulary
 
 logger = logging.getLogger(__name__)
 
@@ -21,170 +27,267 @@ class LeadDataExtractor:
     PHONE_PATTERN = re.compile(r'\+?[78][\s\-]?\(?(\d{3})\)?\s?[\s\-]?(\d{3})[\s\-]?(\d{2})[\s\-]?(\d{2})')
     EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
     
-    # Словари для определения типов по ключевым словам
-    BUSINESS_SPHERES = {
-        'интернет-магазин': 'ecommerce',
-        'магазин': 'retail', 
-        'недвижимость': 'real_estate',
-        'услуги': 'services',
-        'производство': 'manufacturing',
-        'кафе': 'food_service',
-        'ресторан': 'food_service',
-        'салон': 'beauty',
-        'клиника': 'medical',
-        'стоматология': 'medical',
-        'автосервис': 'automotive',
-        'строительство': 'construction',
-        'консалтинг': 'consulting',
-        'обучение': 'education',
-        'фитнес': 'fitness',
-        'туризм': 'tourism'
-    }
-    
-    AUTOMATION_GOALS = {
-        'краткосрочные инвестиции': AutomationGoal.SHORT_INVESTMENT,
-        'короткие инвестиции': AutomationGoal.SHORT_INVESTMENT,
-        'на год': AutomationGoal.SHORT_INVESTMENT,
-        'долгосрочные инвестиции': AutomationGoal.LONG_INVESTMENT,
-        'длинные инвестиции': AutomationGoal.LONG_INVESTMENT,
-        'на долго': AutomationGoal.LONG_INVESTMENT,
-        'для проживания': AutomationGoal.RESIDENCE,
-        'для жизни': AutomationGoal.RESIDENCE,
-        'пмж': AutomationGoal.RESIDENCE,
-        'переезд': AutomationGoal.RESIDENCE,
-        'сбережения': AutomationGoal.SAVINGS,
-        'сохранить капитал': AutomationGoal.SAVINGS,
-        'сохранение': AutomationGoal.SAVINGS,
-        'арендный бизнес': AutomationGoal.RENTAL_BUSINESS,
-        'сдавать в аренду': AutomationGoal.RENTAL_BUSINESS,
-        'аренда': AutomationGoal.RENTAL_BUSINESS
-    }
+    # Словари для определения типов по ключевым словам. Содержимое - в
+    # data/extractor_vocabulary.json, подключается apply_vocabulary() при
+    # импорте и может быть перечитано без перезапуска (reload_vocabulary)
+    BUSINESS_SPHERES: Dict[str, str] = {}
+    AUTOMATION_GOALS: Dict[str, AutomationGoal] = {}
+    PAYMENT_TYPES: Dict[str, PaymentType] = {}
+    SOCHI_LOCATIONS: List[str] = []  # Локации в Сочи
+    PROPERTY_TYPES: Dict[str, str] = {}  # Типы недвижимости
+    TECH_KEYWORDS: Dict[str, str] = {}  # Технические требования
+    URGENCY_KEYWORDS: Dict[str, str] = {}  # Срочность
+    MORTGAGE_BANKS: List[str] = []  # Популярные банки для ипотеки
+    # Фразы-признаки: группа срабатывает, если в сообщении есть любая из фраз
+    PHRASES: Dict[str, List[str]] = {}
+    # Словари, которые ищутся и по основам слов: падежные формы не нужно
+    # перечислять ('квартире', 'ипотекой', 'в Хосте')
+    STEMMED_GROUPS: Tuple[str, ...] = ()
+    # Все словари одним автоматом: сообщение просматривается один раз,
+    # экстракторы работают с найденными словами
+    KEYWORD_GROUPS: Dict[str, List[str]] = {}
+    KEYWORDS: KeywordAutomaton
+    VOCABULARY: Vocabulary
+
+    # Группы фраз, которые читает код экстракторов: без них словари не подключаются
+    PHRASE_GROUPS = (
+        'company_individual', 'company_team', 'company_office',
+        'in_sochi', 'local', 'not_in_sochi',
+        'arrival_tomorrow', 'arrival_day_after_tomorrow', 'arrival_this_week',
+        'krasnaya_polyana', 'krasnaya_polyana_words', 'mortgage_approved',
+        'view_sea', 'view_mountains', 'view_park', 'online_viewing_ready', 'online_viewing_refused',
+        'decision_wife', 'decision_husband', 'decision_partner', 'decision_self', 'decision_family',
+        'remote_deal', 'in_person_deal', 'sell_current',
+    )
     
-    PAYMENT_TYPES = {
-        'наличные': PaymentType.CASH,
-        'наличными': PaymentType.CASH,
-        'карта': PaymentType.CARDS,
-        'карты': PaymentType.CARDS,
-        'картой': PaymentType.CARDS,
-        'безнал': PaymentType.BANK_TRANSFER,
-        'безналичный': PaymentType.BANK_TRANSFER,
-        'банк': PaymentType.BANK_TRANSFER,
-        'перевод': PaymentType.BANK_TRANSFER,
-        'ипотека': PaymentType.BANK_TRANSFER,  # Добавлено
-        'ипотеку': PaymentType.BANK_TRANSFER,  # Добавлено
-        'ипотечный': PaymentType.BANK_TRANSFER,  # Добавлено
-        'рассрочка': PaymentType.BANK_TRANSFER,  # Добавлено
-        'рассрочку': PaymentType.BANK_TRANSFER,  # Добавлено
-        'кредит': PaymentType.BANK_TRANSFER,  # Добавлено
-        'крипта': PaymentType.CRYPTO,
-        'криптовалюта': PaymentType.CRYPTO,
-        'биткоин': PaymentType.CRYPTO
+    # Паттерны бюджета в порядке приоритета: выигрывает первый совпавший
+    BUDGET_PATTERNS = PatternFamily([
+        ('up_to_millions', r'до\s+(\d+)\s*(?:млн|миллион)'),
+        ('up_to_thousands', r'до\s+(\d+)\s*(?:тыс|тысяч|k)'),
+        ('up_to', r'до\s+(\d+)'),
+        ('thousands', r'(\d+)\s*(?:тысяч|тыс|k)'),
+        ('millions', r'(\d+)\s*(?:миллион|млн|m)'),
+        ('dollars', r'(\d+)\s*(?:долларов?|\$|usd)'),
+        ('rubles', r'(\d+)\s*(?:рублей?|руб|₽)'),
+        ('from_to', r'от\s+(\d+)\s+до\s+(\d+)'),
+        ('range', r'(\d+)\s*-\s*(\d+)'),
+    ], re.IGNORECASE, starts=r'\dдо')
+
+    # Город клиента: "из Волгодонск", "из Москвы"
+    CITY_PATTERN = re.compile(r'из\s+([А-Яа-яЁё]+)', re.IGNORECASE)
+
+    # Количество комнат
+    ROOMS_PATTERNS = PatternFamily([
+        ('rooms', r'(\d)\s*комнат'),
+        ('rooms_short', r'(\d)\s*к'),
+        ('rooms_hyphen', r'(\d)-комнат'),
+        ('rooms_compact', r'(\d)к'),
+        ('studio', r'студи[яю]'),
+        ('one_room', r'однокомнатн'),
+        ('two_rooms', r'двухкомнатн'),
+        ('three_rooms', r'трехкомнатн'),
+    ], starts=r'\dсодт')
+    ROOMS_BY_WORD = {'studio': 0, 'one_room': 1, 'two_rooms': 2, 'three_rooms': 3}
+
+    # Площадь
+    AREA_PATTERNS = PatternFamily([
+        ('square_meters', r'(\d+)\s*кв\.?\s*м'),
+        ('squares', r'(\d+)\s*квадрат'),
+        ('meters', r'(\d+)\s*метр'),
+        ('area', r'площад[ьь]\s*(\d+)'),
+        ('from_to', r'от\s*(\d+)\s*до\s*(\d+)\s*кв'),
+    ], starts=r'\dпо')
+
+    # Признаки того, что регулярным выражениям есть что искать
+    MARKERS = {
+        'digits': list('0123456789'),  # телефон, бюджет, комнаты, площадь
+        'at_sign': ['@'],  # email
+        'city_marker': ['из'],  # "из Москвы"
+        'rooms_words': ['студи', 'однокомнатн', 'двухкомнатн', 'трехкомнатн'],
     }
-    
-    # Локации в Сочи
-    SOCHI_LOCATIONS = [
-        'центр', 'центральный', 'адлер', 'адлерский',
-        'сириус', 'имеретинская', 'имеретинский',
-        'красная поляна', 'красная', 'поляна', 'роза хутор',
-        'эсто-садок', 'хоста', 'мацеста', 'дагомыс',
-        'лазаревское', 'лоо', 'вардане', 'головинка',
-        'у моря', 'морской', 'побережье', 'пляж'
-    ]
-    
-    # Типы недвижимости
-    PROPERTY_TYPES = {
-        'дом': 'дом',
-        'дома': 'дом',
-        'дому': 'дом',
-        'коттедж': 'дом',
-        'таунхаус': 'дом',
-        'особняк': 'дом',
-        'квартира': 'квартира',
-        'квартиру': 'квартира',
-        'квартиры': 'квартира',
-        'студия': 'квартира',
-        'студию': 'квартира',
-        'студии': 'квартира',
-        'однокомнатную': 'квартира',
-        'двухкомнатную': 'квартира',
-        'трехкомнатную': 'квартира',
-        'апартаменты': 'апартаменты',
-        'апарт': 'апартаменты',
-        'участок': 'участок',
-        'участка': 'участок',
-        'земля': 'участок',
-        'земельный': 'участок',
-        'под застройку': 'участок'
+
+    # Шаги извлечения и условия, при которых шаг может изменить лид:
+    # (группы слов, поля, после заполнения которых эти слова уже не важны)
+    EXTRACTION_STEPS = {
+        'contacts': [(['digits'], ['phone']), (['at_sign'], [])],
+        'business_info': [(['business_spheres'], ['business_sphere']),
+                          (['company_individual', 'company_team', 'company_office'], [])],
+        'automation_goals': [(['automation_goals'], ['automation_goal'])],
+        'payment_info': [(['payment_types'], ['payment_type'])],
+        'budget': [(['digits'], ['budget_min', 'budget_max'])],
+        'technical_requirements': [(['tech'], [])],
+        'time_info': [(['urgency'], ['urgency_level'])],
+        'location_info': [(['in_sochi', 'not_in_sochi', 'city_marker', 'arrival_tomorrow',
+                            'arrival_day_after_tomorrow', 'arrival_this_week'], [])],
+        'sochi_locations': [(['krasnaya_polyana', 'krasnaya_polyana_words', 'sochi_locations'], [])],
+        'property_type': [(['property_types'], [])],
+        'mortgage_bank': [(['banks', 'mortgage_approved'], [])],
+        'property_params': [(['digits', 'rooms_words', 'view_sea', 'view_mountains', 'view_park',
+                              'online_viewing_ready', 'online_viewing_refused'], [])],
+        'decision_maker': [(['decision_wife', 'decision_husband', 'decision_partner', 'decision_self',
+                             'decision_family', 'remote_deal', 'in_person_deal', 'sell_current'], [])],
     }
-    
-    BUDGET_PATTERNS = [
-        re.compile(r'до\s+(\d+)\s*(?:млн|миллион)', re.IGNORECASE),
-        re.compile(r'до\s+(\d+)\s*(?:тыс|тысяч|k)', re.IGNORECASE),
-        re.compile(r'до\s+(\d+)', re.IGNORECASE),
-        re.compile(r'(\d+)\s*(?:тысяч|тыс|k)', re.IGNORECASE),
-        re.compile(r'(\d+)\s*(?:миллион|млн|m)', re.IGNORECASE),
-        re.compile(r'(\d+)\s*(?:долларов?|\$|usd)', re.IGNORECASE),
-        re.compile(r'(\d+)\s*(?:рублей?|руб|₽)', re.IGNORECASE),
-        re.compile(r'от\s+(\d+)\s+до\s+(\d+)', re.IGNORECASE),
-        re.compile(r'(\d+)\s*-\s*(\d+)', re.IGNORECASE),
-    ]
-    
+    PLANNER: ExtractionPlanner
+
+    @classmethod
+    def apply_vocabulary(cls, vocabulary: Vocabulary):
+        """
+        Подключает словари и автомат.
+
+        Все проверки и построение плана выполняются до замены, поэтому
+        ошибка оставляет прежние словари. Замена атрибутов не прерывается
+        await, и сообщение, обрабатываемое в том же event loop, видит
+        словари целиком старыми или целиком новыми.
+        """
+        missing = [group for group in cls.PHRASE_GROUPS if group not in vocabulary.phrases]
+        if missing:
+            raise ValueError(f"В словарях нет групп фраз: {', '.join(missing)}")
+        planner = ExtractionPlanner(vocabulary.automaton, cls.EXTRACTION_STEPS)
+
+        cls.BUSINESS_SPHERES = vocabulary.business_spheres
+        cls.AUTOMATION_GOALS = vocabulary.automation_goals
+        cls.PAYMENT_TYPES = vocabulary.payment_types
+        cls.SOCHI_LOCATIONS = vocabulary.sochi_locations
+        cls.PROPERTY_TYPES = vocabulary.property_types
+        cls.TECH_KEYWORDS = vocabulary.tech_keywords
+        cls.URGENCY_KEYWORDS = vocabulary.urgency_keywords
+        cls.MORTGAGE_BANKS = vocabulary.mortgage_banks
+        cls.PHRASES = vocabulary.phrases
+        cls.STEMMED_GROUPS = vocabulary.stemmed_groups
+        cls.KEYWORD_GROUPS = vocabulary.keyword_groups
+        cls.KEYWORDS = vocabulary.automaton
+        cls.PLANNER = planner
+        cls.VOCABULARY = vocabulary
+
+    @classmethod
+    def load_vocabulary(cls, path: Optional[str] = None) -> Vocabulary:
+        """Словари из файла (по умолчанию data/extractor_vocabulary.json) с группами MARKERS"""
+        return load_vocabulary(path, extra_groups=cls.MARKERS)
+
+    @classmethod
+    def reload_vocabulary(cls, path: Optional[str] = None) -> Vocabulary:
+        """Перечитывает словари без перезапуска процесса"""
+        vocabulary = cls.load_vocabulary(path)
+        cls.apply_vocabulary(vocabulary)
+        logger.info(f"📚 Словари экстракторов v{vocabulary.version} ({vocabulary.content_hash[:8]}) подключены"
+                    f"{' из кэша' if vocabulary.from_cache else ''}")
+        return vocabulary
+
     @classmethod
     def extract_from_message(cls, message: str, current_lead: Optional[LeadData] = None) -> LeadData:
-        """Извлекает данные из сообщения"""
-        lead = current_lead or LeadData()
+        """
+        Извлекает данные из сообщения.
+
+        current_lead не изменяется: экстракторы пишут в черновик, а
+        результат - новый снимок LeadData.
+        """
+        current_lead = current_lead or LeadData()
         message_lower = message.lower()
+        hits = cls.KEYWORDS.scan(message_lower)
+        # Только шаги, которые могут что-то изменить в этом лиде
+        plan = cls.PLANNER.plan(current_lead.filled_mask, hits.groups)
+        lead = current_lead.edit()
         
         # Извлечение контактной информации
-        cls._extract_contacts(message, lead)
+        if 'contacts' in plan:
+            cls._extract_contacts(message, lead)
         
         # Извлечение имени из контекста
         cls._extract_name_from_context(message, lead)
         
         # Извлечение бизнес-информации
-        cls._extract_business_info(message_lower, lead)
+        if 'business_info' in plan:
+            cls._extract_business_info(hits, lead)
         
         # Извлечение целей покупки недвижимости
-        cls._extract_automation_goals(message_lower, lead)
+        if 'automation_goals' in plan:
+            cls._extract_automation_goals(hits, lead)
         
         # Извлечение информации об оплате
-        cls._extract_payment_info(message_lower, lead)
+        if 'payment_info' in plan:
+            cls._extract_payment_info(hits, lead)
         
         # Извлечение бюджета
-        cls._extract_budget(message_lower, lead)
+        if 'budget' in plan:
+            cls._extract_budget(message_lower, lead)
         
         # Извлечение технических требований
-        cls._extract_technical_requirements(message_lower, lead)
+        if 'technical_requirements' in plan:
+            cls._extract_technical_requirements(hits, lead)
         
         # Извлечение временной информации
-        cls._extract_time_info(message_lower, lead)
+        if 'time_info' in plan:
+            cls._extract_time_info(hits, lead)
         
         # НОВЫЕ ИЗВЛЕЧЕНИЯ
         # Извлечение города и локации (передаем оригинальное сообщение)
-        cls._extract_location_info(message, lead)
+        if 'location_info' in plan:
+            cls._extract_location_info(message, hits, lead)
         
         # Извлечение локаций Сочи
-        cls._extract_sochi_locations(message_lower, lead)
+        if 'sochi_locations' in plan:
+            cls._extract_sochi_locations(hits, lead)
         
         # Извлечение типа недвижимости
-        cls._extract_property_type(message_lower, lead)
+        if 'property_type' in plan:
+            cls._extract_property_type(hits, lead)
         
         # Извлечение банка для ипотеки
-        cls._extract_mortgage_bank(message_lower, lead)
+        if 'mortgage_bank' in plan:
+            cls._extract_mortgage_bank(hits, lead)
         
         # Извлечение дополнительных параметров недвижимости
-        cls._extract_property_params(message, lead)
+        if 'property_params' in plan:
+            cls._extract_property_params(message, hits, lead)
         
         # Извлечение информации о принятии решений
-        cls._extract_decision_maker(message_lower, lead)
+        if 'decision_maker' in plan:
+            cls._extract_decision_maker(hits, lead)
         
         # Обновление времени
         lead.updated_at = datetime.now()
         
-        return lead
-    
+        return lead.freeze()
+
     @classmethod
-    def _extract_contacts(cls, message: str, lead: LeadData):
+    def extract_many(cls, messages: Iterable[Tuple[str, str]],
+                     leads: Optional[Dict[str, LeadData]] = None,
+                     track_state: bool = False,
+                     on_transition: Optional[Callable[[str, DialogState, DialogState], None]] = None
+                     ) -> Dict[str, LeadData]:
+        """
+        Пакетное извлечение из потока сообщений (session_id, текст).
+
+        Сообщения применяются по порядку к лиду своей сессии; сессии могут
+        чередоваться. Автомат, регулярные выражения и планы общие для всех
+        сообщений.
+
+        Args:
+            messages: Пары (session_id, текст сообщения)
+            leads: Начальные данные лидов по сессиям (не изменяются)
+            track_state: Переводить состояние диалога и статус квалификации,
+                как MemoryService.process_message
+            on_transition: Вызывается при смене состояния (session_id, было, стало)
+
+        Returns:
+            Итоговые данные лидов всех встретившихся сессий
+        """
+        result: Dict[str, LeadData] = dict(leads) if leads else {}
+        for session_id, message in messages:
+            current_lead = result.get(session_id) or LeadData()
+            lead = cls.extract_from_message(message, current_lead)
+            if track_state:
+                current_state = current_lead.current_dialog_state
+                new_state = DialogStateExtractor.determine_state(message, current_state, lead)
+                lead = lead.replace(current_dialog_state=new_state,
+                                    qualification_status=DialogStateExtractor.calculate_qualification_status(lead))
+                if on_transition is not None and new_state != current_state:
+                    on_transition(session_id, current_state, new_state)
+            result[session_id] = lead
+        return result
+
+    @classmethod
+    def _extract_contacts(cls, message: str, lead: LeadDraft):
         """Извлечение контактной информации"""
         # Телефон
         if not lead.phone:
@@ -204,7 +307,7 @@ class LeadDataExtractor:
         pass
     
     @classmethod
-    def _extract_name_from_context(cls, message: str, lead: LeadData):
+    def _extract_name_from_context(cls, message: str, lead: LeadDraft):
         """Извлечение имени из контекста диалога - ОТКЛЮЧЕНО"""
         # ОТКЛЮЧАЕМ автоматическое извлечение имени, так как оно дает ложные срабатывания
         # "Красная поляна" не должно быть именем "Красная"
@@ -212,143 +315,110 @@ class LeadDataExtractor:
         pass
     
     @classmethod
-    def _extract_business_info(cls, message_lower: str, lead: LeadData):
+    def _extract_business_info(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение информации о бизнесе"""
         # Сфера бизнеса
         if not lead.business_sphere:
-            for keyword, sphere in cls.BUSINESS_SPHERES.items():
-                if keyword in message_lower:
-                    lead.business_sphere = sphere
-                    break
+            keyword = hits.first('business_spheres')
+            if keyword:
+                lead.business_sphere = cls.BUSINESS_SPHERES[keyword]
         
         # Размер компании (эвристика)
-        if 'один' in message_lower or 'сам' in message_lower or 'ип' in message_lower:
+        if hits.any('company_individual'):
             lead.company_size = 'individual'
-        elif 'команда' in message_lower or 'сотрудник' in message_lower:
+        elif hits.any('company_team'):
             lead.company_size = 'small_team'
-        elif 'офис' in message_lower or 'компания' in message_lower:
+        elif hits.any('company_office'):
             lead.company_size = 'company'
     
     @classmethod 
-    def _extract_automation_goals(cls, message_lower: str, lead: LeadData):
+    def _extract_automation_goals(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение целей покупки недвижимости"""
         if not lead.automation_goal:
-            for keyword, goal in cls.AUTOMATION_GOALS.items():
-                if keyword in message_lower:
-                    lead.automation_goal = goal
-                    break
+            keyword = hits.first('automation_goals')
+            if keyword:
+                lead.automation_goal = cls.AUTOMATION_GOALS[keyword]
     
     @classmethod
-    def _extract_payment_info(cls, message_lower: str, lead: LeadData):
+    def _extract_payment_info(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение информации об оплате"""
         if not lead.payment_type:
-            for keyword, payment in cls.PAYMENT_TYPES.items():
-                if keyword in message_lower:
-                    lead.payment_type = payment
-                    break
+            keyword = hits.first('payment_types')
+            if keyword:
+                lead.payment_type = cls.PAYMENT_TYPES[keyword]
     
     @classmethod
-    def _extract_budget(cls, message_lower: str, lead: LeadData):
+    def _extract_budget(cls, message_lower: str, lead: LeadDraft):
         """Извлечение информации о бюджете"""
         if lead.budget_min and lead.budget_max:
             return  # Бюджет уже определен
         
-        for pattern in cls.BUDGET_PATTERNS:
-            match = pattern.search(message_lower)
-            if match:
-                if len(match.groups()) == 1:  # Одно число
-                    amount = int(match.group(1))
-                    
-                    # Конвертируем в рубли если нужно
-                    if 'тыс' in match.group(0) or 'k' in match.group(0).lower():
-                        amount = amount * 1000
-                    elif 'млн' in match.group(0) or 'миллион' in match.group(0) or 'm' in match.group(0).lower():
-                        amount = amount * 1000000
-                    elif '$' in match.group(0) or 'usd' in match.group(0).lower() or 'доллар' in match.group(0):
-                        amount = amount * 90  # Примерный курс доллара
-                    
-                    if 'до' in match.group(0):
-                        lead.budget_max = amount
-                    else:
-                        lead.budget_min = amount
-                elif len(match.groups()) == 2:  # Диапазон
-                    min_amount = int(match.group(1))
-                    max_amount = int(match.group(2))
-                    
-                    # Конвертируем в рубли
-                    if 'тыс' in match.group(0) or 'k' in match.group(0).lower():
-                        min_amount = min_amount * 1000
-                        max_amount = max_amount * 1000
-                    elif 'млн' in match.group(0) or 'миллион' in match.group(0) or 'm' in match.group(0).lower():
-                        min_amount = min_amount * 1000000
-                        max_amount = max_amount * 1000000
-                    
-                    lead.budget_min = min_amount
-                    lead.budget_max = max_amount
-                break
+        match = cls.BUDGET_PATTERNS.search(message_lower)
+        if match:
+            text = match.text
+            if len(match.groups) == 1:  # Одно число
+                amount = int(match.groups[0])
+                
+                # Конвертируем в рубли если нужно
+                if 'тыс' in text or 'k' in text:
+                    amount = amount * 1000
+                elif 'млн' in text or 'миллион' in text or 'm' in text:
+                    amount = amount * 1000000
+                elif '$' in text or 'usd' in text or 'доллар' in text:
+                    amount = amount * 90  # Примерный курс доллара
+                
+                if 'до' in text:
+                    lead.budget_max = amount
+                else:
+                    lead.budget_min = amount
+            else:  # Диапазон
+                min_amount = int(match.groups[0])
+                max_amount = int(match.groups[1])
+                
+                # Конвертируем в рубли
+                if 'тыс' in text or 'k' in text:
+                    min_amount = min_amount * 1000
+                    max_amount = max_amount * 1000
+                elif 'млн' in text or 'миллион' in text or 'm' in text:
+                    min_amount = min_amount * 1000000
+                    max_amount = max_amount * 1000000
+                
+                lead.budget_min = min_amount
+                lead.budget_max = max_amount
     
     @classmethod
-    def _extract_technical_requirements(cls, message_lower: str, lead: LeadData):
+    def _extract_technical_requirements(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение технических требований"""
-        tech_keywords = {
-            'crm': 'CRM интеграция',
-            'сайт': 'Интеграция с сайтом',
-            'instagram': 'Instagram',
-            'whatsapp': 'WhatsApp',
-            'telegram': 'Telegram',
-            'email': 'Email рассылки',
-            'чат-бот': 'Чат-бот',
-            'бот': 'Чат-бот',
-            'автоответчик': 'Автоответчик',
-            'воронка': 'Воронка продаж'
-        }
-        
-        for keyword, requirement in tech_keywords.items():
-            if keyword in message_lower and requirement not in lead.technical_requirements:
-                lead.technical_requirements.append(requirement)
+        for keyword in hits.ordered('tech'):
+            requirement = cls.TECH_KEYWORDS[keyword]
+            if requirement not in lead.technical_requirements:
+                lead.technical_requirements += (requirement,)
     
     @classmethod
-    def _extract_time_info(cls, message_lower: str, lead: LeadData):
+    def _extract_time_info(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение временной информации"""
         # Срочность
-        urgency_keywords = {
-            'срочно': 'high',
-            'быстро': 'high', 
-            'асап': 'high',
-            'завтра': 'high',
-            'сегодня': 'high',
-            'на неделе': 'medium',
-            'в течение месяца': 'medium',
-            'не спешу': 'low',
-            'подумаю': 'low'
-        }
-        
         if not lead.urgency_level:
-            for keyword, urgency in urgency_keywords.items():
-                if keyword in message_lower:
-                    lead.urgency_level = urgency
-                    break
+            keyword = hits.first('urgency')
+            if keyword:
+                lead.urgency_level = cls.URGENCY_KEYWORDS[keyword]
     
     @classmethod
-    def _extract_location_info(cls, message: str, lead: LeadData):
+    def _extract_location_info(cls, message: str, hits: KeywordHits, lead: LeadDraft):
         """Извлечение информации о городе и локации клиента"""
-        message_lower = message.lower()
-        
         # Проверяем, находится ли в Сочи
-        if any(word in message_lower for word in ['в сочи', 'нахожусь в сочи', 'живу в сочи', 'я в сочи']):
+        if hits.any('in_sochi'):
             lead.is_in_sochi = True
             lead.current_location = 'Сочи'
             
             # Проверяем, местный ли
-            if any(word in message_lower for word in ['живу в сочи', 'местный', 'проживаю в сочи']):
+            if hits.any('local'):
                 lead.is_local = True
-        elif any(word in message_lower for word in ['не в сочи', 'из москвы', 'из питера', 'из казани']):
+        elif hits.any('not_in_sochi'):
             lead.is_in_sochi = False
         
         # Извлекаем город откуда клиент - используем ОРИГИНАЛЬНОЕ сообщение для сохранения регистра
-        # Паттерн: "из Волгодонск", "из Москвы" и т.д.
-        city_pattern = re.compile(r'из\s+([А-Яа-яЁё]+)', re.IGNORECASE)
-        match = city_pattern.search(message)
+        match = cls.CITY_PATTERN.search(message)
         if match:
             city = match.group(1).strip()
             # Не сохраняем Сочи как город клиента
@@ -356,31 +426,29 @@ class LeadDataExtractor:
                 lead.city = city.title()
         
         # Извлекаем дату приезда
-        if 'завтра' in message_lower:
+        if hits.any('arrival_tomorrow'):
             lead.urgency_date = 'завтра'
-        elif 'послезавтра' in message_lower or 'после завтра' in message_lower:
+        elif hits.any('arrival_day_after_tomorrow'):
             lead.urgency_date = 'послезавтра'
-        elif 'на неделе' in message_lower:
+        elif hits.any('arrival_this_week'):
             lead.urgency_date = 'на этой неделе'
     
     @classmethod
-    def _extract_sochi_locations(cls, message_lower: str, lead: LeadData):
+    def _extract_sochi_locations(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение предпочитаемых локаций в Сочи"""
         found_locations = []
         
         # Проверяем особые случаи сначала (все склонения Красной Поляны)
-        if any(phrase in message_lower for phrase in [
-            'красная поляна', 'красную поляну', 'красной поляне', 'красной поляны'
-        ]):
+        if hits.any('krasnaya_polyana'):
             found_locations.append('Красная Поляна')
-        elif 'красная' in message_lower and 'поляна' in message_lower:
+        elif 'красная' in hits and 'поляна' in hits:
             found_locations.append('Красная Поляна')
-        elif 'красной' in message_lower and 'поляне' in message_lower:
+        elif 'красной' in hits and 'поляне' in hits:
             found_locations.append('Красная Поляна')
         
         # Проверяем остальные локации
-        for location in cls.SOCHI_LOCATIONS:
-            if location in message_lower and location not in ['красная', 'поляна']:  # Исключаем отдельные слова
+        for location in hits.ordered('sochi_locations'):
+            if location not in ['красная', 'поляна', 'красная поляна']:  # Красная Поляна добавлена выше
                 # Нормализуем название
                 if location == 'центр' or location == 'центральный':
                     found_locations.append('Центр')
@@ -396,148 +464,96 @@ class LeadDataExtractor:
         # Добавляем уникальные локации
         for loc in found_locations:
             if loc not in lead.preferred_locations:
-                lead.preferred_locations.append(loc)
+                lead.preferred_locations += (loc,)
     
     @classmethod
-    def _extract_property_type(cls, message_lower: str, lead: LeadData):
+    def _extract_property_type(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение типа недвижимости"""
-        for word, prop_type in cls.PROPERTY_TYPES.items():
-            if word in message_lower:
-                lead.property_type = prop_type
-                break
+        word = hits.first('property_types')
+        if word:
+            lead.property_type = cls.PROPERTY_TYPES[word]
     
     @classmethod
-    def _extract_mortgage_bank(cls, message_lower: str, lead: LeadData):
+    def _extract_mortgage_bank(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение банка для ипотеки"""
-        # Список популярных банков
-        banks = ['сбер', 'втб', 'альфа', 'тинькофф', 'газпром', 'россельхоз', 'дом.рф', 'райффайзен']
-        
-        for bank in banks:
-            if bank in message_lower:
-                lead.mortgage_bank = bank.upper() if len(bank) <= 3 else bank.capitalize()
-                break
+        bank = hits.first('banks')
+        if bank:
+            lead.mortgage_bank = bank.upper() if len(bank) <= 3 else bank.capitalize()
         
         # Проверяем, оформлена ли ипотека
-        if any(word in message_lower for word in ['оформлена', 'одобрена', 'есть одобрение']):
+        if hits.any('mortgage_approved'):
             lead.comments += ' Ипотека уже оформлена/одобрена.'
     
     @classmethod 
-    def _extract_property_params(cls, message: str, lead: LeadData):
+    def _extract_property_params(cls, message: str, hits: KeywordHits, lead: LeadDraft):
         """Извлечение параметров недвижимости: комнаты, площадь, вид"""
         message_lower = message.lower()
         
         # Извлечение количества комнат
-        rooms_patterns = [
-            r'(\d)\s*комнат',
-            r'(\d)\s*к',
-            r'(\d)-комнат',
-            r'(\d)к',
-            r'студи[яю]',  # студия
-            r'однокомнатн',  # однокомнатная
-            r'двухкомнатн',  # двухкомнатная
-            r'трехкомнатн',  # трехкомнатная
-        ]
-        
-        for pattern in rooms_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                if 'студи' in match.group(0):
-                    lead.rooms_count = 0  # студия
-                elif 'однокомнат' in match.group(0):
-                    lead.rooms_count = 1
-                elif 'двухкомнат' in match.group(0):
-                    lead.rooms_count = 2
-                elif 'трехкомнат' in match.group(0):
-                    lead.rooms_count = 3
-                else:
-                    lead.rooms_count = int(match.group(1))
-                break
+        match = cls.ROOMS_PATTERNS.search(message_lower)
+        if match:
+            if match.name in cls.ROOMS_BY_WORD:
+                lead.rooms_count = cls.ROOMS_BY_WORD[match.name]  # студия - 0
+            else:
+                lead.rooms_count = int(match.groups[0])
         
         # Извлечение площади
-        area_patterns = [
-            r'(\d+)\s*кв\.?\s*м',
-            r'(\d+)\s*квадрат',
-            r'(\d+)\s*метр',
-            r'площад[ьь]\s*(\d+)',
-            r'от\s*(\d+)\s*до\s*(\d+)\s*кв',
-        ]
-        
-        for pattern in area_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                if len(match.groups()) == 2:  # диапазон
-                    lead.area_min = int(match.group(1))
-                    lead.area_max = int(match.group(2))
+        match = cls.AREA_PATTERNS.search(message_lower)
+        if match:
+            if len(match.groups) == 2:  # диапазон
+                lead.area_min = int(match.groups[0])
+                lead.area_max = int(match.groups[1])
+            else:
+                area = int(match.groups[0])
+                if 'от' in match.text:
+                    lead.area_min = area
                 else:
-                    area = int(match.group(1))
-                    if 'от' in match.group(0):
-                        lead.area_min = area
-                    else:
-                        lead.area_max = area
-                break
+                    lead.area_max = area
         
         # Извлечение предпочтений по виду
-        if any(word in message_lower for word in ['море', 'морской', 'на море', 'видом на море']):
+        if hits.any('view_sea'):
             lead.view_preference = 'море'
-        elif any(word in message_lower for word in ['горы', 'горный', 'на горы', 'видом на горы']):
+        elif hits.any('view_mountains'):
             lead.view_preference = 'горы'
-        elif any(word in message_lower for word in ['парк', 'зелень', 'лес']):
+        elif hits.any('view_park'):
             lead.view_preference = 'парк'
         
         # Готовность к онлайн-показу
-        if any(phrase in message_lower for phrase in [
-            'онлайн показ', 'онлайн-показ', 'удаленно посмотр', 'по видеосвязи', 
-            'через zoom', 'через скайп', 'виртуальный показ'
-        ]):
+        if hits.any('online_viewing_ready'):
             lead.online_viewing_ready = True
-        elif any(phrase in message_lower for phrase in [
-            'только вживую', 'только лично', 'не хочу онлайн'
-        ]):
+        elif hits.any('online_viewing_refused'):
             lead.online_viewing_ready = False
     
     @classmethod
-    def _extract_decision_maker(cls, message_lower: str, lead: LeadData):
+    def _extract_decision_maker(cls, hits: KeywordHits, lead: LeadDraft):
         """Извлечение информации о принятии решений"""
         
         # С кем принимает решение
-        if any(phrase in message_lower for phrase in [
-            'с женой', 'с супругой', 'жена решает', 'супруга'
-        ]):
+        if hits.any('decision_wife'):
             lead.decision_maker = 'супруга'
-        elif any(phrase in message_lower for phrase in [
-            'с мужем', 'с супругом', 'муж решает', 'супруг'
-        ]):
+        elif hits.any('decision_husband'):
             lead.decision_maker = 'супруг'
-        elif any(phrase in message_lower for phrase in [
-            'с партнер', 'с компаньон', 'с бизнес-партнер'
-        ]):
+        elif hits.any('decision_partner'):
             lead.decision_maker = 'партнер'
-        elif any(phrase in message_lower for phrase in [
-            'сам решаю', 'сама решаю', 'решаю один', 'решаю сам'
-        ]):
+        elif hits.any('decision_self'):
             lead.decision_maker = 'сам'
-        elif any(phrase in message_lower for phrase in [
-            'с семьей', 'семейное решение', 'всей семьей'
-        ]):
+        elif hits.any('decision_family'):
             lead.decision_maker = 'семья'
         
         # Нужна ли удаленная сделка
-        if any(phrase in message_lower for phrase in [
-            'удаленно', 'дистанционно', 'без приезда', 'через почту'
-        ]):
+        if hits.any('remote_deal'):
             lead.need_remote_deal = True
-        elif any(phrase in message_lower for phrase in [
-            'только лично', 'приеду оформлять', 'лично подпишу'
-        ]):
+        elif hits.any('in_person_deal'):
             lead.need_remote_deal = False
         
         # Нужна ли продажа текущей недвижимости
-        if any(phrase in message_lower for phrase in [
-            'продать свою', 'продажа квартир', 'продать дом', 'сначала продать'
-        ]):
+        if hits.any('sell_current'):
             lead.need_to_sell_current = True
 
 
+LeadDataExtractor.apply_vocabulary(LeadDataExtractor.load_vocabulary())
+
+
 class DialogStateExtractor:
     """Экстрактор состояния диалога"""
     
@@ -572,13 +588,55 @@ class DialogStateExtractor:
         ]
     }
     
+    # Таблица переходов для НЕДВИЖИМОСТИ СОЧИ по инструкции. Из каждого
+    # состояния - одна строка вперед; без выполненного условия состояние
+    # не меняется, S8_ACTION - конечное
+    TRANSITIONS = {
+        # Ответил на "для себя/инвестиции" или упомянул город - к локации
+        DialogState.S0_GREETING: [
+            Transition(DialogState.S1_BUSINESS,
+                       keywords=['инвестиц', 'пмж', 'себя', 'проживан', 'из ', 'сочи']),
+        ],
+        # Указал город или где находится (или назвал цель) - к цели
+        DialogState.S1_BUSINESS: [
+            Transition(DialogState.S2_GOAL, fields=['city'], defined=['is_in_sochi'],
+                       keywords=STATE_PATTERNS[DialogState.S2_GOAL]),
+        ],
+        # Цель покупки определена - к оплате
+        DialogState.S2_GOAL: [
+            Transition(DialogState.S3_PAYMENT, fields=['automation_goal']),
+        ],
+        # Способ оплаты определен - к локации/требованиям
+        DialogState.S3_PAYMENT: [
+            Transition(DialogState.S4_REQUIREMENTS, fields=['payment_type'],
+                       keywords=['ипотек', 'наличн', 'рассроч']),
+        ],
+        # Локация ИЛИ тип недвижимости определены - к бюджету
+        DialogState.S4_REQUIREMENTS: [
+            Transition(DialogState.S5_BUDGET, fields=['preferred_locations', 'property_type'],
+                       keywords=['красная', 'сириус', 'адлер', 'дом', 'квартир', 'апартамент', 'участок']),
+        ],
+        # Бюджет определен - к срочности
+        DialogState.S5_BUDGET: [
+            Transition(DialogState.S6_URGENCY, fields=['budget_min', 'budget_max']),
+        ],
+        # Срочность определена - к опыту
+        DialogState.S6_URGENCY: [
+            Transition(DialogState.S7_EXPERIENCE, fields=['urgency_date', 'urgency_level']),
+        ],
+        # Опыт определен или клиент готов к показу/встрече - к действию
+        DialogState.S7_EXPERIENCE: [
+            Transition(DialogState.S8_ACTION, fields=['sochi_experience'],
+                       keywords=STATE_PATTERNS[DialogState.S8_ACTION]),
+        ],
+    }
+
+    MACHINE = DialogStateMachine(TRANSITIONS)
+
     @classmethod
     def determine_state(cls, message: str, current_state: DialogState, lead_data: LeadData) -> DialogState:
         """Определяет следующее состояние диалога"""
-        message_lower = message.lower()
-
-        # Логика переходов между состояниями
-        new_state = cls._get_next_state(message_lower, current_state, lead_data)
+        new_state = cls.MACHINE.next_state(message, current_state, lead_data)
 
         # Диагностическое логирование для отслеживания переходов
         if new_state != current_state:
@@ -590,94 +648,7 @@ class DialogStateExtractor:
 
         return new_state
     
-    @classmethod
-    def _get_next_state(cls, message: str, current_state: DialogState, lead: LeadData) -> DialogState:
-        """Определяет следующее состояние для НЕДВИЖИМОСТИ СОЧИ"""
-        
-        # Логика для недвижимости Сочи по инструкции
-        if current_state == DialogState.S0_GREETING:
-            # Если ответил на "для себя/инвестиции" или упомянул город - переходим к локации
-            if any(word in message for word in ['инвестиц', 'пмж', 'себя', 'проживан', 'из ', 'сочи']):
-                return DialogState.S1_BUSINESS
-            return DialogState.S0_GREETING
-        
-        elif current_state == DialogState.S1_BUSINESS:
-            # Если указал город или где находится - переходим к цели
-            if lead.city or lead.is_in_sochi is not None:
-                return DialogState.S2_GOAL
-            if any(word in message for word in cls.STATE_PATTERNS[DialogState.S2_GOAL]):
-                return DialogState.S2_GOAL
-            return DialogState.S1_BUSINESS
-        
-        elif current_state == DialogState.S2_GOAL:
-            # Если цель покупки определена - переходим к оплате
-            if lead.automation_goal:
-                return DialogState.S3_PAYMENT
-            return DialogState.S2_GOAL
-        
-        elif current_state == DialogState.S3_PAYMENT:
-            # Если способ оплаты определен - переходим к локации/требованиям
-            if lead.payment_type or any(word in message for word in ['ипотек', 'наличн', 'рассроч']):
-                return DialogState.S4_REQUIREMENTS
-            return DialogState.S3_PAYMENT
-        
-        elif current_state == DialogState.S4_REQUIREMENTS:
-            # Если локация ИЛИ тип недвижимости определены - переходим к бюджету
-            if (lead.preferred_locations or 
-                getattr(lead, 'property_type', None) or 
-                any(word in message for word in ['красная', 'сириус', 'адлер', 'дом', 'квартир', 'апартамент', 'участок'])):
-                return DialogState.S5_BUDGET
-            return DialogState.S4_REQUIREMENTS
-        
-        elif current_state == DialogState.S5_BUDGET:
-            # Если бюджет определен - переходим к срочности
-            if lead.budget_min or lead.budget_max:
-                return DialogState.S6_URGENCY
-            return DialogState.S5_BUDGET
-        
-        elif current_state == DialogState.S6_URGENCY:
-            # Если срочность определена - переходим к опыту или действию
-            if lead.urgency_date or lead.urgency_level:
-                return DialogState.S7_EXPERIENCE
-            return DialogState.S6_URGENCY
-        
-        elif current_state == DialogState.S7_EXPERIENCE:
-            # После опыта - переходим к действию (показ/встреча)
-            if any(word in message for word in cls.STATE_PATTERNS[DialogState.S8_ACTION]):
-                return DialogState.S8_ACTION
-            # Если опыт определен - можем переходить к действию
-            if lead.sochi_experience:
-                return DialogState.S8_ACTION
-            return DialogState.S7_EXPERIENCE
-        
-        elif current_state == DialogState.S8_ACTION:
-            # Остаемся в состоянии действия/показа
-            return DialogState.S8_ACTION
-        
-        # По умолчанию остаемся в текущем состоянии
-        return current_state
-    
     @classmethod
     def calculate_qualification_status(cls, lead: LeadData) -> ClientType:
         """Вычисляет статус квалификации для НЕДВИЖИМОСТИ: Деньги + Срочность + Понимание запроса"""
-        score = 0
-        
-        # Деньги (бюджет определен или способ оплаты)
-        if lead.budget_min or lead.budget_max or lead.payment_type:
-            score += 1
-        
-        # Срочность (готов быстро или указал дату приезда)
-        if lead.urgency_date or lead.ready_for_quick_decision or lead.urgency_level in ['high', 'medium']:
-            score += 1
-        
-        # Понимание запроса (цель покупки + тип недвижимости + локация)
-        if lead.automation_goal and (lead.property_type or lead.preferred_locations):
-            score += 1
-        
-        # Определяем тип клиента
-        if score == 3:
-            return ClientType.HOT     # 3 из 3 критериев
-        elif score == 2:
-            return ClientType.WARM    # 2 из 3 критериев
-        else:
-            return ClientType.COLD    # 1 из 3 критериев
\ No newline at end of file
+        return lead_scoring.qualification_status(lead)
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Локальный кольцевой буфер истории диалога по сессиям
+"""
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryRecord:
+    """Сообщение истории в компактном виде"""
+
+    __slots__ = ('role', 'content', 'timestamp', 'metadata', 'speaker_name')
+
+    def __init__(self, role: str, content: str, timestamp: Any = None,
+                 metadata: Optional[Dict[str, Any]] = None, speaker_name: Optional[str] = None):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+        self.metadata = metadata
+        self.speaker_name = speaker_name
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Формат MemoryService.get_dialog_history"""
+        timestamp = self.timestamp
+        if isinstance(timestamp, float):
+            timestamp = datetime.fromtimestamp(timestamp).isoformat()
+        return {
+            'role': self.role,
+            'content': self.content,
+            'timestamp': timestamp,
+            'metadata': self.metadata or {},
+            'speaker_name': self.speaker_name
+        }
+
+
+class SessionHistory:
+    """История одной сессии фиксированной емкости"""
+
+    __slots__ = ('records',)
+
+    def __init__(self, capacity: int):
+        self.records: Deque[HistoryRecord] = deque(maxlen=capacity)
+
+
+class HistoryCache:
+    """
+    Последние сообщения сессий в памяти процесса.
+
+    История сессии заполняется нашими же записями и один раз прогревается
+    из хранилища при первом обращении. После прогрева чтение истории не
+    требует сетевых запросов. Число сессий ограничено: давно не
+    использованные вытесняются и при следующем обращении прогреваются заново.
+    """
+
+    def __init__(self, capacity_per_session: int = 20, max_sessions: int = 10000):
+        self.capacity_per_session = capacity_per_session
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+
+        self.hits = 0
+        self.warmups = 0
+
+    def is_warm(self, session_id: str) -> bool:
+        """Есть ли прогретая история сессии"""
+        return session_id in self._sessions
+
+    def warm(self, session_id: str, messages: Iterable[Dict[str, Any]]):
+        """Заполняет историю сессии сообщениями из хранилища (старые первыми)"""
+        history = self._touch(session_id)
+        history.records.clear()
+        for msg in messages:
+            history.records.append(HistoryRecord(
+                role=msg.get('role'),
+                content=msg.get('content', ''),
+                timestamp=msg.get('timestamp'),
+                metadata=msg.get('metadata'),
+                speaker_name=msg.get('speaker_name')
+            ))
+        self.warmups += 1
+
+    def mark_new(self, session_id: str):
+        """Новая сессия: истории в хранилище нет, прогрев не нужен"""
+        self._touch(session_id)
+
+    def append(self, session_id: str, role: str, content: str, timestamp: float,
+               metadata: Optional[Dict[str, Any]] = None, speaker_name: Optional[str] = None):
+        """Добавляет записанное нами сообщение"""
+        history = self._sessions.get(session_id)
+        if history is None:
+            # Без прогрева история была бы неполной - не заводим ее
+            return
+        history.records.append(HistoryRecord(role, content, timestamp, metadata, speaker_name))
+
+    def discard(self, session_id: str):
+        """Удаляет историю сессии"""
+        self._sessions.pop(session_id, None)
+
+    def get(self, session_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Последние limit сообщений или None, если история не прогрета"""
+        history = self._sessions.get(session_id)
+        if history is None:
+            return None
+        self._sessions.move_to_end(session_id)
+        self.hits += 1
+        return [record.to_dict() for record in list(history.records)[-limit:]]
+
+    def _touch(self, session_id: str) -> SessionHistory:
+        history = self._sessions.get(session_id)
+        if history is None:
+            history = SessionHistory(self.capacity_per_session)
+            self._sessions[session_id] = history
+            if len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.debug(f"🧹 История сессии {evicted} вытеснена из локального буфера")
+        else:
+            self._sessions.move_to_end(session_id)
+        return history
+
+    def __len__(self) -> int:
+        return len(self._sessions)
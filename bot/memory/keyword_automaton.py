@@ -0,0 +1,216 @@
+"""
+Поиск множества ключевых слов за один проход (Aho–Corasick)
+"""
+from collections import deque
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+
+class KeywordAutomaton:
+    """
+    Автомат Aho–Corasick над группами ключевых слов (имя -> слова в порядке
+    приоритета). Находит то же, что `keyword in text` по каждому слову, за
+    один проход по тексту.
+
+    Группы из stemmed_groups дополнительно ищутся по основам слов (stemmer -
+    russian_stemmer.stem_text); результат - исходное слово словаря.
+    """
+
+    def __init__(self, groups: Dict[str, Sequence[str]], stemmed_groups: Sequence[str] = (),
+                 stemmer: Optional[Callable[[str], str]] = None):
+        # Приоритет слова в группе: первое подходящее слово группы выигрывает
+        self._ranks: Dict[str, Dict[str, int]] = {}
+        self._groups: Dict[str, List[str]] = {}
+        # Бит группы в KeywordHits.groups
+        self._group_bits: Dict[str, int] = {}
+        # Шаблон -> (слова словаря, маска групп)
+        patterns: Dict[str, Tuple[Set[str], int]] = {}
+        stem_patterns: Dict[str, Tuple[Set[str], int]] = {}
+        for name, words in groups.items():
+            ranks: Dict[str, int] = {}
+            for word in words:
+                ranks.setdefault(word, len(ranks))
+            bit = 1 << len(self._group_bits)
+            self._ranks[name] = ranks
+            self._groups[name] = list(ranks)
+            self._group_bits[name] = bit
+            stems: Set[str] = set()
+            for word in ranks:
+                _add_pattern(patterns, word, word, bit)
+                if name in stemmed_groups:
+                    # Основа относится к первому слову группы с этой основой:
+                    # 'имеретинская' и 'имеретинский' - одна локация
+                    word_stem = stemmer(word)
+                    if word_stem not in stems:
+                        stems.add(word_stem)
+                        _add_pattern(stem_patterns, word_stem, word, bit)
+
+        self._stemmer = stemmer if stem_patterns else None
+        self._trie, self._delta = _compile(patterns)
+        self._stem_trie, self._stem_delta = _compile(stem_patterns)
+        self._outputs, self._output_groups = self._trie[3:]
+        self._stem_outputs, self._stem_output_groups = self._stem_trie[3:]
+
+    def to_tables(self) -> tuple:
+        """
+        Таблицы автомата из встроенных типов - для marshal/pickle (без
+        стеммера). Сохраняется бор с суффиксными ссылками, а не полная
+        таблица переходов: она в десятки раз больше и быстрее
+        восстанавливается заново, чем читается.
+        """
+        return (self._ranks, self._groups, self._group_bits,
+                self._trie, self._stem_trie, self._stemmer is not None)
+
+    @classmethod
+    def from_tables(cls, tables: tuple, stemmer: Optional[Callable[[str], str]] = None) -> 'KeywordAutomaton':
+        """
+        Автомат из таблиц to_tables() без построения бора и стемминга
+        словарей. stemmer должен быть тем же, с которым автомат строился.
+        """
+        automaton = cls.__new__(cls)
+        (automaton._ranks, automaton._groups, automaton._group_bits,
+         automaton._trie, automaton._stem_trie, stemmed) = tables
+        if stemmed and stemmer is None:
+            raise ValueError("Автомат построен с поиском по основам, нужен stemmer")
+        automaton._stemmer = stemmer if stemmed else None
+        automaton._delta = _expand(automaton._trie)
+        automaton._stem_delta = _expand(automaton._stem_trie)
+        automaton._outputs, automaton._output_groups = automaton._trie[3:]
+        automaton._stem_outputs, automaton._stem_output_groups = automaton._stem_trie[3:]
+        return automaton
+
+    @property
+    def states(self) -> int:
+        return len(self._delta) + (len(self._stem_delta) if self._stemmer else 0)
+
+    def group_mask(self, *names: str) -> int:
+        """Маска групп для сравнения с KeywordHits.groups"""
+        mask = 0
+        for name in names:
+            mask |= self._group_bits[name]
+        return mask
+
+    def scan(self, text: str) -> 'KeywordHits':
+        """Все ключевые слова, входящие в text (и по основам - для stemmed_groups)"""
+        found: Set[str] = set()
+        groups = _run(self._delta, self._outputs, self._output_groups, text, found)
+        if self._stemmer is not None:
+            groups |= _run(self._stem_delta, self._stem_outputs, self._stem_output_groups,
+                           self._stemmer(text), found)
+        return KeywordHits(self, found, groups)
+
+
+def _add_pattern(patterns: Dict[str, Tuple[Set[str], int]], pattern: str, word: str, bit: int):
+    words, mask = patterns.get(pattern, (set(), 0))
+    words.add(word)
+    patterns[pattern] = (words, mask | bit)
+
+
+def _compile(patterns: Dict[str, Tuple[Set[str], int]]) -> Tuple[tuple, List[Dict[str, int]]]:
+    """
+    Бор автомата (переходы бора, суффиксные ссылки, вершины в порядке BFS,
+    слова и маски групп вершин) и полная таблица переходов
+    """
+    # Бор: переходы и шаблоны, заканчивающиеся в вершине
+    transitions: List[Dict[str, int]] = [{}]
+    terminals: List[List[str]] = [[]]
+    for pattern in patterns:
+        state = 0
+        for char in pattern:
+            next_state = transitions[state].get(char)
+            if next_state is None:
+                next_state = len(transitions)
+                transitions[state][char] = next_state
+                transitions.append({})
+                terminals.append([])
+            state = next_state
+        terminals[state].append(pattern)
+
+    outputs: List[Set[str]] = [set() for _ in transitions]
+    output_groups: List[int] = [0] * len(transitions)
+    for state, ending in enumerate(terminals):
+        for pattern in ending:
+            words, mask = patterns[pattern]
+            outputs[state] |= words
+            output_groups[state] |= mask
+
+    # Суффиксные ссылки в порядке BFS; переход из вершины по символу без
+    # ребра бора берется у вершины по суффиксной ссылке (уже посчитанной)
+    fail = [0] * len(transitions)
+    order = [0]
+    delta: List[Dict[str, int]] = [dict(transitions[0])] + [{} for _ in range(len(transitions) - 1)]
+    queue = deque(transitions[0].values())
+    while queue:
+        state = queue.popleft()
+        order.append(state)
+        outputs[state] |= outputs[fail[state]]
+        output_groups[state] |= output_groups[fail[state]]
+        row = dict(delta[fail[state]])
+        for char, child in transitions[state].items():
+            fail[child] = delta[fail[state]].get(char, 0)
+            row[char] = child
+            queue.append(child)
+        delta[state] = row
+
+    trie = (transitions, fail, order, [frozenset(words) for words in outputs], output_groups)
+    return trie, delta
+
+
+def _expand(trie: tuple) -> List[Dict[str, int]]:
+    """Полная таблица переходов по бору _compile: строка вершины - строка ее суффиксной ссылки и ребра бора"""
+    transitions, fail, order = trie[:3]
+    delta: List[Dict[str, int]] = [dict(transitions[0])] * len(transitions)
+    for state in order[1:]:
+        row = dict(delta[fail[state]])
+        row.update(transitions[state])
+        delta[state] = row
+    return delta
+
+
+def _run(delta: List[Dict[str, int]], outputs: List[FrozenSet[str]], output_groups: List[int],
+         text: str, found: Set[str]) -> int:
+    """Проход автомата по тексту: слова добавляются в found, возвращается маска групп"""
+    groups = 0
+    state = 0
+    for char in text:
+        state = delta[state].get(char, 0)
+        if outputs[state]:
+            found |= outputs[state]
+            groups |= output_groups[state]
+    return groups
+
+
+class KeywordHits:
+    """Результат сканирования: найденные слова и запросы по группам"""
+
+    __slots__ = ('_automaton', 'found', 'groups')
+
+    def __init__(self, automaton: KeywordAutomaton, found: Set[str], groups: int):
+        self._automaton = automaton
+        self.found = found
+        # Маска групп, слова которых найдены (KeywordAutomaton.group_mask)
+        self.groups = groups
+
+    def __contains__(self, keyword: str) -> bool:
+        return keyword in self.found
+
+    def any(self, group: str) -> bool:
+        """Есть ли в тексте хотя бы одно слово группы"""
+        return self.groups & self._automaton._group_bits[group] != 0
+
+    def first(self, group: str) -> Optional[str]:
+        """Первое по порядку группы слово, найденное в тексте"""
+        ranks = self._automaton._ranks[group]
+        best: Optional[str] = None
+        for word in self.found:
+            rank = ranks.get(word)
+            if rank is not None and (best is None or rank < ranks[best]):
+                best = word
+        return best
+
+    def ordered(self, group: str) -> List[str]:
+        """Найденные слова группы в порядке группы"""
+        if not self.found:
+            return []
+        found = self.found
+        return [word for word in self._automaton._groups[group] if word in found]
+
@@ -0,0 +1,468 @@
+"""
+Кодек LeadData: плотный и разреженный словарь, версии схемы и компактная бинарная форма
+"""
+import dataclasses
+import itertools
+import json
+import logging
+import operator
+import struct
+import typing
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .question_registry import question_registry
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы словаря. Словари без ключа schema_version - версия 1.
+# При изменении смысла или формата поля версия повышается, а в _MIGRATIONS
+# добавляется функция перевода словаря предыдущей версии.
+SCHEMA_VERSION = 2
+SCHEMA_VERSION_KEY = 'schema_version'
+
+# Поле с битовой маской заданных вопросов сохраняется двумя ключами
+_QUESTIONS_FIELD = 'asked_questions_mask'
+
+# Производное поле: маска заполненных полей, не сериализуется
+FILLED_MASK_FIELD = 'filled_mask'
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Теги значений бинарной формы
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE, _TAG_INT, _TAG_FLOAT, _TAG_STR = range(6)
+_TAG_LIST, _TAG_DICT, _TAG_DATETIME, _TAG_DATETIME_TZ = range(6, 10)
+_FLOAT = struct.Struct('<d')
+
+# Метки времени лида (created_at, updated_at, слоты) меняются редко, а
+# кодируются на каждом сохранении: datetime неизменяем, поэтому
+# преобразования в строку и обратно безопасно кэшировать
+_isoformat = lru_cache(maxsize=4096)(datetime.isoformat)
+_fromisoformat = lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+# Значение по умолчанию списков и словарей: в разреженном словаре
+# пропускается любое пустое значение
+_EMPTY = object()
+
+
+def _isoformat_list(values) -> List[str]:
+    return [_isoformat(value) for value in values]
+
+
+def _fromisoformat_tuple(values) -> tuple:
+    return tuple([_fromisoformat(value) for value in values])
+
+
+def _enum_decoder(enum_type: type) -> Callable[[Any], Enum]:
+    members = {member.value: member for member in enum_type}
+
+    def decode(value):
+        # Неизвестное значение - ValueError от конструктора перечисления
+        return members.get(value) or enum_type(value)
+
+    return decode
+
+
+# Преобразования значений по виду поля: в словарь и из словаря (None - как есть)
+_ENCODERS: Dict[str, Optional[Callable[[Any], Any]]] = {
+    'enum': operator.attrgetter('value'),
+    'datetime': _isoformat,
+    'datetime_list': _isoformat_list,
+    'list': list,
+    'dict': dict,
+    'plain': None,
+}
+_DECODERS: Dict[str, Optional[Callable[[Any], Any]]] = {
+    'datetime': _fromisoformat,
+    'datetime_list': _fromisoformat_tuple,
+    'list': tuple,
+    'dict': dict,
+    'plain': None,
+}
+
+
+def _migrate_v1(data: Dict[str, Any]) -> Dict[str, Any]:
+    """v1 -> v2: список текстов asked_questions переходит в asked_questions_extra"""
+    legacy = data.get('asked_questions')
+    if not legacy:
+        return data
+    data = dict(data)
+    del data['asked_questions']
+    data['asked_questions_extra'] = list(data.get('asked_questions_extra') or ()) + list(legacy)
+    return data
+
+
+_MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    1: _migrate_v1,
+}
+
+
+class LeadDataCodec:
+    """
+    Сериализация LeadData по описанию полей dataclass, с производным полем
+    filled_mask (бит поля из field_bits установлен, если значение истинно).
+
+    Формы:
+    - плотный словарь - все поля, в том числе None: для хранилища, которое
+      объединяет метаданные;
+    - разреженный словарь - без None и значений по умолчанию, для локальных
+      кэшей;
+    - бинарная форма - только для локальных хранилищ: при несовпадении
+      раскладки полей from_bytes выбрасывает ValueError.
+    """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        hints = typing.get_type_hints(cls)
+        self._fields: List[Tuple[dataclasses.Field, str, Any]] = []
+        for spec in dataclasses.fields(cls):
+            if spec.name == FILLED_MASK_FIELD:
+                continue
+            kind, enum_type = self._field_kind(spec.name, hints[spec.name])
+            self._fields.append((spec, kind, enum_type))
+        self.field_bits: Dict[str, int] = {spec.name: 1 << index for index, (spec, _, _) in enumerate(self._fields)}
+
+        # Все поля снимка одним вызовом и запись в слоты в обход
+        # __setattr__ frozen dataclass - в том же порядке
+        names = [spec.name for spec, _, _ in self._fields]
+        self._values = operator.attrgetter(*names)
+        self._setters: Dict[str, Callable[[Any, Any], None]] = {name: getattr(cls, name).__set__ for name in names}
+        self._setter_list = tuple(self._setters.values())
+        self._bits = tuple(self.field_bits[name] for name in names)
+        self._set_filled_mask = getattr(cls, FILLED_MASK_FIELD).__set__
+        self._set_questions = self._setters[_QUESTIONS_FIELD]
+
+        # Поля словарей (вопросы кодируются отдельно двумя ключами).
+        # Простые поля без умолчания переносятся как есть; для остальных
+        # (имя, преобразование, умолчание для разреженного словаря) и
+        # (имя, запись, преобразование, умолчание, фабрика умолчания)
+        plain_names = []
+        encoded_names = []
+        self._plain_setters: List[Tuple[str, Callable[[Any, Any], None]]] = []
+        self._encoded_fields: List[Tuple[str, Optional[Callable], Any]] = []
+        self._decoded_fields: List[Tuple[str, Callable, Optional[Callable], Any, Optional[Callable]]] = []
+        for spec, kind, enum_type in self._fields:
+            if kind == 'questions':
+                continue
+            default = None if spec.default is dataclasses.MISSING else spec.default
+            factory = None if spec.default_factory is dataclasses.MISSING else spec.default_factory
+            if kind == 'plain' and default is None and factory is None:
+                plain_names.append(spec.name)
+                self._plain_setters.append((spec.name, self._setters[spec.name]))
+                continue
+            encoded_names.append(spec.name)
+            self._encoded_fields.append((
+                spec.name, _ENCODERS[kind], _EMPTY if kind in ('list', 'datetime_list', 'dict') else default,
+            ))
+            decode = _enum_decoder(enum_type) if kind == 'enum' else _DECODERS[kind]
+            self._decoded_fields.append((spec.name, self._setters[spec.name], decode, default, factory))
+        self._plain_names = tuple(plain_names)
+        self._plain_values = operator.attrgetter(*plain_names)
+        self._encoded_values = operator.attrgetter(*encoded_names)
+
+        # Бинарная форма: порядок полей и члены перечислений зафиксированы в раскладке
+        self._enum_members = {spec.name: list(enum_type) for spec, kind, enum_type in self._fields
+                              if kind == 'enum'}
+        layout = ';'.join(
+            f"{spec.name}:{kind}:{','.join(str(m.value) for m in self._enum_members.get(spec.name, ()))}"
+            for spec, kind, _ in self._fields
+        )
+        self._binary_header = bytes((SCHEMA_VERSION,)) + struct.pack('<I', zlib.crc32(layout.encode('utf-8')))
+
+    # === Словари ===
+
+    def to_dict(self, lead, sparse: bool = False) -> Dict[str, Any]:
+        """Словарь для хранилища (плотный) или для локальных кэшей (sparse=True)"""
+        return self._encode_sparse(lead) if sparse else self._encode_dense(lead)
+
+    def from_dict(self, data: Dict[str, Any]):
+        """LeadData из словаря любой поддерживаемой версии схемы (плотного или разреженного)"""
+        version = data.get(SCHEMA_VERSION_KEY) or 1
+        if version != SCHEMA_VERSION:
+            data = self._migrate(data, version)
+        return self._decode(data)
+
+    def replace(self, lead, changes: Dict[str, Any]):
+        """Копия снимка с измененными полями"""
+        try:
+            return self._replace(lead, changes)
+        except KeyError as e:
+            raise TypeError(f"У {self.cls.__name__} нет поля {e}") from None
+
+    def _migrate(self, data: Dict[str, Any], version: int) -> Dict[str, Any]:
+        if version > SCHEMA_VERSION:
+            # Данные записаны более новой версией бота: читаем известные поля
+            logger.warning(f"⚠️ Данные лида схемы v{version} новее поддерживаемой v{SCHEMA_VERSION}")
+            return data
+        while version < SCHEMA_VERSION:
+            data = _MIGRATIONS[version](data)
+            version += 1
+        return data
+
+    # === Бинарная форма ===
+
+    def to_bytes(self, lead) -> bytes:
+        """Компактная бинарная форма для локальных хранилищ"""
+        body = bytearray()
+        present = 0
+        for index, (spec, kind, _) in enumerate(self._fields):
+            value = getattr(lead, spec.name)
+            if kind == 'questions':
+                if not value:
+                    continue
+                catalog_mask, extra = question_registry.encode(value)
+                _write_uvarint(body, catalog_mask)
+                _write_value(body, extra)
+            elif kind == 'enum':
+                if value is None or value is spec.default:
+                    continue
+                body.append(self._enum_members[spec.name].index(value))
+            else:
+                if value is None or not value and spec.default_factory is not dataclasses.MISSING:
+                    continue
+                if spec.default is not dataclasses.MISSING and value == spec.default:
+                    continue
+                _write_value(body, value)
+            present |= 1 << index
+
+        out = bytearray(self._binary_header)
+        _write_uvarint(out, present)
+        out += body
+        return bytes(out)
+
+    def from_bytes(self, payload: bytes):
+        """LeadData из бинарной формы; ValueError, если форма записана другой раскладкой"""
+        header_size = len(self._binary_header)
+        if payload[:header_size] != self._binary_header:
+            raise ValueError("Бинарные данные лида записаны другой версией схемы")
+        view = memoryview(payload)
+        present, pos = _read_uvarint(view, header_size)
+
+        changes = {}
+        for index, (spec, kind, _) in enumerate(self._fields):
+            if not present >> index & 1:
+                continue
+            if kind == 'questions':
+                catalog_mask, pos = _read_uvarint(view, pos)
+                extra, pos = _read_value(view, pos)
+                value = question_registry.decode(catalog_mask, extra)
+            elif kind == 'enum':
+                value = self._enum_members[spec.name][view[pos]]
+                pos += 1
+            else:
+                value, pos = _read_value(view, pos)
+                if kind == 'list' or kind == 'datetime_list':
+                    value = tuple(value)
+            changes[spec.name] = value
+        if pos != len(payload):
+            raise ValueError("Лишние байты в бинарных данных лида")
+        return self._replace(self.cls(), changes)
+
+    # === Проход по полям ===
+
+    def filled_mask(self, lead) -> int:
+        """Маска полей с истинным значением"""
+        # Биты различны, поэтому сумма равна объединению
+        return sum(itertools.compress(self._bits, self._values(lead)))
+
+    def _encode_dense(self, lead) -> Dict[str, Any]:
+        data = dict(zip(self._plain_names, self._plain_values(lead)))
+        for (name, encode, _), value in zip(self._encoded_fields, self._encoded_values(lead)):
+            data[name] = value if encode is None or value is None else encode(value)
+        data['asked_questions_mask'], data['asked_questions_extra'] = question_registry.encode(
+            lead.asked_questions_mask
+        )
+        data[SCHEMA_VERSION_KEY] = SCHEMA_VERSION
+        return data
+
+    def _encode_sparse(self, lead) -> Dict[str, Any]:
+        data = {name: value for name, value in zip(self._plain_names, self._plain_values(lead))
+                if value is not None}
+        data[SCHEMA_VERSION_KEY] = SCHEMA_VERSION
+        for (name, encode, default), value in zip(self._encoded_fields, self._encoded_values(lead)):
+            if default is _EMPTY:
+                if not value:
+                    continue
+            elif value is None or default is not None and value == default:
+                continue
+            data[name] = value if encode is None else encode(value)
+        if lead.asked_questions_mask:
+            data['asked_questions_mask'], extra = question_registry.encode(lead.asked_questions_mask)
+            if extra:
+                data['asked_questions_extra'] = extra
+        return data
+
+    def _decode(self, data: Dict[str, Any]):
+        lead = object.__new__(self.cls)
+        get = data.get
+        for name, set_value in self._plain_setters:
+            set_value(lead, get(name))
+        for name, set_value, decode, default, factory in self._decoded_fields:
+            value = get(name)
+            if decode is None:
+                if value is None:
+                    value = default if factory is None else factory()
+            elif value:
+                value = decode(value)
+            else:
+                value = default if factory is None else factory()
+            set_value(lead, value)
+        self._set_questions(lead, question_registry.decode(
+            get('asked_questions_mask') or 0, get('asked_questions_extra') or ()
+        ))
+        self._set_filled_mask(lead, self.filled_mask(lead))
+        return lead
+
+    def _replace(self, lead, changes: Dict[str, Any]):
+        copy = object.__new__(self.cls)
+        for set_value, value in zip(self._setter_list, self._values(lead)):
+            set_value(copy, value)
+        mask = lead.filled_mask
+        setters = self._setters
+        bits = self.field_bits
+        for name, value in changes.items():
+            setters[name](copy, value)
+            mask = mask | bits[name] if value else mask & ~bits[name]
+        self._set_filled_mask(copy, mask)
+        return copy
+
+    # === Описание полей ===
+
+    @staticmethod
+    def _field_kind(name: str, annotation) -> Tuple[str, Any]:
+        if name == _QUESTIONS_FIELD:
+            return 'questions', None
+        if typing.get_origin(annotation) is typing.Union:
+            annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+        origin = typing.get_origin(annotation)
+        if isinstance(annotation, type) and issubclass(annotation, Enum):
+            return 'enum', annotation
+        if annotation is datetime:
+            return 'datetime', None
+        if origin is tuple or origin is list:
+            return ('datetime_list' if typing.get_args(annotation)[0] is datetime else 'list'), None
+        if origin is dict:
+            return 'dict', None
+        if annotation in (str, int, bool, float):
+            return 'plain', None
+        raise TypeError(f"Поле {name}: тип {annotation} не поддерживается кодеком")
+
+
+# === Значения бинарной формы ===
+
+def _write_uvarint(out: bytearray, number: int):
+    while number > 0x7F:
+        out.append(number & 0x7F | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def _read_uvarint(view: memoryview, pos: int) -> Tuple[int, int]:
+    number = shift = 0
+    while True:
+        byte = view[pos]
+        pos += 1
+        number |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+
+
+def _write_str(out: bytearray, text: str):
+    encoded = text.encode('utf-8')
+    _write_uvarint(out, len(encoded))
+    out += encoded
+
+
+def _write_value(out: bytearray, value: Any):
+    """Значение с однобайтовым тегом (в духе msgpack)"""
+    if value is None:
+        out.append(_TAG_NONE)
+    elif value is True:
+        out.append(_TAG_TRUE)
+    elif value is False:
+        out.append(_TAG_FALSE)
+    elif isinstance(value, int):
+        out.append(_TAG_INT)
+        # zigzag: небольшие по модулю отрицательные числа тоже занимают мало байт
+        _write_uvarint(out, value << 1 if value >= 0 else (~value << 1) | 1)
+    elif isinstance(value, float):
+        out.append(_TAG_FLOAT)
+        out += _FLOAT.pack(value)
+    elif isinstance(value, str):
+        out.append(_TAG_STR)
+        _write_str(out, value)
+    elif isinstance(value, (list, tuple)):
+        out.append(_TAG_LIST)
+        _write_uvarint(out, len(value))
+        for item in value:
+            _write_value(out, item)
+    elif isinstance(value, dict):
+        out.append(_TAG_DICT)
+        _write_uvarint(out, len(value))
+        for key, item in value.items():
+            _write_str(out, str(key))
+            _write_value(out, item)
+    elif isinstance(value, datetime):
+        if value.tzinfo is None:
+            out.append(_TAG_DATETIME)
+            delta = value - _EPOCH
+            micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+            _write_uvarint(out, micros << 1 if micros >= 0 else (~micros << 1) | 1)
+        else:
+            out.append(_TAG_DATETIME_TZ)
+            _write_str(out, value.isoformat())
+    elif isinstance(value, Enum):
+        _write_value(out, value.value)
+    else:
+        # Прочие типы во вложенных структурах сохраняем как JSON-строку
+        out.append(_TAG_STR)
+        _write_str(out, json.dumps(value, ensure_ascii=False, default=str))
+
+
+def _read_str(view: memoryview, pos: int) -> Tuple[str, int]:
+    size, pos = _read_uvarint(view, pos)
+    end = pos + size
+    return str(view[pos:end], 'utf-8'), end
+
+
+def _read_value(view: memoryview, pos: int) -> Tuple[Any, int]:
+    tag = view[pos]
+    pos += 1
+    if tag == _TAG_STR:
+        return _read_str(view, pos)
+    if tag == _TAG_INT or tag == _TAG_DATETIME:
+        zigzag, pos = _read_uvarint(view, pos)
+        number = zigzag >> 1 ^ -(zigzag & 1)
+        if tag == _TAG_DATETIME:
+            return _EPOCH + timedelta(microseconds=number), pos
+        return number, pos
+    if tag == _TAG_NONE:
+        return None, pos
+    if tag == _TAG_TRUE:
+        return True, pos
+    if tag == _TAG_FALSE:
+        return False, pos
+    if tag == _TAG_LIST:
+        count, pos = _read_uvarint(view, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _read_value(view, pos)
+            items.append(item)
+        return items, pos
+    if tag == _TAG_DICT:
+        count, pos = _read_uvarint(view, pos)
+        items = {}
+        for _ in range(count):
+            key, pos = _read_str(view, pos)
+            items[key], pos = _read_value(view, pos)
+        return items, pos
+    if tag == _TAG_FLOAT:
+        return _FLOAT.unpack_from(view, pos)[0], pos + _FLOAT.size
+    if tag == _TAG_DATETIME_TZ:
+        text, pos = _read_str(view, pos)
+        return datetime.fromisoformat(text), pos
+    raise ValueError(f"Неизвестный тег {tag} в бинарных данных лида")
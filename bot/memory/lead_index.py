@@ -0,0 +1,312 @@
+"""
+Локальный индекс лидов для запросов админки и выгрузок
+"""
+import heapq
+import logging
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .bulk_scoring import LeadColumns, LeadScores, numpy_available, score_columns
+from .models import ClientType, DialogState, LeadData
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value: str) -> str:
+    return value.strip().lower()
+
+
+def _budget_interval(lead: LeadData) -> Optional[Tuple[float, float]]:
+    """Бюджет лида как отрезок; одна указанная граница - отрезок из точки"""
+    low = lead.budget_min or lead.budget_max
+    high = lead.budget_max or lead.budget_min
+    if not low:
+        return None
+    return (low, high) if low <= high else (high, low)
+
+
+class LeadIndex:
+    """
+    Индекс лидов в памяти процесса, обновляется при каждом сохранении лида.
+
+    Инвертированные индексы (значение -> сессии) для локаций, типа объекта,
+    статуса квалификации и состояния диалога; бюджет - отрезок [min, max],
+    концы которого лежат в двух отсортированных списках, так что условие
+    по бюджету - два среза по bisect. Наборы сессий условий пересекаются,
+    начиная с самого маленького.
+    При наличии numpy поля для скоринга хранятся по колонкам (bulk_scoring)
+    и обновляются построчно, поэтому сводка по всем лидам не перечитывает
+    объекты.
+
+    Лиды, не обновлявшиеся дольше retention_days, удаляются при следующих
+    обновлениях (min-heap по updated_at с ленивым удалением, как очередь
+    истечения сессий), так что индекс и колонки не растут без предела.
+    Индекс видит только сохранения в этом процессе и сессии, восстановленные
+    из журнала: complete_since - момент, с которого он полон.
+    """
+
+    def __init__(self, initial_capacity: int = 1024, retention_days: Optional[float] = 30):
+        self._leads: Dict[str, LeadData] = {}
+        # Ключи сортировки результатов: (updated_at, session_id)
+        self._order_keys: Dict[str, Tuple[datetime, str]] = {}
+
+        self._by_location: Dict[str, Set[str]] = defaultdict(set)
+        self._by_property_type: Dict[str, Set[str]] = defaultdict(set)
+        self._by_qualification: Dict[Optional[ClientType], Set[str]] = defaultdict(set)
+        self._by_state: Dict[DialogState, Set[str]] = defaultdict(set)
+
+        # Отсортированные (граница, session_id): нижние и верхние концы отрезков бюджета
+        self._budget_low: List[Tuple[float, str]] = []
+        self._budget_high: List[Tuple[float, str]] = []
+        self._budget_bounds: Dict[str, Tuple[float, float]] = {}
+
+        # Колонки для векторного скоринга: строка на сессию, удаление - перенос последней строки
+        self._columns: Optional[LeadColumns] = LeadColumns.allocate(initial_capacity) if numpy_available() else None
+        self._rows: Dict[str, int] = {}
+        self._row_sessions: List[str] = []
+
+        # (updated_at, session_id) для удаления по сроку хранения; записи,
+        # устаревшие после обновления лида, пропускаются при извлечении
+        self.retention: Optional[timedelta] = timedelta(days=retention_days) if retention_days else None
+        self._age_heap: List[Tuple[datetime, str]] = []
+        self.complete_since = datetime.now()
+
+    def __len__(self) -> int:
+        return len(self._leads)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._leads
+
+    def get(self, session_id: str) -> Optional[LeadData]:
+        return self._leads.get(session_id)
+
+    # === Обновление ===
+
+    def update(self, session_id: str, lead: LeadData):
+        """Добавляет или обновляет лид; меняются только затронутые записи индексов"""
+        old = self._leads.get(session_id)
+        if old is lead:
+            return
+        self._leads[session_id] = lead
+        self._order_keys[session_id] = (lead.updated_at, session_id)
+
+        self._update_keys(self._by_location, session_id,
+                          self._location_keys(old), self._location_keys(lead))
+        self._update_keys(self._by_property_type, session_id,
+                          self._property_keys(old), self._property_keys(lead))
+        self._update_keys(self._by_qualification, session_id,
+                          () if old is None else (old.qualification_status,), (lead.qualification_status,))
+        self._update_keys(self._by_state, session_id,
+                          () if old is None else (old.current_dialog_state,), (lead.current_dialog_state,))
+
+        old_budget = self._budget_bounds.get(session_id)
+        new_budget = _budget_interval(lead)
+        if old_budget != new_budget:
+            if old_budget is not None:
+                self._remove_sorted(self._budget_low, (old_budget[0], session_id))
+                self._remove_sorted(self._budget_high, (old_budget[1], session_id))
+                del self._budget_bounds[session_id]
+            if new_budget is not None:
+                insort(self._budget_low, (new_budget[0], session_id))
+                insort(self._budget_high, (new_budget[1], session_id))
+                self._budget_bounds[session_id] = new_budget
+
+        if self._columns is not None:
+            row = self._rows.get(session_id)
+            if row is None:
+                row = len(self._row_sessions)
+                if row == len(self._columns):
+                    self._columns = self._columns.resized(2 * len(self._columns))
+                self._rows[session_id] = row
+                self._row_sessions.append(session_id)
+            self._columns.set_row(row, lead)
+
+        if self.retention is not None and (old is None or old.updated_at != lead.updated_at):
+            heapq.heappush(self._age_heap, (lead.updated_at, session_id))
+            self.prune()
+
+    def remove(self, session_id: str):
+        old = self._leads.pop(session_id, None)
+        if old is None:
+            return
+        del self._order_keys[session_id]
+        self._update_keys(self._by_location, session_id, self._location_keys(old), ())
+        self._update_keys(self._by_property_type, session_id, self._property_keys(old), ())
+        self._update_keys(self._by_qualification, session_id, (old.qualification_status,), ())
+        self._update_keys(self._by_state, session_id, (old.current_dialog_state,), ())
+        old_budget = self._budget_bounds.pop(session_id, None)
+        if old_budget is not None:
+            self._remove_sorted(self._budget_low, (old_budget[0], session_id))
+            self._remove_sorted(self._budget_high, (old_budget[1], session_id))
+
+        if self._columns is not None:
+            row = self._rows.pop(session_id)
+            last_session = self._row_sessions.pop()
+            if last_session != session_id:
+                self._columns.copy_row(len(self._row_sessions), row)
+                self._row_sessions[row] = last_session
+                self._rows[last_session] = row
+
+    def prune(self, now: Optional[datetime] = None) -> int:
+        """Удаляет лиды, не обновлявшиеся дольше срока хранения"""
+        if self.retention is None:
+            return 0
+        cutoff = (now or datetime.now()) - self.retention
+        heap = self._age_heap
+        removed = 0
+        while heap and heap[0][0] < cutoff:
+            updated_at, session_id = heapq.heappop(heap)
+            order_key = self._order_keys.get(session_id)
+            if order_key is not None and order_key[0] == updated_at:
+                self.remove(session_id)
+                removed += 1
+        if len(heap) > 2 * len(self._leads) + 1024:
+            # Частые обновления одних лидов оставляют много устаревших записей
+            self._age_heap = list(self._order_keys.values())
+            heapq.heapify(self._age_heap)
+        if removed:
+            logger.info(f"🗂️ Из индекса лидов удалено {removed} лидов старше {self.retention.days} дней")
+        return removed
+
+    @staticmethod
+    def _location_keys(lead: Optional[LeadData]) -> Tuple[str, ...]:
+        if lead is None:
+            return ()
+        return tuple({_normalize(location) for location in lead.preferred_locations if location})
+
+    @staticmethod
+    def _property_keys(lead: Optional[LeadData]) -> Tuple[str, ...]:
+        if lead is None or not lead.property_type:
+            return ()
+        return (_normalize(lead.property_type),)
+
+    @staticmethod
+    def _update_keys(index: Dict, session_id: str, old_keys: Tuple, new_keys: Tuple):
+        if old_keys == new_keys:
+            return
+        for key in old_keys:
+            if key in new_keys:
+                continue
+            sessions = index.get(key)
+            if sessions is not None:
+                sessions.discard(session_id)
+                if not sessions:
+                    del index[key]
+        for key in new_keys:
+            index[key].add(session_id)
+
+    @staticmethod
+    def _remove_sorted(entries: List[Tuple[float, str]], entry: Tuple[float, str]):
+        position = bisect_left(entries, entry)
+        if position < len(entries) and entries[position] == entry:
+            del entries[position]
+
+    # === Запросы ===
+
+    def query(self, location: Optional[str] = None, property_type: Optional[str] = None,
+              qualification: Optional[ClientType] = None, state: Optional[DialogState] = None,
+              budget_from: Optional[float] = None, budget_to: Optional[float] = None,
+              updated_since: Optional[datetime] = None,
+              offset: int = 0, limit: int = 50) -> Tuple[int, List[Tuple[str, LeadData]]]:
+        """
+        Лиды, удовлетворяющие всем заданным условиям.
+
+        Бюджет лида подходит, если его отрезок пересекается с
+        [budget_from, budget_to]; лиды без бюджета при фильтре по бюджету
+        не возвращаются. Результаты упорядочены по updated_at (новые первыми),
+        limit=0 - все результаты без пагинации.
+
+        Returns:
+            (общее число найденных лидов, страница [(session_id, lead)])
+        """
+        candidates: List[Set[str]] = []
+        if location is not None:
+            candidates.append(self._by_location.get(_normalize(location), set()))
+        if property_type is not None:
+            candidates.append(self._by_property_type.get(_normalize(property_type), set()))
+        if qualification is not None:
+            candidates.append(self._by_qualification.get(qualification, set()))
+        if state is not None:
+            candidates.append(self._by_state.get(state, set()))
+
+        # Бюджет: нижний конец отрезка <= budget_to и верхний >= budget_from.
+        # Срез отсортированного списка превращается в набор, только если он
+        # меньше самого маленького набора других условий; иначе бюджет
+        # проверяется у уже отобранных лидов
+        budget_slices = []
+        if budget_to is not None:
+            end = bisect_right(self._budget_low, budget_to, key=itemgetter(0))
+            budget_slices.append((self._budget_low, 0, end))
+        if budget_from is not None:
+            start = bisect_left(self._budget_high, budget_from, key=itemgetter(0))
+            budget_slices.append((self._budget_high, start, len(self._budget_high)))
+        smallest = min(map(len, candidates), default=None)
+        check_budget = False
+        for entries, start, end in budget_slices:
+            if smallest is None or end - start < smallest:
+                candidates.append(set(map(itemgetter(1), entries[start:end])))
+            else:
+                check_budget = True
+
+        if candidates:
+            # Пересечение начинается с самого маленького набора
+            candidates.sort(key=len)
+            matches = candidates[0].intersection(*candidates[1:])
+        else:
+            matches = self._leads.keys()
+
+        if check_budget:
+            bounds = self._budget_bounds
+            low_bound = budget_from if budget_from is not None else float('-inf')
+            high_bound = budget_to if budget_to is not None else float('inf')
+            matches = [session_id for session_id in matches
+                       if session_id in bounds
+                       and bounds[session_id][0] <= high_bound and bounds[session_id][1] >= low_bound]
+
+        order_keys = self._order_keys
+        if updated_since is not None:
+            matches = [session_id for session_id in matches if order_keys[session_id][0] >= updated_since]
+
+        total = len(matches)
+        if limit > 0:
+            # Странице нужны только первые offset + limit лидов: частичная сортировка
+            page = heapq.nlargest(offset + limit, matches, key=order_keys.__getitem__)[offset:]
+        else:
+            page = sorted(matches, key=order_keys.__getitem__, reverse=True)[offset:]
+        leads = self._leads
+        return total, [(session_id, leads[session_id]) for session_id in page]
+
+    def facet_counts(self) -> Dict[str, Dict[str, int]]:
+        """Число лидов по значениям индексируемых полей"""
+        return {
+            'locations': {key: len(sessions) for key, sessions in self._by_location.items()},
+            'property_types': {key: len(sessions) for key, sessions in self._by_property_type.items()},
+            'qualification': {(key.value if key else 'unknown'): len(sessions)
+                              for key, sessions in self._by_qualification.items()},
+            'dialog_states': {key.value: len(sessions) for key, sessions in self._by_state.items()},
+        }
+
+    # === Скоринг ===
+
+    def score_all(self) -> Optional[Tuple[List[str], LeadScores]]:
+        """Скоринг всех лидов одним векторным проходом (None без numpy)"""
+        if self._columns is None:
+            return None
+        return list(self._row_sessions), score_columns(self._columns.head(len(self._row_sessions)))
+
+    def scores_summary(self) -> Dict[str, Any]:
+        """Сводка скоринга для админки"""
+        scored = self.score_all()
+        if scored is None or not scored[0]:
+            return {'leads': len(self._leads)}
+        _, scores = scored
+        return {
+            'leads': len(scores),
+            **{status.value: count for status, count in scores.status_counts().items()},
+            'avg_completeness': float(scores.completeness.mean()),
+            'avg_escalation_score': float(scores.escalation_score.mean()),
+            'should_escalate': int(scores.should_escalate.sum()),
+        }
@@ -0,0 +1,179 @@
+"""
+Скоринг лидов по маске заполненных полей LeadData
+"""
+from typing import Dict, List, Tuple
+
+from .models import ClientType, DialogState, LeadData, lead_fields_mask
+from .question_registry import QUESTION_CATALOG
+
+# === Маски полей ===
+
+_PHONE = lead_fields_mask('phone')
+_BUDGET = lead_fields_mask('budget_min', 'budget_max')
+_BUDGET_MIN = lead_fields_mask('budget_min')
+_GOAL = lead_fields_mask('automation_goal')
+_DEMO_CONTACT = lead_fields_mask('phone', 'agreed_demo_slots')
+
+# Полнота данных: поля по одному баллу, бюджет (любая из границ) - два балла
+_COMPLETENESS_SINGLE = lead_fields_mask(
+    'name', 'phone', 'business_sphere', 'automation_goal', 'payment_type', 'technical_requirements',
+    'urgency_level', 'automation_experience', 'preferred_contact_method',
+)
+_COMPLETENESS_TOTAL = 20
+
+# Квалификация: деньги + срочность + понимание запроса
+_MONEY = lead_fields_mask('budget_min', 'budget_max', 'payment_type')
+_URGENCY = lead_fields_mask('urgency_date', 'ready_for_quick_decision')
+_REQUEST_OBJECT = lead_fields_mask('property_type', 'preferred_locations')
+_URGENT_LEVELS = frozenset({'high', 'medium'})
+_STATUS_BY_SCORE = (ClientType.COLD, ClientType.COLD, ClientType.WARM, ClientType.HOT)
+
+# === Вопросы по состоянию ===
+
+# Правила: (маска полей, которые должны быть НЕ заполнены, вопросы).
+# Пустая маска - вопросы задаются всегда. Каждый вопрос должен быть в
+# QUESTION_CATALOG: иначе он не получит постоянный id и отметка "задан"
+# не сохранится в хранилище (проверяется при импорте).
+_QuestionRules = Dict[DialogState, Tuple[int, Tuple[str, ...]]]
+
+NEXT_QUESTION_RULES: _QuestionRules = {
+    DialogState.S0_GREETING: (0, (
+        "Для себя ищете недвижимость или как инвестицию?",
+        "Вы сейчас в Сочи? Если нет — из какого города?",
+    )),
+    DialogState.S1_BUSINESS: (_GOAL, (
+        "Для себя ищете жилье или как инвестицию?",
+        "Цель покупки: ПМЖ, сдача в аренду или сбережения?",
+    )),
+    DialogState.S2_GOAL: (_BUDGET_MIN, (
+        "На какой бюджет мне ориентироваться?",
+        "Есть решение: AI-ассистент от $350. Такой диапазон рассматриваете?",
+    )),
+}
+
+ALTERNATIVE_QUESTION_RULES: _QuestionRules = {
+    DialogState.S0_GREETING: (0, (
+        "Расскажите, пожалуйста, подробнее о вашей ситуации",
+        "Что вас привело к поиску недвижимости в Сочи?",
+    )),
+    DialogState.S1_BUSINESS: (_GOAL, (
+        "Какие у вас планы на недвижимость?",
+        "Что для вас важнее: доходность или надежность?",
+    )),
+    DialogState.S2_GOAL: (0, (
+        "Какие сроки покупки вы рассматриваете?",
+        "Вы уже определились с форматом недвижимости?",
+    )),
+    DialogState.S4_REQUIREMENTS: (0, (
+        "Есть ли у вас особые пожелания к объекту?",
+        "Что для вас важнее: локация или характеристики объекта?",
+    )),
+    DialogState.S5_BUDGET: (0, (
+        "Какой диапазон цен вы рассматриваете?",
+        "Есть ли у вас предпочтения по форме оплаты?",
+    )),
+}
+
+
+def _check_catalog(rules: _QuestionRules):
+    """Проверяет, что все вопросы правил есть в каталоге вопросов"""
+    missing = [question for _, questions in rules.values() for question in questions
+               if question not in QUESTION_CATALOG]
+    if missing:
+        raise ValueError(f"Вопросы отсутствуют в QUESTION_CATALOG: {missing}")
+
+
+def _compile_question_table(rules: _QuestionRules) -> Dict[DialogState, Tuple[int, Dict[int, Tuple[str, ...]]]]:
+    """
+    Таблица состояние -> (маска правила, незаполненные поля правила -> вопросы).
+
+    Для каждого состояния перебираются все подмножества маски правила,
+    поэтому при работе остается один поиск по состоянию, операция AND и
+    поиск по целому числу.
+    """
+    _check_catalog(rules)
+    compiled: Dict[DialogState, Tuple[int, Dict[int, Tuple[str, ...]]]] = {}
+    for state in DialogState:
+        required_missing, questions = rules.get(state, (0, ()))
+        table: Dict[int, Tuple[str, ...]] = {}
+        subset = required_missing
+        while True:
+            table[subset] = questions if subset == required_missing else ()
+            if subset == 0:
+                break
+            subset = (subset - 1) & required_missing
+        compiled[state] = (required_missing, table)
+    return compiled
+
+
+_NEXT_QUESTIONS = _compile_question_table(NEXT_QUESTION_RULES)
+_ALTERNATIVE_QUESTIONS = _compile_question_table(ALTERNATIVE_QUESTION_RULES)
+
+
+def next_questions(state: DialogState, lead: LeadData) -> List[str]:
+    """Вопросы для следующего ответа в состоянии state"""
+    watched, table = _NEXT_QUESTIONS[state]
+    return list(table[watched & ~lead.filled_mask])
+
+
+def alternative_questions(state: DialogState, lead: LeadData) -> List[str]:
+    """Запасные вопросы, если основные уже задавались"""
+    watched, table = _ALTERNATIVE_QUESTIONS[state]
+    return list(table[watched & ~lead.filled_mask])
+
+
+# === Скоринг ===
+
+def qualification_status(lead: LeadData) -> ClientType:
+    """Статус квалификации: Деньги + Срочность + Понимание запроса"""
+    mask = lead.filled_mask
+    score = 0
+    if mask & _MONEY:
+        score += 1
+    if mask & _URGENCY or lead.urgency_level in _URGENT_LEVELS:
+        score += 1
+    if mask & _GOAL and mask & _REQUEST_OBJECT:
+        score += 1
+    return _STATUS_BY_SCORE[score]
+
+
+def data_completeness(lead: LeadData) -> float:
+    """Полнота данных (0-1)"""
+    mask = lead.filled_mask
+    filled = (mask & _COMPLETENESS_SINGLE).bit_count()
+    if mask & _BUDGET:
+        filled += 2
+    return filled / _COMPLETENESS_TOTAL
+
+
+def escalation_score(lead: LeadData) -> float:
+    """Скор для эскалации (0-1)"""
+    score = 0.0
+    if lead.qualification_status == ClientType.HOT:
+        score += 0.4
+    elif lead.qualification_status == ClientType.WARM:
+        score += 0.2
+    if lead.filled_mask & _PHONE:
+        score += 0.2
+    if lead.budget_max and lead.budget_max > 1000:
+        score += 0.2
+    if lead.urgency_level == 'high':
+        score += 0.2
+    return min(score, 1.0)
+
+
+def should_escalate(lead: LeadData) -> bool:
+    """Нужна ли эскалация к живому менеджеру"""
+    return bool(
+        # Горячий клиент
+        lead.qualification_status == ClientType.HOT
+        # Есть телефон и согласованы слоты демо
+        or lead.filled_mask & _DEMO_CONTACT == _DEMO_CONTACT
+        # Высокий бюджет
+        or (lead.budget_min and lead.budget_min > 1000)
+        or (lead.budget_max and lead.budget_max > 2000)
+        # Специфические технические требования
+        or len(lead.technical_requirements) > 3
+        # Запросил презентацию/детали
+        or 'презентация' in (lead.comments or '').lower()
+    )
@@ -0,0 +1,356 @@
+"""
+Гибридное извлечение: LLM дополняет регулярные выражения при низкой уверенности
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Set
+
+from .models import AutomationGoal, DialogState, LeadData, PaymentType
+
+logger = logging.getLogger(__name__)
+
+# Структурированное извлечение: текст сообщения -> JSON с найденными полями
+FieldExtractor = Callable[[str], Awaitable[Dict[str, Any]]]
+# Запись дополненных полей в лид сессии
+MergeFunc = Callable[[str, Dict[str, Any]], Awaitable[int]]
+
+
+def _text(value: Any) -> Optional[str]:
+    return (value.strip()[:100] or None) if isinstance(value, str) else None
+
+
+def _flag(value: Any) -> Optional[bool]:
+    return value if isinstance(value, bool) else None
+
+
+def _amount(value: Any) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value) if 0 < value < 10 ** 11 else None
+
+
+def _choice(*options: str) -> Callable[[Any], Optional[str]]:
+    return lambda value: value if value in options else None
+
+
+def _member(enum_type) -> Callable[[Any], Any]:
+    members = {member.value: member for member in enum_type}
+    return lambda value: members.get(value) if isinstance(value, str) else None
+
+
+def _texts(value: Any) -> Optional[tuple]:
+    if not isinstance(value, list):
+        return None
+    return tuple(item.strip()[:100] for item in value if isinstance(item, str) and item.strip())[:10] or None
+
+
+# Поля, которые может заполнить LLM: имя поля -> приведение значения из
+# JSON к типу поля LeadData (None - значение отбрасывается)
+LLM_FIELDS: Dict[str, Callable[[Any], Any]] = {
+    'name': _text,
+    'city': _text,
+    'is_in_sochi': _flag,
+    'automation_goal': _member(AutomationGoal),
+    'payment_type': _member(PaymentType),
+    'budget_min': _amount,
+    'budget_max': _amount,
+    'preferred_locations': _texts,
+    'property_type': _choice('дом', 'квартира', 'апартаменты', 'участок'),
+    'urgency_date': _text,
+    'urgency_level': _choice('high', 'medium', 'low'),
+    'sochi_experience': _text,
+}
+
+EXTRACTION_PROMPT = """Ты извлекаешь данные клиента агентства недвижимости в Сочи из одного его сообщения.
+Верни JSON-объект только с полями, о которых клиент явно говорит в сообщении; ничего не придумывай.
+Поля:
+- name: имя клиента, если он представился
+- city: город, откуда клиент
+- is_in_sochi: true/false - находится ли клиент сейчас в Сочи
+- automation_goal: цель покупки - short_investment, long_investment, residence, savings, rental_business
+- payment_type: способ оплаты - cash, cards, bank_transfer (в том числе ипотека и рассрочка), crypto
+- budget_min, budget_max: бюджет в рублях, целыми числами
+- preferred_locations: список районов Сочи
+- property_type: дом, квартира, апартаменты или участок
+- urgency_date: когда клиент планирует приехать или купить, как он сказал
+- urgency_level: срочность - high, medium, low
+- sochi_experience: опыт покупки недвижимости в Сочи, коротко"""
+
+# Слоты - группы полей, на которые отвечает клиент; слот заполнен, если
+# заполнено любое его поле
+SLOTS: Dict[str, tuple] = {
+    'name': ('name',),
+    'location': ('city', 'is_in_sochi'),
+    'goal': ('automation_goal',),
+    'payment': ('payment_type',),
+    'requirements': ('preferred_locations', 'property_type'),
+    'budget': ('budget_min', 'budget_max'),
+    'urgency': ('urgency_date', 'urgency_level'),
+    'experience': ('sochi_experience',),
+}
+
+# Слоты, о которых спрашивает ассистент в каждом состоянии (см.
+# DialogStateExtractor.TRANSITIONS); имя нужно в любом состоянии, пока неизвестно
+STATE_SLOTS: Dict[DialogState, tuple] = {
+    DialogState.S0_GREETING: ('name', 'goal'),
+    DialogState.S1_BUSINESS: ('name', 'location'),
+    DialogState.S2_GOAL: ('name', 'goal'),
+    DialogState.S3_PAYMENT: ('name', 'payment'),
+    DialogState.S4_REQUIREMENTS: ('name', 'requirements'),
+    DialogState.S5_BUDGET: ('name', 'budget'),
+    DialogState.S6_URGENCY: ('name', 'urgency'),
+    DialogState.S7_EXPERIENCE: ('name', 'experience'),
+    DialogState.S8_ACTION: ('name',),
+}
+
+# Признаки того, что сообщение отвечает на слот: если признак есть, а
+# регулярные выражения слот не заполнили - скорее всего, они не поняли формулировку
+SLOT_CUES: Dict[str, re.Pattern] = {
+    'name': re.compile(r'зовут|мое имя|моё имя|\bя\s*[-—]\s*[а-яё]'),
+    'location': re.compile(r'\bиз\b|\bживу\b|живем|город|нахожусь|прилет|прилеч|приед|местн'),
+    'goal': re.compile(r'для себя|для семьи|вложить|инвест|жить|переех|переезд|сдавать|сдач|аренд|пмж|сбереж'),
+    'payment': re.compile(r'оплат|плат|налич|ипотек|рассроч|кредит|банк|карт|крипт|перевод|свои деньги|накоплен'),
+    'requirements': re.compile(r'район|рядом|у моря|возле|ближе|центр|дом|квартир|студи|апарт|участ|комнат|таунхаус'),
+    'budget': re.compile(r'\d|миллион|млн|тысяч|\bтыс|бюджет|рубл|долл|евро'),
+    'urgency': re.compile(r'\d|завтра|недел|месяц|год|весн|лет[оа]|осен|зим|сроч|скоро|январ|феврал|март|апрел|'
+                          r'мая|июн|июл|август|сентябр|октябр|ноябр|декабр|понедельн|вторн|сред|четверг|пятниц|суббот|воскрес'),
+    'experience': re.compile(r'покупал|покупали|опыт|первый раз|впервые|уже есть|раньше|был[аи]? в сочи'),
+}
+
+_WORD = re.compile(r'[а-яёa-z0-9@+]+')
+
+
+def normalize_message(message: str) -> str:
+    """Нормализованный текст для ключа кэша: регистр, ё, пунктуация и пробелы не важны"""
+    return ' '.join(_WORD.findall(message.lower().replace('ё', 'е')))
+
+
+def message_key(message: str) -> str:
+    return hashlib.blake2b(normalize_message(message).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == '' or value == ()
+
+
+def slot_confidence(message_lower: str, lead: LeadData, slot: str) -> float:
+    """
+    Уверенность в том, что регулярные выражения извлекли из сообщения все
+    по слоту.
+
+    1.0 - слот уже заполнен; без признаков слота в сообщении - 0.8 (клиент,
+    скорее всего, говорит о другом), минус 0.2 для длинного ответа; с
+    признаком, но без извлеченного значения - 0.3 и 0.1.
+    """
+    for name in SLOTS[slot]:
+        if not _is_empty(getattr(lead, name)):
+            return 1.0
+    confidence = 0.3 if SLOT_CUES[slot].search(message_lower) else 0.8
+    if message_lower.count(' ') >= 5:
+        confidence -= 0.2
+    return confidence
+
+
+def coerce_fields(data: Any) -> Dict[str, Any]:
+    """Значения ответа LLM, приведенные к типам полей LeadData; прочее отбрасывается"""
+    if not isinstance(data, dict):
+        return {}
+    result = {}
+    for name, coerce in LLM_FIELDS.items():
+        if name in data:
+            value = coerce(data[name])
+            if value is not None:
+                result[name] = value
+    return result
+
+
+def merge_fields(lead: LeadData, values: Dict[str, Any]) -> LeadData:
+    """Дополняет только пустые поля лида: значения регулярных выражений и менеджера важнее"""
+    updates = {name: value for name, value in values.items() if _is_empty(getattr(lead, name))}
+    return lead.replace(**updates) if updates else lead
+
+
+def openai_field_extractor(client, model: str, timeout: float = 10.0) -> FieldExtractor:
+    """Структурированное извлечение через OpenAI (JSON mode)"""
+    async def extract(message: str) -> Dict[str, Any]:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": EXTRACTION_PROMPT},
+                {"role": "user", "content": message},
+            ],
+            temperature=0,
+            max_tokens=300,
+            response_format={"type": "json_object"},
+            timeout=timeout,
+        )
+        return json.loads(response.choices[0].message.content or '{}')
+    return extract
+
+
+class LLMFallbackExtractor:
+    """
+    Медленный путь извлечения для сообщений, которые регулярные выражения
+    поняли плохо.
+
+    submit() вызывается на каждое сообщение клиента после регулярных
+    выражений и стоит микросекунды: слоты, нужные текущему состоянию
+    диалога, оцениваются slot_confidence; если все уверенно - на этом все.
+    Иначе результат ищется в кэше по хешу нормализованного сообщения (при
+    попадании поля возвращаются сразу и попадают в лид этого же хода), а
+    при промахе LLM вызывается в фоновой задаче: ход не ждет ее, а
+    найденные поля слабых слотов позже записываются через merge (под
+    блокировкой сессии в MemoryService). Одинаковые сообщения, ожидающие
+    ответа, разделяют один вызов.
+    """
+
+    def __init__(self, extract: FieldExtractor, merge: MergeFunc, threshold: float = 0.5,
+                 cache_size: int = 10000, max_concurrency: int = 4, max_pending: int = 100):
+        self._extract = extract
+        self._merge = merge
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.stats: Dict[str, Any] = {
+            'scored': 0,           # сообщения клиента, прошедшие оценку
+            'slow_path': 0,        # из них с низкой уверенностью
+            'cache_hits': 0,
+            'inflight_joined': 0,  # ожидали уже идущий вызов с тем же сообщением
+            'llm_calls': 0,
+            'llm_errors': 0,
+            'llm_seconds': 0.0,
+            'dropped': 0,          # очередь фоновых задач переполнена
+            'merged_fields': 0,
+        }
+
+    def low_confidence_fields(self, message: str, state: DialogState, lead: LeadData) -> FrozenSet[str]:
+        """Поля слотов текущего состояния с уверенностью ниже порога"""
+        message_lower = message.lower()
+        fields = set()
+        for slot in STATE_SLOTS.get(state, ()):
+            if slot_confidence(message_lower, lead, slot) < self.threshold:
+                fields.update(SLOTS[slot])
+        return frozenset(fields)
+
+    def submit(self, session_id: str, message: str, state: DialogState,
+               lead: LeadData) -> Optional[Dict[str, Any]]:
+        """
+        Оценивает извлечение и при низкой уверенности запускает медленный путь.
+
+        Returns:
+            Поля из кэша, если ответ LLM на такое же сообщение уже есть, иначе None
+        """
+        self.stats['scored'] += 1
+        fields = self.low_confidence_fields(message, state, lead)
+        if not fields:
+            return None
+        self.stats['slow_path'] += 1
+
+        key = message_key(message)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return {name: value for name, value in cached.items() if name in fields} or None
+
+        if len(self._tasks) >= self.max_pending:
+            self.stats['dropped'] += 1
+            logger.warning(f"⚠️ Очередь LLM-извлечения переполнена, сообщение {session_id} пропущено")
+            return None
+        try:
+            # Чистый контекст: фоновая задача не должна унаследовать бюджет хода
+            task = asyncio.get_running_loop().create_task(
+                self._complete(session_id, key, message, fields), context=contextvars.Context()
+            )
+        except RuntimeError:
+            return None
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return None
+
+    async def _complete(self, session_id: str, key: str, message: str, fields: FrozenSet[str]):
+        try:
+            values = await self._fetch(key, message)
+            values = {name: value for name, value in values.items() if name in fields}
+            if values:
+                self.stats['merged_fields'] += await self._merge(session_id, values)
+        except Exception as e:
+            logger.error(f"❌ Ошибка LLM-извлечения для {session_id}: {e}")
+
+    async def _fetch(self, key: str, message: str) -> Dict[str, Any]:
+        """Ответ LLM на сообщение: из кэша, из идущего вызова или новым вызовом"""
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats['inflight_joined'] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            async with self._semaphore:
+                self.stats['llm_calls'] += 1
+                started = time.perf_counter()
+                try:
+                    values = coerce_fields(await self._extract(message))
+                except Exception:
+                    self.stats['llm_errors'] += 1
+                    raise
+                finally:
+                    self.stats['llm_seconds'] += time.perf_counter() - started
+            self._cache[key] = values
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            future.set_result(values)
+            return values
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Ожидающих может не быть - исключение считается полученным
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики и доли: как часто нужен медленный путь и как часто его спасает кэш"""
+        scored = self.stats['scored']
+        slow_path = self.stats['slow_path']
+        calls = self.stats['llm_calls']
+        return {
+            **self.stats,
+            'slow_path_rate': slow_path / scored if scored else 0.0,
+            'cache_hit_rate': (self.stats['cache_hits'] + self.stats['inflight_joined']) / slow_path
+            if slow_path else 0.0,
+            'llm_avg_seconds': self.stats['llm_seconds'] / calls if calls else 0.0,
+            'cache_size': len(self._cache),
+            'pending': len(self._tasks),
+        }
+
+    async def drain(self):
+        """Дожидается фоновых задач (для тестов и бенчмарков)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def close(self):
+        """Отменяет незавершенные вызовы при остановке сервиса"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -2,18 +2,33 @@
 Основной сервис памяти с интеграцией ZEP Cloud
 """
 import asyncio
+import json
 import logging
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import time
+from collections import OrderedDict
 from zep_cloud.client import AsyncZep
-from zep_cloud.types import Message
 
 from .models import DialogState, LeadData, ClientType
+from . import lead_scoring
 from .extractors import LeadDataExtractor, DialogStateExtractor
 from .analytics import AnalyticsService
 from .reminders import ReminderService
 from .session_manager import SessionManager, session_manager
+from .session_locks import SessionLockRegistry
+from .message_buffer import MessageBuffer
+from .history_buffer import HistoryCache
+from .negative_cache import NegativeCache
+from .outbox import DurableOutbox
+from .similarity_index import SimilarityIndex, numpy_available
+from .lead_index import LeadIndex
+from .llm_fallback import FieldExtractor, LLMFallbackExtractor, merge_fields
+from .resilience import (
+    CircuitBreaker, CircuitOpenError, GuardedMemoryBackend, ResilientCaller,
+    is_auth_error, is_retryable_error, turn_budget
+)
+from .backends import MemoryBackend, ZepMemoryBackend
 
 
 logger = logging.getLogger(__name__)
@@ -22,10 +37,24 @@ logger = logging.getLogger(__name__)
 class MemoryService:
     """Интеллектуальная система памяти с интеграцией ZEP Cloud"""
 
-    def __init__(self, zep_api_key: str, enable_memory: bool = True):
+    def __init__(self, zep_api_key: str, enable_memory: bool = True,
+                 backend: Optional[MemoryBackend] = None, outbox_path: Optional[str] = None,
+                 similarity_index_path: Optional[str] = None,
+                 llm_extractor: Optional[FieldExtractor] = None):
+        """
+        Args:
+            zep_api_key: API ключ ZEP Cloud (используется также аналитикой)
+            enable_memory: Включить хранение истории и данных лидов
+            backend: Хранилище памяти; по умолчанию ZEP Cloud при наличии ключа
+            outbox_path: Журнал записей, не отправленных из-за недоступности хранилища
+            similarity_index_path: Каталог локального индекса похожих кейсов
+            llm_extractor: Структурированное извлечение через LLM для сообщений,
+                которые регулярные выражения поняли неуверенно
+        """
         self.zep_api_key = zep_api_key
-        self.enable_memory = enable_memory and bool(zep_api_key)
+        self.enable_memory = enable_memory and (backend is not None or bool(zep_api_key))
         self.zep_client = None
+        self.backend: Optional[MemoryBackend] = None
         self._auth_error_detected = False
 
         # Локальный кэш для состояний и данных лидов
@@ -33,6 +62,53 @@ class MemoryService:
         self._cache_timestamps: Dict[str, float] = {}
         self._cache_ttl = 3600  # 1 час
 
+        self._message_buffer: Optional[MessageBuffer] = None
+        self._outbox: Optional[DurableOutbox] = None
+
+        # Общий circuit breaker для хранилища и аналитики ZEP; бюджет хода
+        # ограничивает суммарное ожидание хранилища в одном process_message
+        self._caller = ResilientCaller(CircuitBreaker(failure_threshold=5, recovery_timeout=30.0),
+                                       call_timeout=1.5)
+        self._turn_budget = 3.0
+
+        # Последние сообщения сессий: история читается из хранилища один раз
+        self._history = HistoryCache()
+
+        # Сессии, созданные в этом процессе и еще не сохраненные: в хранилище
+        # их нет, читать их оттуда бессмысленно
+        self._created_sessions: "OrderedDict[str, None]" = OrderedDict()
+        self._max_created_sessions = 100000
+        # Сессии, для которых хранилище недавно вернуло пустой результат
+        self._negative_cache = NegativeCache(ttl=300.0)
+
+        # Счетчики сэкономленных обращений к хранилищу
+        self.stats: Dict[str, int] = {
+            'remote_reads': 0,
+            'remote_reads_saved_new_session': 0,
+            'remote_reads_saved_negative_cache': 0,
+        }
+
+        # Блокировки сессий: чтение-изменение-запись LeadData выполняется последовательно
+        self._session_locks = SessionLockRegistry()
+
+        # Истекшие сессии освобождают и локальные кэши сервиса
+        session_manager.add_expiry_listener(self._on_session_expired)
+
+        # Локальный индекс похожих кейсов: поиск без сети и без ZEP
+        self._similarity_index: Optional[SimilarityIndex] = None
+        if numpy_available():
+            try:
+                self._similarity_index = (SimilarityIndex(similarity_index_path)
+                                          if similarity_index_path else SimilarityIndex())
+            except Exception as e:
+                logger.error(f"❌ Ошибка инициализации индекса похожих кейсов: {e}")
+        else:
+            logger.warning("⚠️ numpy не установлен, поиск похожих кейсов выполняется через хранилище")
+
+        # Индекс лидов для запросов админки и выгрузки в Google Sheets
+        self.lead_index = LeadIndex()
+        self._lead_index_warmup: Optional[asyncio.Task] = None
+
         # Инициализируем AnalyticsService только если есть ZEP API ключ
         if zep_api_key:
             self.analytics = AnalyticsService(zep_api_key)
@@ -42,15 +118,64 @@ class MemoryService:
 
         self.reminders = ReminderService()
 
+        # Медленный путь извлечения: LLM в фоне, только при низкой уверенности
+        self._llm_fallback: Optional[LLMFallbackExtractor] = (
+            LLMFallbackExtractor(llm_extractor, self._merge_llm_fields) if llm_extractor else None
+        )
+
         if self.enable_memory:
-            try:
-                self.zep_client = AsyncZep(api_key=zep_api_key)
-                logger.info("✅ Инициализирован ZEP Cloud клиент")
-            except Exception as e:
-                logger.error(f"❌ Ошибка инициализации ZEP Cloud: {e}")
-                self.enable_memory = False
-                logger.warning("⚠️ Работаем в режиме без ZEP памяти из-за ошибки инициализации")
+            if backend is not None:
+                self.backend = backend
+                logger.info(f"✅ Используется хранилище памяти: {backend.name}")
+            else:
+                try:
+                    self.zep_client = AsyncZep(api_key=zep_api_key)
+                    self.backend = ZepMemoryBackend(self.zep_client)
+                    logger.info("✅ Инициализирован ZEP Cloud клиент")
+                except Exception as e:
+                    logger.error(f"❌ Ошибка инициализации ZEP Cloud: {e}")
+                    self.enable_memory = False
+                    logger.warning("⚠️ Работаем в режиме без ZEP памяти из-за ошибки инициализации")
+
+        if self.backend is not None:
+            # Все обращения к хранилищу идут через общий таймаут, повторы и circuit breaker
+            self.backend = GuardedMemoryBackend(self.backend, self._caller)
+            # Записи, не дошедшие до хранилища, переживают сбой и рестарт;
+            # без пути журнала (бенчмарки, backfill) outbox не используется
+            if outbox_path:
+                self._outbox = DurableOutbox(outbox_path, session_locks=self._session_locks)
+            # Сообщения хода отправляются в хранилище одним вызовом
+            self._message_buffer = MessageBuffer(self._send_messages)
+
+    async def start(self):
+        """Запускает досылку записей outbox и заполнение индекса лидов из восстановленных сессий"""
+        self._lead_index_warmup = asyncio.create_task(self._warm_lead_index())
+
+        if self._outbox and self._outbox.pending_count():
+            logger.info(f"📤 В outbox {self._outbox.pending_count()} неотправленных записей, запускаем досылку")
+            self._outbox.start(self.backend, self._caller.breaker)
     
+    async def _warm_lead_index(self, batch_size: int = 1000):
+        """
+        Заполняет индекс лидов из сессий, восстановленных из журнала.
+
+        Данные сессий разбираются здесь, а не при восстановлении, пачками с
+        передачей управления между ними, чтобы не задерживать первые ответы.
+        """
+        indexed = 0
+        session_ids = list(session_manager.active_sessions)
+        for start in range(0, len(session_ids), batch_size):
+            for session_id in session_ids[start:start + batch_size]:
+                if session_id in self.lead_index:
+                    continue  # Уже сохранен в этом процессе - там свежее
+                lead = session_manager.get_session_lead(session_id)
+                if lead is not None:
+                    self.lead_index.update(session_id, lead)
+                    indexed += 1
+            await asyncio.sleep(0)
+        if indexed:
+            logger.info(f"🗂️ В индекс лидов загружено {indexed} лидов из восстановленных сессий")
+
     async def process_message(self, user_id: str, message_text: str,
                             message_type: str = "user", chat_id: Optional[str] = None,
                             existing_session_id: Optional[str] = None) -> Dict[str, Any]:
@@ -73,7 +198,20 @@ class MemoryService:
             chat_id=chat_id,
             existing_session_id=existing_session_id
         )
-        
+
+        if not existing_session_id:
+            # Только что созданная сессия: ни истории, ни данных в хранилище еще нет
+            self._mark_session_created(session_id)
+
+        # Сериализуем обработку в рамках сессии, чтобы параллельные сообщения
+        # не перезаписывали извлеченные друг другом поля
+        async with self._session_locks.acquire(session_id):
+            with turn_budget(self._turn_budget):
+                return await self._process_message_locked(session_id, message_text, message_type)
+
+    async def _process_message_locked(self, session_id: str, message_text: str,
+                                      message_type: str) -> Dict[str, Any]:
+        """Обработка сообщения под блокировкой сессии"""
         try:
             # Получаем текущие данные о лиде
             current_lead = await self.get_lead_data(session_id)
@@ -83,9 +221,17 @@ class MemoryService:
                 message_text, current_lead
             )
             
-            # Определяем новое состояние диалога
             # ИСПРАВЛЕНИЕ: используем текущее состояние из current_lead, а не updated_lead
             current_state = current_lead.current_dialog_state
+
+            # Неуверенное извлечение уходит в LLM в фоне; готовый ответ из кэша
+            # попадает в лид сразу
+            if self._llm_fallback is not None and message_type == "user":
+                cached_fields = self._llm_fallback.submit(session_id, message_text, current_state, updated_lead)
+                if cached_fields:
+                    updated_lead = merge_fields(updated_lead, cached_fields)
+
+            # Определяем новое состояние диалога
             new_state = DialogStateExtractor.determine_state(
                 message_text, current_state, updated_lead
             )
@@ -103,12 +249,15 @@ class MemoryService:
             status_changed = updated_lead.qualification_status != qualification_status
             
             # Обновляем данные
-            updated_lead.current_dialog_state = new_state
-            updated_lead.qualification_status = qualification_status
+            updated_lead = updated_lead.replace(current_dialog_state=new_state,
+                                                qualification_status=qualification_status)
             
             # Сохраняем в памяти
             if self.enable_memory:
                 await self._save_to_memory(session_id, message_text, updated_lead, message_type)
+
+            if message_type == "user":
+                self._index_message(session_id, message_text, updated_lead)
             
             # Сохраняем данные лида
             await self.save_lead_data(session_id, updated_lead)
@@ -117,19 +266,22 @@ class MemoryService:
             logger.info(f"🔄 ИТОГОВОЕ СОСТОЯНИЕ после обработки для {session_id}:")
             logger.info(f"   State: {current_state.value} → {new_state.value}")
             logger.info(f"   Qualification: {qualification_status.value}")
-            logger.info(f"   LeadData: {json.dumps(updated_lead.to_dict(), ensure_ascii=False, indent=2)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"   LeadData: {json.dumps(updated_lead.to_dict(), ensure_ascii=False, indent=2)}")
 
             # Аналитика (только если доступна)
             if self.analytics:
                 try:
                     if state_changed:
-                        await self.analytics.track_event(
+                        await self._caller.call(
+                            'track_event', self.analytics.track_event,
                             session_id, 'state_change',
-                            {'from': updated_lead.current_dialog_state.value, 'to': new_state.value}
+                            {'from': current_state.value, 'to': new_state.value}
                         )
 
                     if status_changed:
-                        await self.analytics.track_event(
+                        await self._caller.call(
+                            'track_event', self.analytics.track_event,
                             session_id, 'qualification_change',
                             {'status': qualification_status.value}
                         )
@@ -141,6 +293,9 @@ class MemoryService:
             
             # Генерируем рекомендации для ответа
             recommendations = await self._generate_recommendations(updated_lead, new_state, session_id)
+            if recommendations['next_questions']:
+                updated_lead = self._record_asked_questions(session_id, updated_lead,
+                                                            recommendations['next_questions'])
             
             return {
                 'lead_data': updated_lead,
@@ -180,68 +335,143 @@ class MemoryService:
             return LeadData()
 
         # 3. Проверяем кэш сессии
-        session_info = session_manager.get_session_info(session_id)
-        if session_info and 'data_collected' in session_info:
+        lead_data = session_manager.get_session_lead(session_id)
+        if lead_data is not None:
             logger.debug(f"✅ Данные лида получены из кэша сессии для {session_id}")
-            lead_data = LeadData.from_dict(session_info['data_collected'])
             # Сохраняем в локальный кэш
             self._local_cache[session_id] = lead_data
             self._cache_timestamps[session_id] = current_time
             return lead_data
 
-        max_retries = 3
-        retry_delay = 0.5
+        # 4. Неотправленные метаданные из outbox новее, чем данные в хранилище
+        pending_metadata = self._outbox.pending_metadata(session_id) if self._outbox else None
+        if pending_metadata:
+            logger.debug(f"📤 Данные лида получены из outbox для {session_id}")
+            lead_data = LeadData.from_dict(pending_metadata)
+            self._local_cache[session_id] = lead_data
+            self._cache_timestamps[session_id] = current_time
+            return lead_data
 
-        for attempt in range(max_retries):
+        # 5. Сессия создана здесь или хранилище недавно ответило "нет данных"
+        if session_id in self._created_sessions:
+            self.stats['remote_reads_saved_new_session'] += 1
+            logger.debug(f"⚡ Новая сессия {session_id}, чтение из хранилища пропущено")
+            return self._cache_new_lead(session_id, current_time)
+        if session_id in self._negative_cache:
+            self.stats['remote_reads_saved_negative_cache'] += 1
+            logger.debug(f"⚡ Сессия {session_id} в негативном кэше, чтение из хранилища пропущено")
+            return self._cache_new_lead(session_id, current_time)
+
+        try:
+            # Получаем метаданные сессии из хранилища (повторы и таймауты - в ResilientCaller)
+            self.stats['remote_reads'] += 1
+            metadata = await self.backend.get_session_metadata(session_id)
+
+        except Exception as e:
+            if isinstance(e, CircuitOpenError):
+                logger.warning(f"⚡ Хранилище недоступно, работаем из локального кэша для {session_id}")
+            else:
+                logger.warning(f"⚠️ Не удалось получить данные лида для {session_id}: {e}")
+            # Деградация: устаревший локальный кэш лучше пустых данных
+            if session_id in self._local_cache:
+                return self._local_cache[session_id]
+            return LeadData()
+
+        if metadata:
+            lead_data = LeadData.from_dict(metadata)
+            # Сохраняем в оба кэша для будущего использования
+            session_manager.set_session_data(session_id, lead_data)
+            self._local_cache[session_id] = lead_data
+            self._cache_timestamps[session_id] = current_time
+            logger.info(f"✅ Данные лида получены из {self.backend.name} для {session_id}:")
+            logger.info(f"📥 ZEP LOAD DATA: {json.dumps(metadata, ensure_ascii=False, indent=2)}")
+
+            # Логируем в dialog_logger
             try:
-                # Получаем сессию из ZEP
-                session = await self.zep_client.memory.get_session(session_id)
-
-                if session and hasattr(session, 'metadata') and session.metadata:
-                    lead_data = LeadData.from_dict(session.metadata)
-                    # Сохраняем в оба кэша для будущего использования
-                    if session_info:
-                        session_info['data_collected'] = session.metadata
-                    self._local_cache[session_id] = lead_data
-                    self._cache_timestamps[session_id] = current_time
-                    logger.info(f"✅ Данные лида получены из ZEP для {session_id}:")
-                    logger.info(f"📥 ZEP LOAD DATA: {json.dumps(session.metadata, ensure_ascii=False, indent=2)}")
-
-                    # Логируем в dialog_logger
-                    try:
-                        from bot.dialog_logger import dialog_logger
-                        user_id = session_id.split('_')[0] if '_' in session_id else session_id
-                        dialog_logger.log_zep_data(session_id, user_id, 'load', session.metadata)
-                    except Exception as log_error:
-                        logger.warning(f"⚠️ Ошибка логирования ZEP load: {log_error}")
-
-                    return lead_data
-                else:
-                    logger.debug(f"ℹ️ Нет данных лида в ZEP для {session_id}, создаем новые")
-                    new_lead = LeadData()
-                    # Сохраняем в кэш даже пустые данные
-                    self._local_cache[session_id] = new_lead
-                    self._cache_timestamps[session_id] = current_time
-                    return new_lead
+                from bot.dialog_logger import dialog_logger
+                user_id = session_id.split('_')[0] if '_' in session_id else session_id
+                dialog_logger.log_zep_data(session_id, user_id, 'load', metadata)
+            except Exception as log_error:
+                logger.warning(f"⚠️ Ошибка логирования ZEP load: {log_error}")
 
-            except Exception as e:
-                error_message = str(e).lower()
-
-                # Проверяем на rate limiting
-                if '429' in error_message or 'too many' in error_message:
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (2 ** attempt)
-                        logger.warning(f"⚠️ Rate limit при получении данных для {session_id}, попытка {attempt + 1}/{max_retries}, ожидание {wait_time}с")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        logger.error(f"❌ Превышено количество попыток получения данных для {session_id} из-за rate limit")
-                else:
-                    logger.warning(f"⚠️ Не удалось получить данные лида для {session_id}: {e}")
-
-                return LeadData()
-
-        return LeadData()
+            return lead_data
+
+        logger.debug(f"ℹ️ Нет данных лида в ZEP для {session_id}, создаем новые")
+        self._negative_cache.add(session_id)
+        # Сохраняем в кэш даже пустые данные
+        return self._cache_new_lead(session_id, current_time)
+
+    async def _merge_llm_fields(self, session_id: str, values: Dict[str, Any]) -> int:
+        """
+        Дополняет лид полями, извлеченными LLM в фоне.
+
+        Выполняется под блокировкой сессии по свежим данным лида: за время
+        вызова LLM могли прийти новые сообщения, а заполненные поля не
+        перезаписываются. Состояние диалога пересчитается на следующем
+        сообщении, статус квалификации - сразу.
+        """
+        async with self._session_locks.acquire(session_id):
+            lead = await self.get_lead_data(session_id)
+            merged = merge_fields(lead, values)
+            if merged is lead:
+                return 0
+            merged = merged.replace(
+                qualification_status=DialogStateExtractor.calculate_qualification_status(merged))
+            updated = [name for name in values if getattr(merged, name) != getattr(lead, name)]
+            logger.info(f"🧠 LLM дополнил данные лида {session_id}: {', '.join(updated)}")
+            await self.save_lead_data(session_id, merged)
+            return len(updated)
+
+    def _cache_new_lead(self, session_id: str, current_time: float) -> LeadData:
+        """Создает пустые данные лида и кладет их в локальный кэш"""
+        new_lead = LeadData()
+        self._local_cache[session_id] = new_lead
+        self._cache_timestamps[session_id] = current_time
+        return new_lead
+
+    def _mark_session_created(self, session_id: str):
+        """Запоминает сессию, созданную в этом процессе"""
+        self._created_sessions[session_id] = None
+        if len(self._created_sessions) > self._max_created_sessions:
+            self._created_sessions.popitem(last=False)
+        self._history.mark_new(session_id)
+
+    def _on_session_expired(self, session_id: str):
+        """Освобождает локальные данные сессии, удаленной по TTL"""
+        if not self.enable_memory:
+            # Без хранилища локальный кэш - единственная копия данных лида
+            return
+        self._local_cache.pop(session_id, None)
+        self._cache_timestamps.pop(session_id, None)
+        self._history.discard(session_id)
+
+    def _mark_session_persisted(self, session_id: str):
+        """Данные сессии записаны в хранилище - быстрые пути больше не применимы"""
+        self._created_sessions.pop(session_id, None)
+        self._negative_cache.discard(session_id)
+
+    def get_memory_stats(self) -> Dict[str, Any]:
+        """Статистика обращений к хранилищу и локальных кэшей"""
+        return {
+            **self.stats,
+            'negative_cache_size': len(self._negative_cache),
+            'created_sessions_pending': len(self._created_sessions),
+            'history_sessions': len(self._history),
+            'history_hits': self._history.hits,
+            'history_warmups': self._history.warmups,
+            'message_batches_sent': self._message_buffer.batches_sent if self._message_buffer else 0,
+            'messages_enqueued': self._message_buffer.messages_enqueued if self._message_buffer else 0,
+            'outbox_pending': self._outbox.pending_count() if self._outbox else 0,
+            'similarity_documents': len(self._similarity_index) if self._similarity_index else 0,
+            'indexed_leads': len(self.lead_index),
+            'outbox_replayed': self._outbox.stats['replayed'] if self._outbox else 0,
+            'circuit_state': self._caller.breaker.state,
+            'circuit_times_opened': self._caller.breaker.times_opened,
+            'circuit_rejected_calls': self._caller.breaker.rejected_calls,
+            **{f'storage_{key}': value for key, value in self._caller.stats.items()},
+            **({f'llm_extraction_{key}': value for key, value in self._llm_fallback.get_stats().items()}
+               if self._llm_fallback else {}),
+        }
     
     async def save_lead_data(self, session_id: str, lead_data: LeadData):
         """Сохраняет данные о лиде в память с повторными попытками"""
@@ -251,141 +481,187 @@ class MemoryService:
         self._local_cache[session_id] = lead_data
         self._cache_timestamps[session_id] = current_time
 
-        # Также сохраняем в кэш сессии
-        session_info = session_manager.get_session_info(session_id)
-        if session_info:
-            session_info['data_collected'] = lead_data.to_dict()
+        # Также сохраняем в кэш сессии: снимок неизменяем, копия не нужна
+        session_manager.set_session_data(session_id, lead_data)
 
         logger.debug(f"💾 Данные лида сохранены в локальный кэш для {session_id}")
 
+        self._index_lead_profile(session_id, lead_data)
+        self.lead_index.update(session_id, lead_data)
+
         if not self.enable_memory:
             return
 
-        max_retries = 3
-        retry_delay = 1.0  # секунды
-
-        for attempt in range(max_retries):
+        try:
+            # Обновляем метаданные сессии в хранилище (повторы и таймауты - в ResilientCaller).
+            # Плотный словарь: хранилище объединяет метаданные, и очищенное поле
+            # должно перезаписать старое значение
+            lead_dict = lead_data.to_dict()
+            await self.backend.update_session_metadata(session_id, lead_dict)
+            self._mark_session_persisted(session_id)
+            # Более старая версия из outbox не должна перезаписать свежие данные
+            if self._outbox:
+                self._outbox.discard_metadata(session_id)
+            logger.info(f"✅ Данные лида сохранены в {self.backend.name} для {session_id}:")
+            logger.info(f"📋 ZEP SAVE DATA: {json.dumps(lead_dict, ensure_ascii=False, indent=2)}")
+
+            # Логируем в dialog_logger
             try:
-                # Обновляем метаданные сессии в ZEP
-                lead_dict = lead_data.to_dict()
-                await self.zep_client.memory.update_session(
-                    session_id=session_id,
-                    metadata=lead_dict
-                )
-                logger.info(f"✅ Данные лида сохранены в ZEP для {session_id}:")
-                logger.info(f"📋 ZEP SAVE DATA: {json.dumps(lead_dict, ensure_ascii=False, indent=2)}")
+                from bot.dialog_logger import dialog_logger
+                user_id = session_id.split('_')[0] if '_' in session_id else session_id
+                dialog_logger.log_zep_data(session_id, user_id, 'save', lead_dict)
+            except Exception as log_error:
+                logger.warning(f"⚠️ Ошибка логирования ZEP save: {log_error}")
 
-                # Логируем в dialog_logger
-                try:
-                    from bot.dialog_logger import dialog_logger
-                    user_id = session_id.split('_')[0] if '_' in session_id else session_id
-                    dialog_logger.log_zep_data(session_id, user_id, 'save', lead_dict)
-                except Exception as log_error:
-                    logger.warning(f"⚠️ Ошибка логирования ZEP save: {log_error}")
+            return
 
+        except Exception as e:
+            # Проверяем на аутентификационные ошибки
+            if is_auth_error(e):
+                if not self._auth_error_detected:
+                    self._auth_error_detected = True
+                    logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: ZEP API ключ недействителен (401 Unauthorized)")
+                    logger.error(f"   Проверьте переменную окружения ZEP_API_KEY")
+                    logger.error(f"   Длина ключа: {len(self.zep_api_key or '')}")
+                    logger.error(f"   Ключ начинается с: {self.zep_api_key[:8] if self.zep_api_key else 'пусто'}")
+                    # Circuit breaker уже открыт и периодически проверяет ключ;
+                    # после его замены outbox дошлет накопленные данные
+                    logger.warning(f"⚠️ Данные лидов сохраняются в outbox до восстановления доступа")
+                self._enqueue_metadata(session_id, lead_data)
+            elif isinstance(e, CircuitOpenError) or is_retryable_error(e):
+                logger.warning(f"⚡ Хранилище недоступно, данные лида {session_id} сохранены в outbox")
+                self._enqueue_metadata(session_id, lead_data)
+            else:
+                logger.error(f"❌ Ошибка сохранения данных лида для {session_id}: {e}")
+    
+    def _enqueue_metadata(self, session_id: str, lead_data: LeadData):
+        """Откладывает сохранение данных лида до восстановления хранилища"""
+        if not self._outbox:
+            logger.warning(f"⚠️ Outbox не настроен, данные лида {session_id} есть только в локальном кэше")
+            return
+        try:
+            self._outbox.enqueue_metadata(session_id, lead_data.to_dict())
+            # Данные будут в хранилище после досылки: быстрые пути "данных нет" больше не применимы
+            self._mark_session_persisted(session_id)
+            self._outbox.start(self.backend, self._caller.breaker)
+        except Exception as outbox_error:
+            logger.error(f"❌ Ошибка записи в outbox для {session_id}: {outbox_error}")
+
+    async def _send_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        """Отправляет пачку сообщений, при сбое хранилища откладывает ее в outbox"""
+        if not (self._outbox and self._outbox.has_pending_messages(session_id)):
+            try:
+                await self.backend.add_messages(session_id, messages)
                 return
-
             except Exception as e:
-                error_message = str(e).lower()
-
-                # Проверяем на аутентификационные ошибки
-                if '401' in error_message or 'unauthorized' in error_message:
-                    if not self._auth_error_detected:
-                        self._auth_error_detected = True
-                        logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: ZEP API ключ недействителен (401 Unauthorized)")
-                        logger.error(f"   Проверьте переменную окружения ZEP_API_KEY")
-                        logger.error(f"   Длина ключа: {len(self.zep_api_key or '')}")
-                        logger.error(f"   Ключ начинается с: {self.zep_api_key[:8] if self.zep_api_key else 'пусто'}")
-
-                    # Отключаем ZEP память и работаем в режиме кэша
-                    self.enable_memory = False
-                    logger.warning(f"⚠️ Отключаем ZEP память из-за ошибки аутентификации")
-
-                    # Сохраняем в кэш сессии
-                    try:
-                        session_info = session_manager.get_session_info(session_id)
-                        if session_info:
-                            session_info['data_collected'] = lead_data.to_dict()
-                            logger.info(f"📝 Данные сохранены в кэш сессии для {session_id} (режим без ZEP)")
-                    except Exception as cache_error:
-                        logger.error(f"❌ Ошибка сохранения в кэш для {session_id}: {cache_error}")
-
+                if not (isinstance(e, CircuitOpenError) or is_auth_error(e) or is_retryable_error(e)):
+                    raise
+                if not self._outbox:
+                    logger.warning(f"⚠️ Хранилище недоступно, outbox не настроен: "
+                                   f"{len(messages)} сообщений {session_id} не сохранены")
                     return
+                logger.warning(f"⚡ Хранилище недоступно, {len(messages)} сообщений {session_id} сохранены в outbox")
+        # Пока в outbox есть сообщения сессии, новые идут за ними, чтобы не нарушить порядок
+        self._outbox.enqueue_messages(session_id, messages)
+        self._outbox.start(self.backend, self._caller.breaker)
 
-                # Проверяем на rate limiting
-                elif '429' in error_message or 'too many' in error_message:
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (2 ** attempt)  # Экспоненциальная задержка
-                        logger.warning(f"⚠️ Rate limit для {session_id}, попытка {attempt + 1}/{max_retries}, ожидание {wait_time}с")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        logger.error(f"❌ Превышено количество попыток сохранения для {session_id} из-за rate limit")
-                else:
-                    logger.error(f"❌ Ошибка сохранения данных лида для {session_id}: {e}")
-
-                # В последнюю очередь пробуем сохранить в память сессии
-                try:
-                    session_info = session_manager.get_session_info(session_id)
-                    if session_info:
-                        session_info['data_collected'] = lead_data.to_dict()
-                        logger.info(f"📝 Данные сохранены в кэш сессии для {session_id}")
-                except Exception as cache_error:
-                    logger.error(f"❌ Ошибка сохранения в кэш для {session_id}: {cache_error}")
-
-                return
-    
     async def get_dialog_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Получает историю диалога"""
         if not self.enable_memory:
             return []
         
+        history = self._history.get(session_id, limit)
+        if history is not None:
+            return history
+
         try:
-            memory = await self.zep_client.memory.get(session_id=session_id)
-            
-            if memory and memory.messages:
-                return [
-                    {
-                        'role': msg.role_type,  # Используем role_type для стандартных ролей user/assistant
-                        'content': msg.content,
-                        'timestamp': msg.created_at,
-                        'metadata': getattr(msg, 'metadata', {}),
-                        'speaker_name': msg.role  # Сохраняем имя говорящего отдельно
-                    }
-                    for msg in memory.messages[-limit:]
-                ]
-            return []
+            await self._warm_history(session_id)
+            return self._history.get(session_id, limit) or []
             
         except Exception as e:
             logger.error(f"❌ Ошибка получения истории для {session_id}: {e}")
             return []
+
+    async def _warm_history(self, session_id: str):
+        """Однократно загружает историю сессии из хранилища в локальный буфер"""
+        messages = await self.backend.get_messages(
+            session_id, last_n=self._history.capacity_per_session
+        )
+        # Сообщения из буфера отправки в хранилище еще не попали
+        for msg in self._message_buffer.pending(session_id):
+            messages.append({
+                'role': msg['role_type'],
+                'content': msg['content'],
+                'timestamp': msg['metadata'].get('timestamp'),
+                'metadata': msg['metadata'],
+                'speaker_name': msg['role']
+            })
+        self._history.warm(session_id, messages)
+        logger.debug(f"📚 История сессии {session_id} загружена в локальный буфер: {len(messages)} сообщений")
     
-    async def search_similar_cases(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Поиск похожих кейсов в памяти"""
-        if not self.enable_memory:
-            return []
-        
+    async def search_similar_cases(self, query: str, limit: int = 5,
+                                   exclude_session: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Поиск похожих кейсов: локальный индекс, при его отсутствии - хранилище"""
         try:
-            # Используем поиск ZEP для нахождения похожих диалогов
-            results = await self.zep_client.memory.search_memory(
-                session_ids=[],  # Поиск по всем сессиям
-                text=query,
-                limit=limit
-            )
-            
-            return [
-                {
-                    'session_id': result.session_id,
-                    'content': result.message.content,
-                    'score': result.distance,
-                    'metadata': getattr(result.message, 'metadata', {})
-                }
-                for result in results
-            ] if results else []
+            if self._similarity_index is not None:
+                # Скалярные произведения по всей матрице - вне event loop
+                return await asyncio.to_thread(self._similarity_index.search, query, limit, exclude_session)
+
+            if not self.enable_memory:
+                return []
+
+            # Поиск похожих диалогов по всем сессиям
+            return await self.backend.search_messages(query, limit=limit)
             
         except Exception as e:
             logger.error(f"❌ Ошибка поиска похожих кейсов: {e}")
             return []
+
+    def _index_message(self, session_id: str, message_text: str, lead_data: LeadData):
+        """Добавляет реплику клиента в локальный индекс похожих кейсов"""
+        if self._similarity_index is None:
+            return
+        try:
+            self._similarity_index.add(message_text, session_id, metadata={
+                'kind': 'message',
+                'dialog_state': lead_data.current_dialog_state.value,
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка индексации сообщения для {session_id}: {e}")
+
+    def _index_lead_profile(self, session_id: str, lead_data: LeadData):
+        """Обновляет профиль лида в локальном индексе, если он изменился"""
+        if self._similarity_index is None:
+            return
+        key = f"lead:{session_id}"
+        profile = self._lead_profile_text(lead_data)
+        if not profile or self._similarity_index.get_content(key) == profile:
+            return
+        try:
+            self._similarity_index.add(profile, session_id, key=key, metadata={
+                'kind': 'lead',
+                'qualification_status': lead_data.qualification_status.value if lead_data.qualification_status else None,
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка индексации профиля лида для {session_id}: {e}")
+
+    @staticmethod
+    def _lead_profile_text(lead_data: LeadData) -> str:
+        """Текстовое описание профиля лида для поиска похожих клиентов"""
+        parts = []
+        if lead_data.property_type: parts.append(lead_data.property_type)
+        if lead_data.rooms_count: parts.append(f"{lead_data.rooms_count} комн")
+        if lead_data.view_preference: parts.append(f"вид {lead_data.view_preference}")
+        if lead_data.preferred_locations: parts.append(' '.join(lead_data.preferred_locations))
+        if lead_data.automation_goal: parts.append(lead_data.automation_goal.value)
+        if lead_data.payment_type: parts.append(lead_data.payment_type.value)
+        if lead_data.budget_min or lead_data.budget_max:
+            parts.append(f"бюджет {lead_data.budget_min or ''}-{lead_data.budget_max or ''}")
+        if lead_data.city: parts.append(f"из {lead_data.city}")
+        if lead_data.business_sphere: parts.append(lead_data.business_sphere)
+        if lead_data.completion_date: parts.append(f"сдача {lead_data.completion_date}")
+        if lead_data.comments: parts.append(lead_data.comments)
+        return '; '.join(str(part) for part in parts)
     
     async def _save_to_memory(self, session_id: str, message_text: str, 
                             lead_data: LeadData, message_type: str):
@@ -399,26 +675,58 @@ class MemoryService:
                 role_name = "Алёна"
                 role_type = "assistant"
                 
-            # Создаем сообщение для ZEP
-            message = Message(
-                role=role_name,
-                role_type=role_type,
-                content=message_text,
-                metadata={
+            # Создаем сообщение для хранилища
+            message = {
+                'role': role_name,
+                'role_type': role_type,
+                'content': message_text,
+                'metadata': {
                     'dialog_state': lead_data.current_dialog_state.value,
                     'qualification_status': lead_data.qualification_status.value if lead_data.qualification_status else None,
                     'timestamp': datetime.now().isoformat()
                 }
-            )
+            }
             
-            # Добавляем сообщение в память
-            await self.zep_client.memory.add(
-                session_id=session_id,
-                messages=[message]
+            # Локальная история должна быть прогрета до первой нашей записи,
+            # иначе в ней окажутся только новые сообщения
+            if not self._history.is_warm(session_id):
+                try:
+                    await self._warm_history(session_id)
+                except Exception as warm_error:
+                    logger.warning(f"⚠️ Не удалось загрузить историю для {session_id}: {warm_error}")
+
+            self._history.append(
+                session_id, role_type, message_text, time.time(),
+                metadata=message['metadata'], speaker_name=role_name
+            )
+
+            # Ставим сообщение в буфер; ответ ассистента завершает ход и
+            # отправляет все сообщения хода одним запросом
+            await self._message_buffer.add(
+                session_id, message, flush_now=(role_type == "assistant")
             )
             
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения в ZEP память для {session_id}: {e}")
+
+    async def shutdown(self):
+        """Досылает буферизованные сообщения и закрывает outbox перед остановкой процесса"""
+        session_manager.remove_expiry_listener(self._on_session_expired)
+        if self._llm_fallback:
+            await self._llm_fallback.close()
+        if self._message_buffer:
+            pending = self._message_buffer.pending_count()
+            await self._message_buffer.close()
+            if pending:
+                logger.info(f"📤 При остановке отправлено {pending} буферизованных сообщений")
+        if self._outbox:
+            # Неотправленное остается в журнале и будет дослано после запуска
+            await self._outbox.close()
+        if self._similarity_index:
+            await self._similarity_index.drain()
+            self._similarity_index.close()
+        if self.backend:
+            await self.backend.close()
     
     async def _check_reminders(self, session_id: str, lead_data: LeadData, 
                              current_state: DialogState):
@@ -464,28 +772,10 @@ class MemoryService:
         }
 
         try:
-            # Рекомендации в зависимости от состояния
-            if current_state == DialogState.S0_GREETING:
-                recommendations['next_questions'] = [
-                    "Для себя ищете недвижимость или как инвестицию?",
-                    "Вы сейчас в Сочи? Если нет — из какого города?"
-                ]
-            
-            elif current_state == DialogState.S1_BUSINESS:
-                if not lead_data.automation_goal:
-                    recommendations['next_questions'] = [
-                        "Для себя ищете жилье или как инвестицию?",
-                        "Цель покупки: ПМЖ, сдача в аренду или сбережения?"
-                    ]
-            
-            elif current_state == DialogState.S2_GOAL:
-                if not lead_data.budget_min:
-                    recommendations['next_questions'] = [
-                        "На какой бюджет мне ориентироваться?",
-                        "Есть решение: AI-ассистент от $350. Такой диапазон рассматриваете?"
-                    ]
-            
-            elif current_state == DialogState.S8_ACTION:
+            # Рекомендации в зависимости от состояния и незаполненных полей
+            recommendations['next_questions'] = lead_scoring.next_questions(current_state, lead_data)
+
+            if current_state == DialogState.S8_ACTION:
                 if lead_data.qualification_status == ClientType.HOT:
                     recommendations['demo_ready'] = True
                     recommendations['suggested_responses'] = [
@@ -511,52 +801,26 @@ class MemoryService:
                 if not recommendations['next_questions']:
                     recommendations['next_questions'] = self._get_alternative_questions(current_state, lead_data, session_id)
 
-            # Записываем заданные вопросы в историю сессии и LeadData
-            for question in recommendations['next_questions']:
-                session_manager.record_asked_question(session_id, question)
-                if question not in lead_data.asked_questions:
-                    lead_data.asked_questions.append(question)
-
-            # Обновляем последний заданный вопрос
-            if recommendations['next_questions']:
-                lead_data.last_question_asked = recommendations['next_questions'][0]
-
             return recommendations
 
         except Exception as e:
             logger.error(f"❌ Ошибка генерации рекомендаций: {e}")
             return recommendations
 
+    def _record_asked_questions(self, session_id: str, lead_data: LeadData, questions: List[str]) -> LeadData:
+        """Записывает заданные вопросы в историю сессии и в новый снимок LeadData"""
+        for question in questions:
+            session_manager.record_asked_question(session_id, question)
+        updated_lead = lead_data.with_questions_asked(questions).replace(last_question_asked=questions[0])
+        # Снимок попадет в хранилище при следующем сохранении, как и раньше;
+        # журнал фиксирует его сразу, чтобы после рестарта вопросы не повторялись
+        self._local_cache[session_id] = updated_lead
+        session_manager.set_session_data(session_id, updated_lead)
+        return updated_lead
+
     def _get_alternative_questions(self, current_state: DialogState, lead_data: LeadData, session_id: str) -> List[str]:
         """Получает альтернативные вопросы, если все стандартные уже задавались"""
-        alternative_questions = []
-
-        if current_state == DialogState.S0_GREETING:
-            alternative_questions = [
-                "Расскажите, пожалуйста, подробнее о вашей ситуации",
-                "Что вас привело к поиску недвижимости в Сочи?"
-            ]
-        elif current_state == DialogState.S1_BUSINESS:
-            if not lead_data.automation_goal:
-                alternative_questions = [
-                    "Какие у вас планы на недвижимость?",
-                    "Что для вас важнее: доходность или надежность?"
-                ]
-        elif current_state == DialogState.S2_GOAL:
-            alternative_questions = [
-                "Какие сроки покупки вы рассматриваете?",
-                "Вы уже определились с форматом недвижимости?"
-            ]
-        elif current_state == DialogState.S4_REQUIREMENTS:
-            alternative_questions = [
-                "Есть ли у вас особые пожелания к объекту?",
-                "Что для вас важнее: локация или характеристики объекта?"
-            ]
-        elif current_state == DialogState.S5_BUDGET:
-            alternative_questions = [
-                "Какой диапазон цен вы рассматриваете?",
-                "Есть ли у вас предпочтения по форме оплаты?"
-            ]
+        alternative_questions = lead_scoring.alternative_questions(current_state, lead_data)
 
         # Фильтруем альтернативные вопросы тоже
         filtered_alternatives = self._filter_duplicate_questions(alternative_questions, session_id)
@@ -570,25 +834,7 @@ class MemoryService:
     
     def _should_escalate(self, lead_data: LeadData) -> bool:
         """Определяет, нужна ли эскалация к живому менеджеру"""
-        escalation_conditions = [
-            # Горячий клиент
-            lead_data.qualification_status == ClientType.HOT,
-            
-            # Есть телефон и готов к демо
-            bool(lead_data.phone) and bool(lead_data.agreed_demo_slots),
-            
-            # Запросил презентацию/детали
-            'презентация' in (lead_data.comments or '').lower(),
-            
-            # Специфические технические требования
-            len(lead_data.technical_requirements) > 3,
-            
-            # Высокий бюджет
-            (lead_data.budget_min and lead_data.budget_min > 1000) or
-            (lead_data.budget_max and lead_data.budget_max > 2000)
-        ]
-        
-        return any(escalation_conditions)
+        return lead_scoring.should_escalate(lead_data)
     
     async def get_analytics_summary(self, session_id: str) -> Dict[str, Any]:
         """Получает сводку аналитики по сессии"""
@@ -612,44 +858,8 @@ class MemoryService:
     
     def _calculate_data_completeness(self, lead_data: LeadData) -> float:
         """Вычисляет полноту данных (0-1)"""
-        total_fields = 20  # Общее количество важных полей
-        filled_fields = 0
-        
-        # Считаем заполненные поля
-        if lead_data.name: filled_fields += 1
-        if lead_data.phone: filled_fields += 1
-        if lead_data.business_sphere: filled_fields += 1
-        if lead_data.automation_goal: filled_fields += 1
-        if lead_data.payment_type: filled_fields += 1
-        if lead_data.budget_min or lead_data.budget_max: filled_fields += 2
-        if lead_data.technical_requirements: filled_fields += 1
-        if lead_data.urgency_level: filled_fields += 1
-        if lead_data.automation_experience: filled_fields += 1
-        if lead_data.preferred_contact_method: filled_fields += 1
-        # ... другие поля
-        
-        return filled_fields / total_fields
+        return lead_scoring.data_completeness(lead_data)
     
     def _calculate_escalation_score(self, lead_data: LeadData) -> float:
         """Вычисляет скор для эскалации (0-1)"""
-        score = 0.0
-        
-        # Статус квалификации
-        if lead_data.qualification_status == ClientType.HOT:
-            score += 0.4
-        elif lead_data.qualification_status == ClientType.WARM:
-            score += 0.2
-        
-        # Контактная информация
-        if lead_data.phone:
-            score += 0.2
-        
-        # Бюджет
-        if lead_data.budget_max and lead_data.budget_max > 1000:
-            score += 0.2
-        
-        # Срочность
-        if lead_data.urgency_level == 'high':
-            score += 0.2
-        
-        return min(score, 1.0)
\ No newline at end of file
+        return lead_scoring.escalation_score(lead_data)
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Буфер исходящих сообщений: отправка сообщений сессии в хранилище одним вызовом
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+SendFunc = Callable[[str, List[Message]], Awaitable[None]]
+
+
+class MessageBuffer:
+    """
+    Накопитель сообщений по сессиям.
+
+    Сообщения сессии копятся до конца хода (ответ ассистента), до
+    достижения max_messages или до истечения flush_interval секунд с момента
+    первого сообщения в пачке - что наступит раньше. Затем вся пачка уходит
+    одним вызовом send. При остановке сервиса close() досылает остатки.
+    """
+
+    def __init__(self, send: SendFunc, max_messages: int = 10, flush_interval: float = 2.0):
+        self._send = send
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[str, List[Message]] = {}
+        self._first_enqueued: Dict[str, float] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # Статистика для оценки экономии round-trip
+        self.messages_enqueued = 0
+        self.batches_sent = 0
+
+    async def add(self, session_id: str, message: Message, flush_now: bool = False):
+        """Добавляет сообщение в буфер сессии и при необходимости отправляет пачку"""
+        if self._closed:
+            await self._send_batch(session_id, [message])
+            return
+
+        pending = self._pending.setdefault(session_id, [])
+        if not pending:
+            self._first_enqueued[session_id] = time.monotonic()
+        pending.append(message)
+        self.messages_enqueued += 1
+
+        if flush_now or len(pending) >= self.max_messages:
+            await self.flush(session_id)
+        else:
+            self._ensure_flusher()
+
+    async def flush(self, session_id: str):
+        """Отправляет все накопленные сообщения сессии"""
+        # Забираем пачку до await, чтобы параллельный flush не отправил ее повторно
+        messages = self._pending.pop(session_id, None)
+        self._first_enqueued.pop(session_id, None)
+        if messages:
+            await self._send_batch(session_id, messages)
+
+    async def flush_all(self):
+        """Отправляет сообщения всех сессий"""
+        session_ids = list(self._pending)
+        if session_ids:
+            await asyncio.gather(*(self.flush(session_id) for session_id in session_ids))
+
+    async def close(self):
+        """Останавливает фоновую отправку и досылает остатки"""
+        self._closed = True
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush_all()
+
+    def pending(self, session_id: str) -> List[Message]:
+        """Сообщения сессии, еще не отправленные в хранилище"""
+        return list(self._pending.get(session_id, ()))
+
+    def pending_count(self) -> int:
+        """Количество сообщений, ожидающих отправки"""
+        return sum(len(messages) for messages in self._pending.values())
+
+    def _ensure_flusher(self):
+        """Запускает фоновую отправку по таймеру, если она еще не запущена"""
+        if self._flusher and not self._flusher.done():
+            return
+        try:
+            # Чистый контекст: фоновая отправка не должна унаследовать бюджет хода
+            self._flusher = asyncio.get_running_loop().create_task(
+                self._flush_loop(), context=contextvars.Context()
+            )
+        except RuntimeError:
+            # Нет event loop - сообщения уйдут при следующем flush
+            self._flusher = None
+
+    async def _flush_loop(self):
+        """Периодически отправляет пачки, ожидающие дольше flush_interval"""
+        while self._pending:
+            await asyncio.sleep(self.flush_interval / 2)
+            now = time.monotonic()
+            expired = [
+                session_id for session_id, enqueued in self._first_enqueued.items()
+                if now - enqueued >= self.flush_interval
+            ]
+            for session_id in expired:
+                try:
+                    await self.flush(session_id)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка фоновой отправки сообщений для {session_id}: {e}")
+
+    async def _send_batch(self, session_id: str, messages: List[Message]):
+        try:
+            await self._send(session_id, messages)
+            self.batches_sent += 1
+            logger.debug(f"📤 Отправлено {len(messages)} сообщений в хранилище для {session_id}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения сообщений в память для {session_id}: {e}")
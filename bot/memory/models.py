@@ -2,10 +2,13 @@
 Модели данных для интеллектуальной системы памяти ZEP
 """
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 
+from .lead_codec import LeadDataCodec
+from .question_registry import question_registry
+
 
 class DialogState(Enum):
     """Состояния диалога"""
@@ -44,9 +47,19 @@ class PaymentType(Enum):
     CRYPTO = "crypto"           # Криптовалюта
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LeadData:
-    """Данные о лиде"""
+    """
+    Данные о лиде - неизменяемый снимок.
+
+    Один и тот же снимок хранится в локальном кэше MemoryService, в кэше
+    сессии и возвращается вызывающему коду: изменить его на месте нельзя,
+    поэтому защитные копии не нужны. Новая версия создается через
+    replace() (поля не копируются глубоко - неизменные значения разделяются
+    между версиями) или через черновик edit() для серии изменений.
+    Списочные поля - кортежи; словари property_params и questions_answered
+    на месте не изменяются.
+    """
     # Базовая информация
     name: Optional[str] = None
     phone: Optional[str] = None
@@ -83,13 +96,13 @@ class LeadData:
     needs_sell_own: Optional[bool] = None  # Нужна ли продажа своей недвижимости
     
     # Недвижимость
-    preferred_locations: List[str] = field(default_factory=list)  # Красная Поляна, Сириус и т.д.
+    preferred_locations: Tuple[str, ...] = ()  # Красная Поляна, Сириус и т.д.
     property_type: Optional[str] = None  # дом, квартира, апартаменты, участок
     property_params: Dict[str, Any] = field(default_factory=dict)  # комнаты, метраж, вид и т.д.
     
     # Технические требования (старые поля для совместимости)
-    technical_requirements: List[str] = field(default_factory=list)
-    automation_type: List[str] = field(default_factory=list)  # чат-бот, CRM, email, соцсети
+    technical_requirements: Tuple[str, ...] = ()
+    automation_type: Tuple[str, ...] = ()  # чат-бот, CRM, email, соцсети
     
     # Временные рамки
     implementation_date: Optional[datetime] = None
@@ -106,14 +119,14 @@ class LeadData:
     # Коммуникация
     preferred_contact_time: Optional[str] = None
     preferred_contact_method: Optional[str] = None
-    agreed_demo_slots: List[datetime] = field(default_factory=list)
+    agreed_demo_slots: Tuple[datetime, ...] = ()
     
     # Статус
     qualification_status: Optional[ClientType] = None
     current_dialog_state: DialogState = DialogState.S0_GREETING
 
-    # История вопросов для предотвращения повторов
-    asked_questions: List[str] = field(default_factory=list)  # Список заданных вопросов
+    # История вопросов для предотвращения повторов: битовая маска id из question_registry
+    asked_questions_mask: int = 0
     last_question_asked: Optional[str] = None  # Последний заданный вопрос
     questions_answered: Dict[str, Any] = field(default_factory=dict)  # Ответы на вопросы по типам
 
@@ -122,149 +135,113 @@ class LeadData:
     updated_at: datetime = field(default_factory=datetime.now)
     utm_source: Optional[str] = None
     comments: str = ""
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """Преобразование в словарь для ZEP"""
-        return {
-            'name': self.name,
-            'phone': self.phone,
-            'telegram_username': self.telegram_username,
-            'whatsapp': self.whatsapp,
-            'city': self.city,
-            'current_location': self.current_location,
-            'is_in_sochi': self.is_in_sochi,
-            'is_local': self.is_local,
-            'rooms_count': self.rooms_count,
-            'area_min': self.area_min,
-            'area_max': self.area_max,
-            'view_preference': self.view_preference,
-            'completion_date': self.completion_date,
-            'need_remote_deal': self.need_remote_deal,
-            'online_viewing_ready': self.online_viewing_ready,
-            'need_to_sell_current': self.need_to_sell_current,
-            'current_property_city': self.current_property_city,
-            'decision_maker': self.decision_maker,
-            'business_sphere': self.business_sphere,
-            'company_size': self.company_size,
-            'current_automation_tasks': self.current_automation_tasks,
-            'automation_goal': self.automation_goal.value if self.automation_goal else None,
-            'payment_type': self.payment_type.value if self.payment_type else None,
-            'budget_min': self.budget_min,
-            'budget_max': self.budget_max,
-            'mortgage_bank': self.mortgage_bank,
-            'needs_sell_own': self.needs_sell_own,
-            'preferred_locations': self.preferred_locations,
-            'property_type': self.property_type,
-            'property_params': self.property_params,
-            'technical_requirements': self.technical_requirements,
-            'automation_type': self.automation_type,
-            'implementation_date': self.implementation_date.isoformat() if self.implementation_date else None,
-            'urgency_level': self.urgency_level,
-            'ready_for_quick_decision': self.ready_for_quick_decision,
-            'urgency_date': self.urgency_date,
-            'automation_experience': self.automation_experience,
-            'needs_remote_setup': self.needs_remote_setup,
-            'online_show_ready': self.online_show_ready,
-            'sochi_experience': self.sochi_experience,
-            'preferred_contact_time': self.preferred_contact_time,
-            'preferred_contact_method': self.preferred_contact_method,
-            'agreed_demo_slots': [slot.isoformat() for slot in self.agreed_demo_slots],
-            'qualification_status': self.qualification_status.value if self.qualification_status else None,
-            'current_dialog_state': self.current_dialog_state.value,
-            'asked_questions': self.asked_questions,
-            'last_question_asked': self.last_question_asked,
-            'questions_answered': self.questions_answered,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'utm_source': self.utm_source,
-            'comments': self.comments
-        }
-    
+
+    # Маска заполненных полей (бит из LEAD_FIELD_BITS - значение поля истинно).
+    # Вычисляется кодеком и обновляется при replace(), не сериализуется
+    filled_mask: int = field(default=0, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'filled_mask', lead_codec.filled_mask(self))
+
+    def has_fields(self, mask: int) -> bool:
+        """Заполнены ли все поля маски"""
+        return self.filled_mask & mask == mask
+
+    @property
+    def asked_questions(self) -> List[str]:
+        """Тексты заданных вопросов"""
+        return question_registry.questions(self.asked_questions_mask)
+
+    def with_questions_asked(self, questions: List[str]) -> 'LeadData':
+        """Снимок, в котором вопросы отмечены как заданные"""
+        mask = self.asked_questions_mask
+        for question in questions:
+            mask = question_registry.add(mask, question)
+        return self.replace(asked_questions_mask=mask) if mask != self.asked_questions_mask else self
+
+    def was_question_asked(self, question: str) -> bool:
+        return question_registry.contains(self.asked_questions_mask, question)
+
+    def replace(self, **changes) -> 'LeadData':
+        """Новый снимок с измененными полями"""
+        return lead_codec.replace(self, changes)
+
+    def edit(self) -> 'LeadDraft':
+        """Черновик для серии изменений; freeze() возвращает новый снимок"""
+        return LeadDraft(self)
+
+    def to_dict(self, sparse: bool = False) -> Dict[str, Any]:
+        """
+        Преобразование в словарь.
+
+        Плотный словарь (все поля) - для ZEP, который объединяет метаданные:
+        отсутствующий ключ не затрет там старое значение. Разреженный
+        (sparse=True, без None и значений по умолчанию) - для локальных кэшей.
+        """
+        return lead_codec.to_dict(self, sparse)
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'LeadData':
-        """Создание объекта из словаря"""
-        lead = cls()
-        
-        # Базовая информация
-        lead.name = data.get('name')
-        lead.phone = data.get('phone')
-        lead.telegram_username = data.get('telegram_username')
-        lead.whatsapp = data.get('whatsapp')
-        lead.city = data.get('city')
-        lead.current_location = data.get('current_location')
-        lead.is_in_sochi = data.get('is_in_sochi')
-        lead.is_local = data.get('is_local')
-        
-        # Бизнес-информация
-        lead.business_sphere = data.get('business_sphere')
-        lead.company_size = data.get('company_size')
-        lead.current_automation_tasks = data.get('current_automation_tasks')
-        
-        # Потребности и бюджет
-        if data.get('automation_goal'):
-            lead.automation_goal = AutomationGoal(data['automation_goal'])
-        if data.get('payment_type'):
-            lead.payment_type = PaymentType(data['payment_type'])
-        
-        lead.budget_min = data.get('budget_min')
-        lead.budget_max = data.get('budget_max')
-        lead.mortgage_bank = data.get('mortgage_bank')
-        lead.needs_sell_own = data.get('needs_sell_own')
-        
-        # Недвижимость
-        lead.preferred_locations = data.get('preferred_locations', [])
-        lead.property_type = data.get('property_type')
-        lead.property_params = data.get('property_params', {})
-        
-        # Технические требования
-        lead.technical_requirements = data.get('technical_requirements', [])
-        lead.automation_type = data.get('automation_type', [])
-        
-        # Временные рамки
-        if data.get('implementation_date'):
-            lead.implementation_date = datetime.fromisoformat(data['implementation_date'])
-        
-        lead.urgency_level = data.get('urgency_level')
-        lead.ready_for_quick_decision = data.get('ready_for_quick_decision')
-        lead.urgency_date = data.get('urgency_date')
-        
-        # Опыт и готовность
-        lead.automation_experience = data.get('automation_experience')
-        lead.needs_remote_setup = data.get('needs_remote_setup')
-        lead.online_show_ready = data.get('online_show_ready')
-        lead.sochi_experience = data.get('sochi_experience')
-        
-        # Коммуникация
-        lead.preferred_contact_time = data.get('preferred_contact_time')
-        lead.preferred_contact_method = data.get('preferred_contact_method')
-        
-        if data.get('agreed_demo_slots'):
-            lead.agreed_demo_slots = [
-                datetime.fromisoformat(slot) 
-                for slot in data['agreed_demo_slots']
-            ]
-        
-        # Статус
-        if data.get('qualification_status'):
-            lead.qualification_status = ClientType(data['qualification_status'])
-        if data.get('current_dialog_state'):
-            lead.current_dialog_state = DialogState(data['current_dialog_state'])
-
-        # История вопросов
-        lead.asked_questions = data.get('asked_questions', [])
-        lead.last_question_asked = data.get('last_question_asked')
-        lead.questions_answered = data.get('questions_answered', {})
-
-        # Метаданные
-        if data.get('created_at'):
-            lead.created_at = datetime.fromisoformat(data['created_at'])
-        if data.get('updated_at'):
-            lead.updated_at = datetime.fromisoformat(data['updated_at'])
-        
-        lead.utm_source = data.get('utm_source')
-        lead.comments = data.get('comments', '')
-        
-        return lead
+        """Создание объекта из словаря (плотного, разреженного или старой версии схемы)"""
+        return lead_codec.from_dict(data)
+
+    def to_bytes(self) -> bytes:
+        """Компактная бинарная форма для локальных хранилищ"""
+        return lead_codec.to_bytes(self)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'LeadData':
+        return lead_codec.from_bytes(payload)
+
+
+class LeadDraft:
+    """
+    Изменяемый черновик поверх снимка LeadData.
+
+    Чтение возвращает измененное значение или значение снимка, запись
+    попадает только в черновик. Экстракторы работают с черновиком как с
+    обычным объектом, а freeze() создает один новый снимок на все
+    изменения (или возвращает исходный, если ничего не изменилось).
+    """
+
+    __slots__ = ('_base', '_changes')
+
+    def __init__(self, base: LeadData):
+        object.__setattr__(self, '_base', base)
+        object.__setattr__(self, '_changes', {})
+
+    def __getattr__(self, name: str):
+        changes = self._changes
+        if name in changes:
+            return changes[name]
+        return getattr(self._base, name)
+
+    def __setattr__(self, name: str, value: Any):
+        if name not in _LEAD_FIELDS:
+            raise AttributeError(f"У LeadData нет поля {name}")
+        self._changes[name] = value
+
+    def freeze(self) -> LeadData:
+        base = self._base
+        changes = {name: value for name, value in self._changes.items() if getattr(base, name) != value}
+        return lead_codec.replace(base, changes) if changes else base
+
+
+_LEAD_FIELDS = frozenset(LeadData.__slots__)
+
+# Кодек строится по полям LeadData один раз при импорте
+lead_codec = LeadDataCodec(LeadData)
+
+# Бит каждого поля в LeadData.filled_mask
+LEAD_FIELD_BITS: Dict[str, int] = lead_codec.field_bits
+
+
+def lead_fields_mask(*names: str) -> int:
+    """Маска из битов перечисленных полей LeadData"""
+    mask = 0
+    for name in names:
+        mask |= LEAD_FIELD_BITS[name]
+    return mask
 
 
 @dataclass
@@ -0,0 +1,41 @@
+"""
+Ограниченный кэш отрицательных результатов чтения из хранилища
+"""
+import time
+from collections import OrderedDict
+
+
+class NegativeCache:
+    """
+    Множество ключей с TTL и ограничением размера.
+
+    Хранит session_id, для которых хранилище недавно вернуло "нет данных",
+    чтобы не повторять заведомо пустой запрос. Самые старые записи
+    вытесняются при превышении max_size.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+
+    def add(self, key: str):
+        self._expires[key] = time.monotonic() + self.ttl
+        self._expires.move_to_end(key)
+        while len(self._expires) > self.max_size:
+            self._expires.popitem(last=False)
+
+    def discard(self, key: str):
+        self._expires.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._expires[key]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._expires)
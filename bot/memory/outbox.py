@@ -0,0 +1,343 @@
+"""
+Долговременная очередь (outbox) записей в хранилище памяти на время его недоступности
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Dict, List, Optional
+
+from .backends.base import MemoryBackend
+from .resilience import CircuitOpenError, CircuitBreaker, is_auth_error, is_retryable_error
+from .session_locks import SessionLockRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class DurableOutbox:
+    """
+    Append-only журнал неотправленных записей в хранилище.
+
+    Каждая запись (метаданные сессии или пачка сообщений) сначала попадает
+    в JSONL-файл, а после успешной отправки в него дописывается ack. При
+    старте журнал перечитывается, так что рестарт не теряет данные.
+    Для метаданных хранится только последняя версия по сессии - отправлять
+    промежуточные состояния бессмысленно. Сообщения сессии отправляются
+    строго по порядку. Фоновый воркер отправляет очередь с ограниченной
+    параллельностью, пока circuit breaker не сообщает о недоступности.
+
+    Запись, которую хранилище max_attempts раз отвергло (ошибка в самих
+    данных, 4xx), переносится в журнал недоставленных (<имя>.dead.jsonl)
+    и снимается с очереди, чтобы не блокировать последующие записи сессии.
+    Временные ошибки (сеть, 5xx, авторизация) только считаются: запись
+    ждет восстановления хранилища сколько угодно долго.
+
+    Метаданные отправляются под блокировкой сессии (session_locks), той же,
+    что и у MemoryService: иначе старая версия из очереди может дойти после
+    живого сохранения и перезаписать более новые данные лида.
+    """
+
+    def __init__(self, path: str, max_concurrency: int = 4,
+                 replay_interval: float = 5.0, compact_threshold: int = 1000, max_attempts: int = 3,
+                 session_locks: Optional[SessionLockRegistry] = None):
+        self.path = Path(path)
+        self.dead_letter_path = self.path.with_suffix('.dead.jsonl')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_concurrency = max_concurrency
+        self.replay_interval = replay_interval
+        self.compact_threshold = compact_threshold
+        self.max_attempts = max_attempts
+        self._session_locks = session_locks or SessionLockRegistry()
+
+        # Последние метаданные по сессиям и очереди сообщений по сессиям
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self._messages: Dict[str, List[Dict[str, Any]]] = {}
+        self._obsolete_records = 0
+
+        self._worker: Optional[asyncio.Task] = None
+        self._file = None
+        # fsync выполняется в потоке, один на все записи, накопленные за предыдущий
+        self._sync_task: Optional[asyncio.Task] = None
+        self._unsynced = False
+
+        self.stats: Dict[str, int] = {
+            'enqueued': 0,
+            'replayed': 0,
+            'superseded': 0,
+            'dead_lettered': 0,
+            'fsyncs': 0,
+        }
+
+        self._load()
+
+    # === Постановка в очередь ===
+
+    def enqueue_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        """Сохраняет метаданные сессии для последующей отправки"""
+        previous = self._metadata.get(session_id)
+        entry = self._append({'op': 'metadata', 'session_id': session_id, 'payload': metadata})
+        self._metadata[session_id] = entry
+        if previous:
+            # Старая версия больше не нужна: при загрузке ее перекроет новая
+            self._obsolete_records += 1
+            self.stats['superseded'] += 1
+
+    def enqueue_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        """Сохраняет пачку сообщений сессии для последующей отправки"""
+        entry = self._append({'op': 'messages', 'session_id': session_id, 'payload': messages})
+        self._messages.setdefault(session_id, []).append(entry)
+
+    def discard_metadata(self, session_id: str):
+        """Снимает с очереди метаданные, уже перезаписанные успешным сохранением"""
+        entry = self._metadata.pop(session_id, None)
+        if entry:
+            self._ack(entry['id'])
+            self.stats['superseded'] += 1
+
+    def has_pending_messages(self, session_id: str) -> bool:
+        return bool(self._messages.get(session_id))
+
+    def pending_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._metadata.get(session_id)
+        return entry['payload'] if entry else None
+
+    def pending_count(self) -> int:
+        return len(self._metadata) + sum(len(entries) for entries in self._messages.values())
+
+    # === Отправка ===
+
+    def start(self, backend: MemoryBackend, breaker: Optional[CircuitBreaker] = None):
+        """Запускает фоновую отправку очереди"""
+        if self._worker and not self._worker.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # Чистый контекст: воркер не должен унаследовать бюджет хода, в котором запущен
+        self._worker = loop.create_task(self._run(backend, breaker), context=contextvars.Context())
+
+    async def replay(self, backend: MemoryBackend) -> int:
+        """Отправляет всю очередь; возвращает количество отправленных записей"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        session_ids = set(self._metadata) | set(self._messages)
+
+        async def replay_session(session_id: str) -> int:
+            async with semaphore:
+                return await self._replay_session(backend, session_id)
+
+        results = await asyncio.gather(
+            *(replay_session(session_id) for session_id in session_ids),
+            return_exceptions=True
+        )
+        sent = sum(result for result in results if isinstance(result, int))
+        if sent:
+            logger.info(f"📤 Outbox: отправлено {sent} отложенных записей, осталось {self.pending_count()}")
+        self._maybe_compact()
+        return sent
+
+    async def close(self):
+        """Останавливает воркер; неотправленные записи остаются в журнале"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._sync_task:
+            await self._sync_task
+            self._sync_task = None
+        if self._obsolete_records:
+            self._compact()
+        if self._file:
+            self._sync_now()
+            self._file.close()
+            self._file = None
+
+    async def _replay_session(self, backend: MemoryBackend, session_id: str) -> int:
+        sent = 0
+        # Сообщения по порядку: следующая пачка только после успеха предыдущей
+        while self._messages.get(session_id):
+            entry = self._messages[session_id][0]
+            delivered = await self._send(entry, backend.add_messages(session_id, entry['payload']))
+            self._messages[session_id].pop(0)
+            self._ack(entry['id'])
+            sent += delivered
+            self.stats['replayed'] += delivered
+        self._messages.pop(session_id, None)
+
+        if session_id not in self._metadata:
+            return sent
+        async with self._session_locks.acquire(session_id):
+            # Пока ждали блокировку, живое сохранение могло записать более
+            # новые данные и снять запись с очереди
+            entry = self._metadata.get(session_id)
+            if entry:
+                delivered = await self._send(entry, backend.update_session_metadata(session_id, entry['payload']))
+                if self._metadata.get(session_id) is entry:
+                    del self._metadata[session_id]
+                self._ack(entry['id'])
+                sent += delivered
+                self.stats['replayed'] += delivered
+        return sent
+
+    async def _send(self, entry: Dict[str, Any], call: Awaitable[Any]) -> bool:
+        """
+        Отправляет запись: True - доставлена, False - перенесена в журнал
+        недоставленных. Временная ошибка пробрасывается, запись остается в
+        очереди до следующей попытки.
+        """
+        try:
+            await call
+            return True
+        except CircuitOpenError:
+            # Вызов не выполнялся - попытка не засчитывается
+            raise
+        except Exception as e:
+            # Ошибка авторизации временная: ключ заменят, и запись дойдет
+            if is_auth_error(e) or is_retryable_error(e):
+                raise
+            entry['rejected'] = entry.get('rejected', 0) + 1
+            if entry['rejected'] < self.max_attempts:
+                # Счетчик в журнале: отказы считаются и после рестарта
+                self._write({'op': 'reject', 'id': entry['id']})
+                self._obsolete_records += 1
+                raise
+            self._dead_letter(entry, e)
+            return False
+
+    def _dead_letter(self, entry: Dict[str, Any], error: Exception):
+        logger.error(f"❌ Outbox: запись {entry['op']} сессии {entry['session_id']} отвергнута хранилищем "
+                     f"{entry['rejected']} раз ({error}), перенесена в {self.dead_letter_path.name}")
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({**entry, 'error': str(error), 'dead_ts': time.time()}, ensure_ascii=False) + '\n')
+        self.stats['dead_lettered'] += 1
+
+    async def _run(self, backend: MemoryBackend, breaker: Optional[CircuitBreaker]):
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            if not self.pending_count():
+                continue
+            if breaker is not None and breaker.is_open:
+                continue
+            try:
+                await self.replay(backend)
+            except CircuitOpenError:
+                pass
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки outbox: {e}")
+
+    # === Журнал ===
+
+    def _append(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        record['id'] = uuid.uuid4().hex
+        record['ts'] = time.time()
+        self._write(record)
+        self.stats['enqueued'] += 1
+        return record
+
+    def _ack(self, entry_id: str):
+        self._write({'op': 'ack', 'id': entry_id})
+        self._obsolete_records += 2
+
+    def _write(self, record: Dict[str, Any]):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        # После flush запись переживает падение процесса; fsync (защита от
+        # падения ОС) - в потоке, чтобы не останавливать event loop
+        self._file.flush()
+        self._unsynced = True
+        if self._sync_task is not None and not self._sync_task.done():
+            return  # Текущий fsync-цикл заберет и эту запись
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._sync_now()
+            return
+        self._sync_task = loop.create_task(self._sync(), context=contextvars.Context())
+
+    async def _sync(self):
+        while self._unsynced and self._file is not None:
+            self._unsynced = False
+            # Свой дескриптор: _compact может закрыть файл, пока идет fsync
+            fd = os.dup(self._file.fileno())
+            try:
+                await asyncio.to_thread(os.fsync, fd)
+                self.stats['fsyncs'] += 1
+            except OSError as e:
+                logger.error(f"❌ Outbox: ошибка fsync журнала: {e}")
+            finally:
+                os.close(fd)
+
+    def _sync_now(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self.stats['fsyncs'] += 1
+        self._unsynced = False
+
+    def _load(self):
+        if not self.path.exists():
+            return
+
+        records: List[Dict[str, Any]] = []
+        acked = set()
+        rejected: Dict[str, int] = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после аварийного завершения
+                    continue
+                if record.get('op') == 'ack':
+                    acked.add(record['id'])
+                elif record.get('op') == 'reject':
+                    rejected[record['id']] = rejected.get(record['id'], 0) + 1
+                else:
+                    records.append(record)
+
+        for record in records:
+            if record['id'] in acked:
+                continue
+            if record['id'] in rejected:
+                record['rejected'] = record.get('rejected', 0) + rejected[record['id']]
+            if record['op'] == 'metadata':
+                self._metadata[record['session_id']] = record
+            elif record['op'] == 'messages':
+                self._messages.setdefault(record['session_id'], []).append(record)
+
+        if records:
+            logger.info(f"📂 Outbox: загружено {self.pending_count()} неотправленных записей")
+        self._compact()
+
+    def _maybe_compact(self):
+        if self._obsolete_records >= self.compact_threshold:
+            self._compact()
+
+    def _compact(self):
+        """Переписывает журнал, оставляя только неотправленные записи"""
+        if self._file:
+            self._file.close()
+            self._file = None
+        # Новый журнал синхронизируется ниже целиком
+        self._unsynced = False
+
+        pending = list(self._metadata.values())
+        for entries in self._messages.values():
+            pending.extend(entries)
+        pending.sort(key=lambda record: record['ts'])
+
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in pending:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._obsolete_records = 0
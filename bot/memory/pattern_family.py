@@ -0,0 +1,63 @@
+"""
+Семейства регулярных выражений с приоритетом, проверяемые за один проход
+"""
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+
+class FamilyMatch(NamedTuple):
+    """Совпадение семейства: какой паттерн сработал и что он захватил"""
+    name: str
+    text: str
+    groups: Tuple[Optional[str], ...]
+    start: int
+
+
+class PatternFamily:
+    """
+    Список паттернов, из которых выигрывает первый сработавший по порядку
+    (при равенстве - самый левый), как у цикла re.search, но за один проход.
+
+    Паттерны без именованных групп и обратных ссылок. starts - необязательный
+    класс символов, с которых начинается любое совпадение семейства.
+    """
+
+    def __init__(self, patterns: Sequence[Tuple[str, str]], flags: int = 0, starts: Optional[str] = None):
+        self.names: List[str] = []
+        # Номер группы-обертки паттерна -> (номер паттерна, число его групп)
+        self._wrappers = {}
+        alternatives = []
+        group = 0
+        for priority, (name, pattern) in enumerate(patterns):
+            inner_groups = re.compile(pattern, flags).groups
+            group += 1
+            self._wrappers[group] = (priority, inner_groups)
+            self.names.append(name)
+            alternatives.append(f'({pattern})')
+            group += inner_groups
+        guard = f'(?=[{starts}])' if starts else ''
+        self._pattern = re.compile(guard + '(?=' + '|'.join(alternatives) + ')', flags)
+
+    def search(self, text: str) -> Optional[FamilyMatch]:
+        """Совпадение первого по порядку паттерна, который есть в тексте"""
+        best_priority = len(self.names)
+        best = None
+        wrappers = self._wrappers
+        for match in self._pattern.finditer(text):
+            # Группа-обертка закрывается после своих внутренних групп
+            wrapper = match.lastindex
+            priority, inner_groups = wrappers[wrapper]
+            if priority < best_priority:
+                best_priority = priority
+                best = (match, wrapper, inner_groups)
+                if priority == 0:
+                    break
+        if best is None:
+            return None
+        match, wrapper, inner_groups = best
+        return FamilyMatch(
+            name=self.names[best_priority],
+            text=match.group(wrapper),
+            groups=match.groups()[wrapper:wrapper + inner_groups],
+            start=match.start(wrapper),
+        )
@@ -0,0 +1,115 @@
+"""
+Реестр вопросов бота: нормализация, целочисленные id и битовые множества заданных вопросов
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Стоп-слова, не влияющие на смысл вопроса при сравнении
+_STOP_WORDS = frozenset({'для', 'или', 'как', 'вы', 'сейчас', 'в', 'на', 'по'})
+
+# Каталог вопросов MemoryService. Номер в каталоге - постоянный id вопроса:
+# он сохраняется в битовой маске LeadData, поэтому новые вопросы добавляются
+# только в конец, а существующие не переставляются и не удаляются.
+QUESTION_CATALOG: Tuple[str, ...] = (
+    "Для себя ищете недвижимость или как инвестицию?",
+    "Вы сейчас в Сочи? Если нет — из какого города?",
+    "Для себя ищете жилье или как инвестицию?",
+    "Цель покупки: ПМЖ, сдача в аренду или сбережения?",
+    "На какой бюджет мне ориентироваться?",
+    "Есть решение: AI-ассистент от $350. Такой диапазон рассматриваете?",
+    "Расскажите, пожалуйста, подробнее о вашей ситуации",
+    "Что вас привело к поиску недвижимости в Сочи?",
+    "Какие у вас планы на недвижимость?",
+    "Что для вас важнее: доходность или надежность?",
+    "Какие сроки покупки вы рассматриваете?",
+    "Вы уже определились с форматом недвижимости?",
+    "Есть ли у вас особые пожелания к объекту?",
+    "Что для вас важнее: локация или характеристики объекта?",
+    "Какой диапазон цен вы рассматриваете?",
+    "Есть ли у вас предпочтения по форме оплаты?",
+)
+
+
+@lru_cache(maxsize=4096)
+def normalize_question(question: str) -> str:
+    """Нормализует вопрос для сравнения (результат кэшируется)"""
+    # Приводим к нижнему регистру, удаляем лишние пробелы и стоп-слова
+    words = question.lower().strip().split()
+    return ' '.join(word for word in words if word not in _STOP_WORDS)
+
+
+class QuestionRegistry:
+    """
+    Соответствие нормализованный вопрос -> небольшой целый id.
+
+    Вопросы каталога получают id по порядку и одинаковы во всех процессах.
+    Прочие вопросы регистрируются на лету с id после каталога; такие id
+    действительны только внутри процесса и не сохраняются - вместо них в
+    хранилище уходит текст вопроса. Множество заданных вопросов - это int,
+    где бит i означает, что вопрос с id i уже задавался.
+    """
+
+    def __init__(self, catalog: Iterable[str] = QUESTION_CATALOG):
+        self._ids: Dict[str, int] = {}
+        self._texts: List[str] = []
+        for question in catalog:
+            self.id_for(question)
+        self.catalog_size = len(self._texts)
+        # Биты, которые можно сохранять в хранилище
+        self.catalog_mask = (1 << self.catalog_size) - 1
+
+    def id_for(self, question: str) -> int:
+        """Возвращает id вопроса, регистрируя его при необходимости"""
+        normalized = normalize_question(question)
+        question_id = self._ids.get(normalized)
+        if question_id is None:
+            question_id = len(self._texts)
+            self._ids[normalized] = question_id
+            self._texts.append(question)
+        return question_id
+
+    def text(self, question_id: int) -> str:
+        """Текст вопроса в том виде, в котором он был зарегистрирован"""
+        return self._texts[question_id]
+
+    def is_catalog(self, question_id: int) -> bool:
+        return question_id < self.catalog_size
+
+    def add(self, mask: int, question: str) -> int:
+        """Маска с добавленным вопросом"""
+        return mask | (1 << self.id_for(question))
+
+    def contains(self, mask: int, question: str) -> bool:
+        """Есть ли вопрос в маске (незнакомый вопрос не регистрируется)"""
+        question_id = self._ids.get(normalize_question(question))
+        return question_id is not None and bool(mask >> question_id & 1)
+
+    def questions(self, mask: int) -> List[str]:
+        """Тексты вопросов из маски в порядке id"""
+        texts = []
+        question_id = 0
+        while mask:
+            if mask & 1:
+                texts.append(self._texts[question_id])
+            mask >>= 1
+            question_id += 1
+        return texts
+
+    def encode(self, mask: int) -> Tuple[int, List[str]]:
+        """Сохраняемая форма маски: биты каталога и тексты прочих вопросов"""
+        extra = self.questions(mask & ~self.catalog_mask)
+        return mask & self.catalog_mask, extra
+
+    def decode(self, catalog_mask: int, extra: Iterable[str] = ()) -> int:
+        """Восстанавливает маску из сохраняемой формы"""
+        mask = catalog_mask & self.catalog_mask
+        for question in extra:
+            mask = self.add(mask, question)
+        return mask
+
+
+# Глобальный реестр вопросов
+question_registry = QuestionRegistry()
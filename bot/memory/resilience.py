@@ -0,0 +1,256 @@
+"""
+Устойчивость обращений к хранилищу памяти: таймауты, бюджет хода, повторы и circuit breaker
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from .backends.base import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+# Дедлайн текущего хода (time.monotonic), общий для всех вызовов в его рамках
+_turn_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    'memory_turn_deadline', default=None
+)
+
+
+class CircuitOpenError(Exception):
+    """Хранилище считается недоступным, вызов не выполнялся"""
+
+
+class BudgetExceededError(asyncio.TimeoutError):
+    """Бюджет времени хода исчерпан"""
+
+
+@contextmanager
+def turn_budget(seconds: float) -> Iterator[None]:
+    """Ограничивает суммарное время обращений к хранилищу в рамках хода"""
+    token = _turn_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _turn_deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Остаток бюджета хода в секундах или None, если бюджет не задан"""
+    deadline = _turn_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+# HTTP-коды временных ошибок хранилища
+_RETRYABLE_STATUS_CODES = frozenset((408, 429, 500, 502, 503, 504))
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP-код ошибки клиента API (zep_cloud ApiError, httpx) или None"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_auth_error(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status == 401
+    # Цифры в тексте не проверяются: сообщение может содержать session_id с меткой времени
+    return 'unauthorized' in str(error).lower()
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Временные ошибки: таймауты, сеть, rate limit и 5xx (по коду ответа и типу исключения)"""
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS_CODES
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError)):
+        return True
+    error_name = type(error).__name__.lower()
+    return 'timeout' in error_name or 'connect' in error_name
+
+
+class CircuitBreaker:
+    """
+    Классический circuit breaker.
+
+    После failure_threshold подряд неудачных вызовов переходит в состояние
+    open и сразу отклоняет вызовы. Через recovery_timeout пропускает один
+    пробный вызов (half_open): успех закрывает цепь, неудача снова ее
+    открывает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            logger.info("🔌 Circuit breaker: пробный запрос к хранилищу (half-open)")
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected_calls += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ Circuit breaker: хранилище снова доступно")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.trip()
+
+    def release_probe(self):
+        """Пробный вызов прерван без ответа хранилища: следующий вызов станет новой пробой"""
+        self._probe_in_flight = False
+
+    def trip(self):
+        """Принудительно открывает цепь"""
+        if self.state != self.OPEN:
+            self.times_opened += 1
+            logger.warning(f"⚠️ Circuit breaker открыт на {self.recovery_timeout}с после {self._failures} ошибок")
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN and time.monotonic() - self._opened_at < self.recovery_timeout
+
+
+class ResilientCaller:
+    """
+    Единая точка вызовов хранилища: таймаут на вызов, бюджет хода,
+    повторы с экспоненциальной задержкой и джиттером, circuit breaker.
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker] = None, call_timeout: float = 2.0,
+                 max_retries: int = 3, retry_base_delay: float = 0.2, retry_max_delay: float = 1.0):
+        self.breaker = breaker or CircuitBreaker()
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self.stats: Dict[str, int] = {
+            'calls': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'retries': 0,
+            'budget_exhausted': 0,
+        }
+
+    async def call(self, operation: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Выполняет func с таймаутом и повторами; бросает CircuitOpenError при открытой цепи"""
+        for attempt in range(self.max_retries):
+            timeout = self._timeout()
+            if timeout <= 0:
+                self.stats['budget_exhausted'] += 1
+                raise BudgetExceededError(f"бюджет хода исчерпан ({operation})")
+
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"хранилище недоступно ({operation})")
+
+            self.stats['calls'] += 1
+            try:
+                result = await asyncio.wait_for(func(*args, **kwargs), timeout=timeout)
+            except Exception as e:
+                self.stats['failures'] += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats['timeouts'] += 1
+
+                if is_auth_error(e):
+                    # Повторять бессмысленно, но цепь открываем: ключ может обновиться
+                    self.breaker.trip()
+                    raise
+                if not is_retryable_error(e):
+                    # Хранилище ответило - ошибка в запросе, а не в доступности
+                    self.breaker.record_success()
+                    raise
+
+                self.breaker.record_failure()
+                delay = self._backoff(attempt)
+                if attempt == self.max_retries - 1 or delay is None:
+                    raise
+                self.stats['retries'] += 1
+                logger.warning(f"⚠️ {operation}: {e}, попытка {attempt + 1}/{self.max_retries}, ожидание {delay:.2f}с")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Отмена задачи (CancelledError) ничего не говорит о хранилище,
+                # но пробный вызов half-open нужно освободить, иначе цепь
+                # останется в half_open и будет отклонять все вызовы
+                self.breaker.release_probe()
+                raise
+
+            self.breaker.record_success()
+            return result
+
+    def _timeout(self) -> float:
+        remaining = remaining_budget()
+        if remaining is None:
+            return self.call_timeout
+        return min(self.call_timeout, remaining)
+
+    def _backoff(self, attempt: int) -> Optional[float]:
+        """Задержка перед повтором или None, если она не укладывается в бюджет"""
+        delay = min(self.retry_base_delay * (2 ** attempt), self.retry_max_delay)
+        delay *= random.uniform(0.5, 1.0)
+        remaining = remaining_budget()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+
+class GuardedMemoryBackend(MemoryBackend):
+    """Хранилище, все вызовы которого проходят через ResilientCaller"""
+
+    def __init__(self, backend: MemoryBackend, caller: ResilientCaller):
+        self.backend = backend
+        self.caller = caller
+        self.name = backend.name
+
+    async def get_session_metadata(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.caller.call('get_session_metadata', self.backend.get_session_metadata, session_id)
+
+    async def update_session_metadata(self, session_id: str, metadata: Dict[str, Any]):
+        return await self.caller.call('update_session_metadata', self.backend.update_session_metadata,
+                                      session_id, metadata)
+
+    async def add_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        return await self.caller.call('add_messages', self.backend.add_messages, session_id, messages)
+
+    async def get_messages(self, session_id: str, last_n: int = 10) -> List[Dict[str, Any]]:
+        return await self.caller.call('get_messages', self.backend.get_messages, session_id, last_n)
+
+    async def search_messages(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        return await self.caller.call('search_messages', self.backend.search_messages, query, limit)
+
+    async def close(self):
+        await self.backend.close()
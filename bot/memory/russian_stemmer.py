@@ -0,0 +1,126 @@
+"""
+Стемминг русских слов для словарей экстракторов (алгоритм Snowball)
+"""
+import re
+from functools import lru_cache
+from typing import Optional, Tuple
+
+_VOWELS = frozenset('аеиоуыэюя')
+
+
+def _endings(*words: str) -> Tuple[str, ...]:
+    """Окончания от длинных к коротким: выигрывает самое длинное"""
+    return tuple(sorted(words, key=len, reverse=True))
+
+
+# Окончания первой группы снимаются только после 'а' или 'я'
+_PERFECTIVE_GERUND_1 = _endings('в', 'вши', 'вшись')
+_PERFECTIVE_GERUND_2 = _endings('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+_ADJECTIVE = _endings(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+_PARTICIPLE_1 = _endings('ем', 'нн', 'вш', 'ющ', 'щ')
+_PARTICIPLE_2 = _endings('ивш', 'ывш', 'ующ')
+_REFLEXIVE = _endings('ся', 'сь')
+_VERB_1 = _endings('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют',
+                   'ны', 'ть', 'ешь', 'нно')
+_VERB_2 = _endings(
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым',
+    'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+)
+_NOUN = _endings(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой',
+    'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию',
+    'ью', 'ю', 'ия', 'ья', 'я',
+)
+_SUPERLATIVE = _endings('ейш', 'ейше')
+_DERIVATIONAL = _endings('ост', 'ость')
+
+_WORD = re.compile(r'[а-яё]+|[a-z0-9]+')
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """Начала областей RV и R2"""
+    rv = len(word)
+    for index, char in enumerate(word):
+        if char in _VOWELS:
+            rv = index + 1
+            break
+
+    def after_vowel_consonant(start: int) -> int:
+        for index in range(start + 1, len(word)):
+            if word[index] not in _VOWELS and word[index - 1] in _VOWELS:
+                return index + 1
+        return len(word)
+
+    r1 = after_vowel_consonant(0)
+    return rv, after_vowel_consonant(r1)
+
+
+def _strip(word: str, start: int, endings: Tuple[str, ...], after_a: bool = False) -> Optional[str]:
+    """Слово без самого длинного окончания из endings в области [start:]"""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            stem = word[:-len(ending)]
+            if after_a:
+                if len(stem) <= start or stem[-1] not in 'ая':
+                    continue
+            return stem
+    return None
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """
+    Основа русского слова (Snowball Russian).
+
+    Результат кэшируется: словарь диалогов невелик, и каждое слово
+    обрабатывается один раз на процесс.
+    """
+    word = word.replace('ё', 'е')
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие либо возвратность + прилагательное/причастие, глагол, существительное
+    result = _strip(word, rv, _PERFECTIVE_GERUND_1, after_a=True) or _strip(word, rv, _PERFECTIVE_GERUND_2)
+    if result is None:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        result = _strip(word, rv, _ADJECTIVE)
+        if result is not None:
+            result = (_strip(result, rv, _PARTICIPLE_1, after_a=True)
+                      or _strip(result, rv, _PARTICIPLE_2) or result)
+        else:
+            result = (_strip(word, rv, _VERB_1, after_a=True) or _strip(word, rv, _VERB_2)
+                      or _strip(word, rv, _NOUN))
+    if result is not None:
+        word = result
+
+    # Шаг 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Шаг 3: словообразовательные окончания в R2
+    word = _strip(word, r2, _DERIVATIONAL) or word
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        word = word[:-1]
+    else:
+        superlative = _strip(word, rv, _SUPERLATIVE)
+        if superlative is not None:
+            word = superlative
+            if word.endswith('нн') and len(word) - 1 >= rv:
+                word = word[:-1]
+        elif word.endswith('ь') and len(word) - 1 >= rv:
+            word = word[:-1]
+    return word
+
+
+def stem_text(text: str) -> str:
+    """
+    Текст в нижнем регистре как основы слов через пробел, с пробелами по краям.
+
+    Пробелы по краям позволяют искать фразу из основ ' красн полян ' только
+    целыми словами. Латиница и числа не меняются.
+    """
+    return ' ' + ' '.join(map(stem, _WORD.findall(text))) + ' '
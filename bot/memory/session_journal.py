@@ -0,0 +1,315 @@
+"""
+Журнал соответствий пользователь -> сессия и метаданных сессий для быстрого рестарта
+"""
+import base64
+import gc
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Состояние сессии в журнале: [user_id, chat_id, created_at, last_activity, data_collected].
+# data_collected - бинарная форма LeadData в base64. Список не меняется после
+# создания: при изменении сессии создается новый, поэтому копия словаря
+# сессий - готовый снимок для фонового потока.
+SessionState = List[Any]
+
+
+def _intern(value: Any) -> Any:
+    """Интернирует строковые id, как SessionRecord"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class SessionJournal:
+    """
+    Append-only журнал сессий со сжатыми снимками.
+
+    После редеплоя словарь user_sessions и кэш SessionManager пусты: каждый
+    вернувшийся пользователь получал бы новую сессию и холодное чтение из
+    хранилища. Журнал фиксирует привязку пользователя к сессии, создание и
+    истечение сессий и последние данные лида. При запуске снимок и хвост
+    журнала воспроизводятся, восстанавливая привязки и кэш сессий.
+
+    Каждая запись сбрасывается в ОС сразу (переживает падение процесса);
+    оборванная последняя строка при воспроизведении пропускается. Когда в
+    журнале накапливается snapshot_every записей, журнал переименовывается
+    в journal.prev.jsonl, новые записи идут в свежий журнал, а снимок
+    (tmp + fsync + rename) пишется в фоновом потоке по копии состояния;
+    после записи снимка прежний журнал удаляется. Записи идемпотентны,
+    поэтому при сбое на любом шаге воспроизведение снимка, прежнего и
+    текущего журнала дает то же состояние. Данные лидов попадают в снимок
+    только для сессий, активных за последние recent_data_seconds:
+    остальные после рестарта прочитаются из хранилища, а снимок остается
+    небольшим. Данные лидов хранятся в бинарной форме LeadData (base64):
+    строка разбирается в разы быстрее вложенного словаря, а сам лид
+    декодируется только при первом обращении к сессии.
+    """
+
+    def __init__(self, path: str = "data/sessions", snapshot_every: int = 50000,
+                 recent_data_seconds: int = 3600):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = snapshot_every
+        self.recent_data_seconds = recent_data_seconds
+
+        self._journal_path = self.path / "journal.jsonl"
+        self._previous_journal_path = self.path / "journal.prev.jsonl"
+        self._snapshot_path = self.path / "snapshot.json"
+
+        # Материализованное состояние: из него строится снимок
+        self._mappings: Dict[str, str] = {}
+        self._sessions: Dict[str, SessionState] = {}
+        self._records_since_snapshot = 0
+        self._file = None
+        # Фоновая запись снимка и сессии, данные которых в нем отброшены как давние
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self._stale_data: List[Tuple[str, SessionState]] = []
+
+        self.last_replay_seconds = 0.0
+
+    # === Воспроизведение ===
+
+    def replay(self) -> Tuple[Dict[str, str], Dict[str, SessionState]]:
+        """
+        Восстанавливает состояние из снимка и журнала.
+
+        Returns:
+            (привязки user_key -> session_id, состояния сессий по session_id)
+        """
+        started = time.perf_counter()
+        # Воспроизведение создает сотни тысяч объектов: циклический GC здесь
+        # только тратит время на обход заведомо живых данных
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            replayed = self._replay()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        self._records_since_snapshot = replayed
+
+        self.last_replay_seconds = time.perf_counter() - started
+        logger.info(f"📂 Журнал сессий воспроизведен за {self.last_replay_seconds * 1000:.0f} мс: "
+                    f"{len(self._mappings)} пользователей, {len(self._sessions)} сессий, "
+                    f"{replayed} записей после снимка")
+        return dict(self._mappings), dict(self._sessions)
+
+    def _replay(self) -> int:
+        if self._snapshot_path.exists():
+            try:
+                with open(self._snapshot_path, 'r', encoding='utf-8') as f:
+                    self._load_snapshot(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"❌ Снимок журнала сессий поврежден, используем только журнал: {e}")
+
+        replayed = 0
+        # Прежний журнал остается, если процесс упал до записи снимка
+        for journal_path in (self._previous_journal_path, self._journal_path):
+            if not journal_path.exists():
+                continue
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная последняя строка после аварийного завершения
+                        continue
+                    self._apply(record)
+                    replayed += 1
+        return replayed
+
+    # === Запись ===
+
+    def record_mapping(self, user_key: str, session_id: str):
+        """Фиксирует привязку пользователя к сессии"""
+        if self._mappings.get(user_key) == session_id:
+            return
+        self._write({'op': 'map', 'u': user_key, 's': session_id})
+
+    def record_session(self, session_id: str, user_id: str, chat_id: Optional[str], created_at: int):
+        """Фиксирует создание сессии"""
+        self._write({'op': 'session', 's': session_id, 'u': user_id, 'c': chat_id, 't': created_at})
+
+    def record_data(self, session_id: str, payload: bytes):
+        """Фиксирует последние собранные данные сессии (бинарная форма LeadData)"""
+        self._write({'op': 'data', 's': session_id, 'b': base64.b64encode(payload).decode('ascii'),
+                     't': int(time.time())})
+
+    def record_expired(self, session_id: str):
+        """Фиксирует удаление сессии по TTL"""
+        if session_id in self._sessions:
+            self._write({'op': 'expire', 's': session_id})
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def retain_sessions(self, session_ids: Iterable[str]):
+        """Забывает сессии, не восстановленные в кэш (например, истекшие за время простоя)"""
+        keep = set(session_ids)
+        for session_id in [session_id for session_id in self._sessions if session_id not in keep]:
+            del self._sessions[session_id]
+
+    def snapshot(self):
+        """Записывает снимок состояния и обнуляет журнал (синхронно)"""
+        self.wait_snapshot()
+        mappings, sessions = self._rotate()
+        self._write_snapshot(mappings, sessions)
+        self._drop_stale_data()
+
+    def wait_snapshot(self):
+        """Дожидается фоновой записи снимка"""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+
+    def close(self):
+        self.wait_snapshot()
+        if self._records_since_snapshot or self._previous_journal_path.exists():
+            self.snapshot()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _snapshot_in_background(self):
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return  # Следующая попытка - после записи текущего снимка
+        self._snapshot_thread = None
+        if self._previous_journal_path.exists():
+            # Снимок после прошлого сбоя не записан: ротация затерла бы
+            # прежний журнал, поэтому этот снимок пишется синхронно
+            self.snapshot()
+            return
+        mappings, sessions = self._rotate()
+        self._snapshot_thread = threading.Thread(target=self._write_snapshot, args=(mappings, sessions),
+                                                 name='session-journal-snapshot', daemon=True)
+        self._snapshot_thread.start()
+
+    def _rotate(self) -> Tuple[Dict[str, str], Dict[str, SessionState]]:
+        """Копия состояния и новый журнал; прежний хранится до записи снимка"""
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self._journal_path.exists() and not self._previous_journal_path.exists():
+            os.replace(self._journal_path, self._previous_journal_path)
+        self._file = open(self._journal_path, 'w', encoding='utf-8')
+        self._records_since_snapshot = 0
+        # Поверхностных копий достаточно: списки состояний не изменяются
+        return dict(self._mappings), dict(self._sessions)
+
+    def _write_snapshot(self, mappings: Dict[str, str], sessions: Dict[str, SessionState]):
+        started = time.perf_counter()
+        try:
+            snapshot, stale = self._dump_snapshot(mappings, sessions)
+            tmp_path = self._snapshot_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._snapshot_path)
+            self._previous_journal_path.unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи снимка журнала сессий: {e}")
+            return
+        # Присваивание атомарно; применяется в потоке event loop при следующей записи
+        self._stale_data = stale
+        logger.info(f"📸 Снимок журнала сессий записан за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    def _drop_stale_data(self):
+        """Освобождает данные давних сессий, не попавшие в снимок"""
+        stale, self._stale_data = self._stale_data, []
+        for session_id, state in stale:
+            # Сессия могла обновиться, пока писался снимок
+            if self._sessions.get(session_id) is state:
+                self._sessions[session_id] = [*state[:4], None]
+
+    def _dump_snapshot(self, mappings: Dict[str, str], sessions: Dict[str, SessionState]
+                       ) -> Tuple[Dict[str, Any], List[Tuple[str, SessionState]]]:
+        """
+        Снимок по колонкам: списки строк и чисел разбираются в разы быстрее,
+        чем по списку на каждую сессию. chat_id, совпадающий с user_id
+        (личный чат), не повторяется; данные лидов - колонка той же длины
+        (null, если данных нет). Второй элемент - сессии с давними данными,
+        которые в снимок не попали.
+        """
+        recent_since = int(time.time()) - self.recent_data_seconds
+        session_ids = list(sessions)
+        states = list(sessions.values())
+        data = [state[4] for state in states]
+        stale = []
+        for index, (session_id, state) in enumerate(zip(session_ids, states)):
+            if state[4] is not None and state[3] < recent_since:
+                stale.append((session_id, state))
+                data[index] = None
+        # Привязки тоже по колонкам; сессия из снимка - номером в колонке ids
+        position = {session_id: index for index, session_id in enumerate(session_ids)}
+        snapshot = {
+            'version': 3,
+            'mappings': {
+                'users': list(mappings),
+                'sessions': [position.get(session_id, session_id) for session_id in mappings.values()],
+            },
+            'sessions': {
+                'ids': session_ids,
+                'users': [state[0] for state in states],
+                'chats': [None if state[1] == state[0] else state[1] for state in states],
+                'created': [state[2] for state in states],
+                'last': [state[3] for state in states],
+                'data': data,
+            },
+        }
+        return snapshot, stale
+
+    def _load_snapshot(self, snapshot: Dict[str, Any]):
+        columns = snapshot['sessions']
+        session_ids = columns['ids']
+        data = columns['data']
+        mappings = snapshot['mappings']
+        self._mappings = dict(zip(mappings['users'], [
+            session_ids[session] if session.__class__ is int else session for session in mappings['sessions']
+        ]))
+        # id интернируются здесь: SessionManager.restore_sessions их не копирует
+        users = map(_intern, columns['users'])
+        self._sessions = {
+            session_id: [user_id, user_id if chat_id is None else _intern(chat_id), created, last, lead]
+            for session_id, user_id, chat_id, created, last, lead in zip(
+                session_ids, users, columns['chats'], columns['created'], columns['last'], data
+            )
+        }
+
+    def _write(self, record: Dict[str, Any]):
+        if self._stale_data:
+            self._drop_stale_data()
+        self._apply(record)
+        if self._file is None:
+            self._file = open(self._journal_path, 'a', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self._records_since_snapshot += 1
+        if self._records_since_snapshot >= self.snapshot_every:
+            self._snapshot_in_background()
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record.get('op')
+        session_id = record.get('s')
+        if op == 'map':
+            self._mappings[record['u']] = session_id
+        elif op == 'session':
+            state = self._sessions.get(session_id)
+            if state is None:
+                self._sessions[session_id] = [_intern(record['u']), _intern(record.get('c')),
+                                              record['t'], record['t'], None]
+            else:
+                # Сессия возвращена в кэш после истечения - продлеваем
+                self._sessions[session_id] = [state[0], state[1], state[2], max(state[3], record['t']), state[4]]
+        elif op == 'data':
+            state = self._sessions.get(session_id)
+            if state is not None:
+                self._sessions[session_id] = [state[0], state[1], state[2], max(state[3], record['t']), record['b']]
+        elif op == 'expire':
+            self._sessions.pop(session_id, None)
@@ -0,0 +1,52 @@
+"""
+Реестр блокировок для сериализации обработки сообщений внутри одной сессии
+"""
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLockRegistry:
+    """
+    Выдает asyncio.Lock на каждую сессию.
+
+    Блокировки хранятся в WeakValueDictionary: запись живет, пока блокировку
+    держит или ожидает хотя бы одна корутина, и исчезает сама, как только
+    сессия простаивает. Поэтому память занимают только сессии с
+    незавершенной обработкой, а разные сессии не блокируют друг друга.
+    """
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def get_lock(self, session_id: str) -> asyncio.Lock:
+        """Возвращает блокировку сессии, создавая ее при необходимости"""
+        # Внутри event loop между get и set нет await, поэтому операция атомарна
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    @asynccontextmanager
+    async def acquire(self, session_id: str) -> AsyncIterator[None]:
+        """Эксклюзивный доступ к данным сессии на время блока"""
+        # Сильная ссылка в локальной переменной удерживает блокировку в реестре
+        lock = self.get_lock(session_id)
+        if lock.locked():
+            logger.debug(f"⏳ Ожидание блокировки сессии {session_id}")
+        async with lock:
+            yield
+
+    def is_locked(self, session_id: str) -> bool:
+        """Занята ли сессия в данный момент"""
+        lock = self._locks.get(session_id)
+        return bool(lock and lock.locked())
+
+    def __len__(self) -> int:
+        """Количество сессий с активными или ожидающими обработчиками"""
+        return len(self._locks)
@@ -1,24 +1,97 @@
 """
 Менеджер сессий для предотвращения конфликтов и повторяющихся вопросов
 """
+import asyncio
+import base64
+import binascii
+import gc
+import inspect
+import heapq
+import sys
 import uuid
 import time
+import weakref
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple, Union
 import logging
 
+from .models import LeadData
+from .question_registry import normalize_question, question_registry
+from .session_journal import SessionJournal, SessionState
+
 logger = logging.getLogger(__name__)
 
 
+def _intern(value: Any) -> Any:
+    """Интернирует строковые id: у всех сессий пользователя один объект строки"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class SessionRecord:
+    """
+    Компактная запись сессии.
+
+    __slots__ вместо словаря, целочисленные метки времени, интернированные
+    user_id и chat_id. Заданные вопросы - битовая маска id из
+    question_registry. Собранные данные - снимок LeadData, общий с
+    локальным кэшем MemoryService; после восстановления из журнала это
+    бинарная форма в base64, которая разбирается при первом обращении.
+    """
+
+    __slots__ = ('user_id', 'chat_id', 'created_at', 'last_activity', 'asked_mask', 'data_collected')
+
+    def __init__(self, user_id: str, chat_id: Optional[str], timestamp: int):
+        self.user_id = _intern(user_id)
+        self.chat_id = _intern(chat_id)
+        self.created_at = timestamp
+        self.last_activity = timestamp
+        # Бит i - вопрос с id i уже задавался
+        self.asked_mask = 0
+        # Собранные данные для быстрого доступа; None, пока данных нет
+        self.data_collected: Optional[Union[LeadData, str]] = None
+
+    def size(self) -> int:
+        """Примерный размер записи в памяти (без учета разделяемых объектов)"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.asked_mask)
+        data = self.data_collected
+        if isinstance(data, str):
+            size += sys.getsizeof(data)
+        elif data is not None:
+            size += sys.getsizeof(data) + sum(sys.getsizeof(getattr(data, name)) for name in data.__slots__)
+        return size
+
+
 class SessionManager:
     """Управление сессиями для предотвращения конфликтов памяти"""
 
     def __init__(self):
         # Кэш активных сессий в памяти
-        self.active_sessions: Dict[str, Dict[str, Any]] = {}
+        self.active_sessions: Dict[str, SessionRecord] = {}
         # Время жизни сессии по умолчанию (24 часа)
         self.session_ttl = 24 * 60 * 60
 
+        # Min-heap (срок истечения, session_id) с ленивым удалением: касание
+        # сессии только обновляет last_activity, а устаревшие записи кучи
+        # переставляются на актуальный срок при извлечении
+        self._expiry_heap: List[Tuple[int, str]] = []
+        # Обработчики истечения сессий (например, очистка кэшей MemoryService).
+        # Методы объектов хранятся по слабой ссылке: менеджер глобальный и не
+        # должен удерживать сервисы, которые забыли снять обработчик
+        self._expiry_listeners: List[Callable[[], Optional[Callable[[str], None]]]] = []
+
+        self._janitor: Optional[asyncio.Task] = None
+        self.janitor_interval = 60.0
+
+        # Журнал для восстановления сессий после рестарта (подключается при запуске)
+        self._journal: Optional[SessionJournal] = None
+
+        self.expiry_stats: Dict[str, int] = {
+            'expired_sessions': 0,
+            'reclaimed_bytes': 0,
+            'janitor_runs': 0,
+            'janitor_restarts': 0,
+        }
+
     def generate_session_id(self, user_id: str, chat_id: Optional[str] = None) -> str:
         """
         Генерирует уникальный session_id на основе user_id и времени
@@ -41,14 +114,7 @@ class SessionManager:
             base_id = f"group_{chat_id}_{base_id}"
 
         # Сохраняем информацию о сессии
-        self.active_sessions[base_id] = {
-            'user_id': user_id,
-            'chat_id': chat_id,
-            'created_at': timestamp,
-            'last_activity': timestamp,
-            'question_history': set(),  # История заданных вопросов
-            'data_collected': {}  # Собранные данные для быстрого доступа
-        }
+        self._add_session(base_id, user_id, chat_id, timestamp)
 
         logger.info(f"✅ Создана новая сессия: {base_id} для пользователя {user_id}")
         return base_id
@@ -71,15 +137,7 @@ class SessionManager:
         if existing_session_id:
             # Добавляем сессию в локальный кэш если ее там нет
             if existing_session_id not in self.active_sessions:
-                current_time = int(time.time())
-                self.active_sessions[existing_session_id] = {
-                    'user_id': user_id,
-                    'chat_id': chat_id,
-                    'created_at': current_time,
-                    'last_activity': current_time,
-                    'question_history': set(),
-                    'data_collected': {}
-                }
+                self._add_session(existing_session_id, user_id, chat_id, int(time.time()))
                 logger.info(f"📂 Добавлена существующая сессия в кэш: {existing_session_id}")
 
             self.update_session_activity(existing_session_id)
@@ -100,9 +158,9 @@ class SessionManager:
         current_time = int(time.time())
 
         # Проверяем TTL
-        if current_time - session_data['last_activity'] > self.session_ttl:
+        if current_time - session_data.last_activity > self.session_ttl:
             # Удаляем устаревшую сессию
-            del self.active_sessions[session_id]
+            self._expire_session(session_id)
             logger.info(f"🗑️ Удалена устаревшая сессия: {session_id}")
             return False
 
@@ -110,76 +168,240 @@ class SessionManager:
 
     def update_session_activity(self, session_id: str):
         """Обновляет время последней активности сессии"""
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]['last_activity'] = int(time.time())
+        session = self.active_sessions.get(session_id)
+        if session is not None:
+            session.last_activity = int(time.time())
 
     def record_asked_question(self, session_id: str, question: str):
         """Записывает заданный вопрос для предотвращения повторов"""
-        if session_id in self.active_sessions:
-            # Нормализуем вопрос для сравнения
-            normalized_question = self._normalize_question(question)
-            self.active_sessions[session_id]['question_history'].add(normalized_question)
-            logger.debug(f"📝 Записан вопрос в историю сессии {session_id}: {normalized_question}")
+        session = self.active_sessions.get(session_id)
+        if session is not None:
+            session.asked_mask = question_registry.add(session.asked_mask, question)
+            logger.debug(f"📝 Записан вопрос в историю сессии {session_id}: {question}")
 
     def was_question_asked(self, session_id: str, question: str) -> bool:
         """Проверялся ли уже этот вопрос в текущей сессии"""
-        if session_id not in self.active_sessions:
+        session = self.active_sessions.get(session_id)
+        if session is None:
+            return False
+        if isinstance(session.data_collected, str):
+            # Сессия из журнала: заданные вопросы берутся из снимка лида
+            self.get_session_lead(session_id)
+        if not session.asked_mask:
             return False
 
-        normalized_question = self._normalize_question(question)
-        was_asked = normalized_question in self.active_sessions[session_id]['question_history']
+        was_asked = question_registry.contains(session.asked_mask, question)
 
         if was_asked:
-            logger.info(f"⚠️ Вопрос уже задавался в сессии {session_id}: {normalized_question}")
+            logger.info(f"⚠️ Вопрос уже задавался в сессии {session_id}: {question}")
 
         return was_asked
 
     def record_collected_data(self, session_id: str, data_type: str, value: Any):
-        """Записывает собранные данные для быстрой проверки"""
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]['data_collected'][data_type] = value
+        """Записывает собранные данные (поле LeadData) для быстрой проверки"""
+        session = self.active_sessions.get(session_id)
+        if session is not None:
+            lead = self.get_session_lead(session_id) or LeadData()
+            session.data_collected = lead.replace(**{data_type: value})
             logger.debug(f"📊 Записаны данные {data_type} в сессию {session_id}")
 
     def has_collected_data(self, session_id: str, data_type: str) -> bool:
         """Проверяет наличие собранных данных определенного типа"""
-        if session_id not in self.active_sessions:
+        lead = self.get_session_lead(session_id)
+        if lead is None:
             return False
 
-        has_data = data_type in self.active_sessions[session_id]['data_collected']
+        has_data = getattr(lead, data_type, None) not in (None, '', (), {})
 
         if has_data:
             logger.debug(f"✅ Данные {data_type} уже собраны в сессии {session_id}")
 
         return has_data
 
-    def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
+    def get_session_info(self, session_id: str) -> Optional[SessionRecord]:
         """Получает информацию о сессии"""
         return self.active_sessions.get(session_id)
 
-    def cleanup_expired_sessions(self):
-        """Очищает устаревшие сессии"""
-        current_time = int(time.time())
-        expired_sessions = []
+    def set_session_data(self, session_id: str, lead: LeadData):
+        """Сохраняет снимок данных лида в кэше сессии (и в журнале)"""
+        session = self.active_sessions.get(session_id)
+        if session is None:
+            return
+        session.data_collected = lead
+        if self._journal:
+            self._journal.record_data(session_id, lead.to_bytes())
+
+    def get_session_lead(self, session_id: str) -> Optional[LeadData]:
+        """Снимок данных лида из кэша сессии или None, если данных нет"""
+        session = self.active_sessions.get(session_id)
+        if session is None or not session.data_collected:
+            return None
+        data = session.data_collected
+        if isinstance(data, str):
+            # Восстановлено из журнала: разбираем один раз
+            try:
+                data = session.data_collected = LeadData.from_bytes(base64.b64decode(data))
+                session.asked_mask |= data.asked_questions_mask
+            except (ValueError, binascii.Error) as e:
+                # Схема LeadData изменилась: данные прочитаются из хранилища
+                logger.warning(f"⚠️ Данные сессии {session_id} из журнала не разобраны: {e}")
+                session.data_collected = None
+                return None
+        return data
+
+    def attach_journal(self, journal: SessionJournal):
+        """Подключает журнал: дальнейшие изменения сессий в нем фиксируются"""
+        self._journal = journal
+        journal.retain_sessions(self.active_sessions)
+
+    def restore_sessions(self, sessions: Dict[str, SessionState]) -> int:
+        """
+        Восстанавливает кэш сессий из журнала.
 
-        for session_id, session_data in self.active_sessions.items():
-            if current_time - session_data['last_activity'] > self.session_ttl:
-                expired_sessions.append(session_id)
+        Returns:
+            Количество восстановленных сессий (истекшие пропускаются)
+        """
+        ttl = self.session_ttl
+        expired_before = int(time.time()) - ttl
+        active_sessions = self.active_sessions
+        new_record = SessionRecord.__new__
+        restored: Dict[str, SessionRecord] = {}
+        # Массовое создание записей: циклический GC только тратил бы время
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for session_id, (user_id, chat_id, created_at, last_activity, data) in sessions.items():
+                if last_activity < expired_before or session_id in active_sessions:
+                    continue
+                # Слоты заполняются напрямую: id уже интернированы журналом
+                session = new_record(SessionRecord)
+                session.user_id = user_id
+                session.chat_id = chat_id
+                session.created_at = created_at
+                session.last_activity = last_activity
+                # Заданные вопросы добавятся из снимка лида при его разборе
+                session.asked_mask = 0
+                session.data_collected = data
+                restored[session_id] = session
+            active_sessions.update(restored)
+            self._expiry_heap.extend([(session.last_activity + ttl, session_id)
+                                      for session_id, session in restored.items()])
+            heapq.heapify(self._expiry_heap)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return len(restored)
+
+    def cleanup_expired_sessions(self) -> int:
+        """
+        Очищает устаревшие сессии.
 
-        for session_id in expired_sessions:
-            del self.active_sessions[session_id]
-            logger.info(f"🧹 Очищена устаревшая сессия: {session_id}")
+        Просматривает только вершину кучи сроков: O(log n) на каждую
+        истекшую или продленную сессию вместо обхода всех сессий.
+
+        Returns:
+            Количество удаленных сессий
+        """
+        current_time = int(time.time())
+        expired = 0
+        reclaimed = 0
+
+        while self._expiry_heap and self._expiry_heap[0][0] < current_time:
+            _, session_id = heapq.heappop(self._expiry_heap)
+            session_data = self.active_sessions.get(session_id)
+            if session_data is None:
+                # Сессия уже удалена при обращении
+                continue
+
+            deadline = session_data.last_activity + self.session_ttl
+            if deadline >= current_time:
+                # Сессия была активна после постановки в кучу - переносим срок
+                heapq.heappush(self._expiry_heap, (deadline, session_id))
+                continue
+
+            reclaimed += self._expire_session(session_id)
+            expired += 1
+
+        if expired:
+            logger.info(f"🧹 Очищено устаревших сессий: {expired}, освобождено ~{reclaimed // 1024} КБ")
+        return expired
+
+    def add_expiry_listener(self, listener: Callable[[str], None]):
+        """Регистрирует обработчик, вызываемый при удалении устаревшей сессии"""
+        self._expiry_listeners = [ref for ref in self._expiry_listeners if ref() is not None]
+        if inspect.ismethod(listener):
+            self._expiry_listeners.append(weakref.WeakMethod(listener))
+        else:
+            self._expiry_listeners.append(lambda: listener)
+
+    def remove_expiry_listener(self, listener: Callable[[str], None]):
+        """Снимает обработчик; обработчики удаленных объектов снимаются заодно"""
+        self._expiry_listeners = [ref for ref in self._expiry_listeners if ref() not in (None, listener)]
+
+    def start_janitor(self, interval: Optional[float] = None):
+        """Запускает фоновую очистку устаревших сессий"""
+        if interval is not None:
+            self.janitor_interval = interval
+        if self._janitor and not self._janitor.done():
+            return
+        self._janitor = asyncio.get_running_loop().create_task(self._janitor_loop())
+        self._janitor.add_done_callback(self._on_janitor_done)
+        logger.info(f"🧹 Запущена фоновая очистка сессий (интервал {self.janitor_interval}с)")
+
+    async def stop_janitor(self):
+        """Останавливает фоновую очистку"""
+        janitor, self._janitor = self._janitor, None
+        if janitor:
+            janitor.cancel()
+            try:
+                await janitor
+            except asyncio.CancelledError:
+                pass
+
+    async def _janitor_loop(self):
+        while True:
+            await asyncio.sleep(self.janitor_interval)
+            self.cleanup_expired_sessions()
+            self.expiry_stats['janitor_runs'] += 1
+
+    def _on_janitor_done(self, task: asyncio.Task):
+        """Супервизор: перезапускает очистку, если она упала"""
+        if task.cancelled() or task is not self._janitor:
+            return
+        error = task.exception()
+        logger.error(f"❌ Фоновая очистка сессий завершилась с ошибкой: {error}, перезапуск")
+        self.expiry_stats['janitor_restarts'] += 1
+        self._janitor = None
+        self.start_janitor()
+
+    def _add_session(self, session_id: str, user_id: str, chat_id: Optional[str], timestamp: int):
+        self.active_sessions[session_id] = SessionRecord(user_id, chat_id, timestamp)
+        heapq.heappush(self._expiry_heap, (timestamp + self.session_ttl, session_id))
+        if self._journal:
+            self._journal.record_session(session_id, user_id, chat_id, timestamp)
+
+    def _expire_session(self, session_id: str) -> int:
+        """Удаляет сессию; возвращает примерный объем освобожденной памяти"""
+        session_data = self.active_sessions.pop(session_id)
+        reclaimed = sys.getsizeof(session_id) + session_data.size()
+        self.expiry_stats['expired_sessions'] += 1
+        self.expiry_stats['reclaimed_bytes'] += reclaimed
+        if self._journal:
+            self._journal.record_expired(session_id)
+
+        for ref in self._expiry_listeners:
+            listener = ref()
+            if listener is None:
+                continue
+            try:
+                listener(session_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика истечения сессии {session_id}: {e}")
+        return reclaimed
 
     def _normalize_question(self, question: str) -> str:
         """Нормализует вопрос для сравнения"""
-        # Приводим к нижнему регистру, удаляем лишние пробелы и знаки препинания
-        normalized = question.lower().strip()
-
-        # Удаляем common words that don't affect meaning
-        stop_words = {'для', 'или', 'как', 'вы', 'сейчас', 'в', 'на', 'по'}
-        words = normalized.split()
-        filtered_words = [word for word in words if word not in stop_words]
-
-        return ' '.join(filtered_words)
+        return normalize_question(question)
 
     def get_session_stats(self) -> Dict[str, Any]:
         """Получает статистику по сессиям"""
@@ -189,11 +411,13 @@ class SessionManager:
             return {
                 'total_sessions': 0,
                 'active_sessions': 0,
-                'avg_questions_per_session': 0
+                'avg_questions_per_session': 0,
+                'expiry_heap_size': len(self._expiry_heap),
+                **self.expiry_stats
             }
 
         total_questions = sum(
-            len(session['question_history'])
+            session.asked_mask.bit_count()
             for session in self.active_sessions.values()
         )
 
@@ -202,13 +426,15 @@ class SessionManager:
             'active_sessions': total_sessions,  # Все в active_sessions считаются активными
             'avg_questions_per_session': total_questions / total_sessions,
             'oldest_session': min(
-                session['created_at']
+                session.created_at
                 for session in self.active_sessions.values()
             ),
             'newest_session': max(
-                session['created_at']
+                session.created_at
                 for session in self.active_sessions.values()
-            )
+            ),
+            'expiry_heap_size': len(self._expiry_heap),
+            **self.expiry_stats
         }
 
 
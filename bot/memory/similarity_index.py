@@ -0,0 +1,431 @@
+"""
+Локальный индекс похожих диалогов и профилей лидов на хэшированных n-граммах
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import uuid
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+# Строк в блоке буфера новых векторов: буфер растет блоками, без копирования
+_PENDING_BLOCK = 1024
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+@dataclass
+class _CompactionSnapshot:
+    """Состояние индекса, по которому строится новое поколение"""
+    generation: Optional[str]
+    rows: int  # документов в снимке
+    pending_count: int  # из них новых векторов
+    documents_offset: int  # размер файла документов на момент снимка
+    matrix: "np.ndarray"
+    pending: List["np.ndarray"]  # блоки новых векторов
+    documents: List[Dict[str, Any]]
+    alive: List[bool]
+
+
+@dataclass
+class _Generation:
+    """Поколение, построенное по снимку: файлы записаны, но еще не подключены"""
+    generation: str
+    documents: List[Dict[str, Any]]
+    alive: List[bool]
+    keys: Dict[str, int]
+    documents_tmp_path: Path
+
+
+class SimilarityIndex:
+    """
+    Поиск похожих кейсов без обращения к сети.
+
+    Текст превращается в вектор хэшированных признаков (слова и символьные
+    триграммы, hashing trick со знаком) и нормируется, поэтому косинусная
+    близость - это скалярное произведение. Основная матрица лежит в .npy и
+    открывается через memory map; новые документы копятся в памяти и
+    периодически сливаются с ней (компактизация), заодно удаляются
+    документы, замененные более новыми версиями (например, профиль лида).
+    Документы хранятся в append-only JSONL в порядке строк матрицы; первая
+    строка - заголовок с поколением матрицы. Матрица каждого поколения пишется
+    в свой файл, поэтому сбой посреди компактизации не рассинхронизирует их.
+
+    Внутри event loop компактизация идет в фоне: новое поколение строится
+    в потоке по снимку индекса, а затем подменяет текущее вместе с
+    документами, добавленными за это время. search можно вызывать из
+    потока (asyncio.to_thread): он берет ссылки на текущее поколение под
+    блокировкой и дальше читает только неизменяемые строки.
+    """
+
+    def __init__(self, path: str = "data/similarity", dim: int = 1024, compact_threshold: int = 512,
+                 compact_ratio: float = 0.25):
+        if np is None:
+            raise RuntimeError("Для локального индекса похожих кейсов нужен numpy")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        # Компактизация, когда новых документов больше порога и доли от основной
+        # матрицы: перезапись файла растет геометрически, суммарно O(n)
+        self.compact_threshold = compact_threshold
+        self.compact_ratio = compact_ratio
+
+        self._documents_path = self.path / "documents.jsonl"
+        self._generation: Optional[str] = None
+
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        # Новые векторы в блоках по _PENDING_BLOCK строк; заняты первые _pending_count
+        self._pending: List["np.ndarray"] = []
+        self._pending_count = 0
+        self._documents: List[Dict[str, Any]] = []
+        self._alive: List[bool] = []
+        # Строка актуальной версии документа по ключу (например, lead:<session_id>)
+        self._keys: Dict[str, int] = {}
+        self._documents_file = None
+        # Защищает замену поколения и добавление от чтения из потока поиска
+        self._lock = threading.Lock()
+        self._compaction: Optional[asyncio.Task] = None
+
+        self._load()
+
+    # === Векторизация ===
+
+    def vectorize(self, text: str) -> "np.ndarray":
+        """Нормированный вектор хэшированных признаков текста"""
+        features = self._features(text)
+        hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                             dtype=np.uint32, count=len(features))
+        # Старший бит хэша задает знак: коллизии взаимно гасятся, а не копятся
+        signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+        vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    @staticmethod
+    def _features(text: str) -> List[str]:
+        features = []
+        for word in _WORD_RE.findall(text.lower()):
+            features.append(f"w:{word}")
+            padded = f"^{word}$"
+            # Триграммы устойчивы к падежным окончаниям русских слов
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    # === Добавление и поиск ===
+
+    def add(self, text: str, session_id: str, metadata: Optional[Dict[str, Any]] = None,
+            key: Optional[str] = None):
+        """
+        Добавляет документ в индекс.
+
+        Документ с тем же key заменяет предыдущую версию.
+        """
+        if not text or not text.strip():
+            return
+
+        document = {'session_id': session_id, 'content': text, 'metadata': metadata or {}, 'key': key}
+        vector = self.vectorize(text)
+        self._write_document(document)
+        with self._lock:
+            self._append_document(document, vector)
+
+        if self._pending_count >= max(self.compact_threshold, len(self._matrix) * self.compact_ratio):
+            self._schedule_compaction()
+
+    def get_content(self, key: str) -> Optional[str]:
+        """Текст актуальной версии документа с ключом key"""
+        row = self._keys.get(key)
+        return self._documents[row]['content'] if row is not None else None
+
+    def search(self, query: str, limit: int = 5, exclude_session: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k документов по косинусной близости: session_id, content, score, metadata"""
+        with self._lock:
+            # Строки до count больше не меняются; списки нового поколения и
+            # списки блоков при росте - новые объекты, ссылки остаются согласованными
+            matrix, pending, documents, alive = self._matrix, self._pending, self._documents, self._alive
+            pending_count = self._pending_count
+        count = len(matrix) + pending_count
+        if not count:
+            return []
+
+        query_vector = self.vectorize(query)
+        scores = np.concatenate([matrix @ query_vector, *(block @ query_vector for block in pending)])[:count]
+        documents = documents[:count]
+
+        # Замененные документы и собственная сессия не участвуют в выдаче
+        mask = ~np.asarray(alive[:count], dtype=bool)
+        if exclude_session is not None:
+            mask |= np.fromiter(
+                (document['session_id'] == exclude_session for document in documents),
+                dtype=bool, count=count
+            )
+        scores[mask] = -np.inf
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            score = float(scores[row])
+            if score <= 0:
+                break
+            document = documents[row]
+            results.append({
+                'session_id': document['session_id'],
+                'content': document['content'],
+                'score': score,
+                'metadata': document['metadata'],
+            })
+        return results
+
+    def compact(self):
+        """Сливает новые векторы с основной матрицей и удаляет замененные документы"""
+        snapshot = self._compaction_snapshot()
+        replaced = self._install_generation(snapshot, self._build_generation(snapshot))
+        if replaced:
+            replaced.close()
+
+    async def compact_in_background(self):
+        """compact, но новое поколение строится в потоке, не останавливая event loop"""
+        snapshot = self._compaction_snapshot()
+        try:
+            built = await asyncio.to_thread(self._build_generation, snapshot)
+        except Exception as e:
+            logger.error(f"❌ Ошибка компактизации индекса похожих кейсов: {e}")
+            return
+        replaced = self._install_generation(snapshot, built)
+        if replaced:
+            # Последняя ссылка на старый файл документов: его удаление
+            # освобождает страницы кэша и занимает десятки миллисекунд
+            await asyncio.to_thread(replaced.close)
+
+    async def drain(self):
+        """Дожидается фоновой компактизации"""
+        if self._compaction is not None:
+            await asyncio.shield(self._compaction)
+            self._compaction = None
+
+    def _schedule_compaction(self):
+        if self._compaction is not None and not self._compaction.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact()
+            return
+        self._compaction = loop.create_task(self.compact_in_background(), context=contextvars.Context())
+
+    def _compaction_snapshot(self) -> _CompactionSnapshot:
+        with self._lock:
+            rows, pending_count = len(self._documents), self._pending_count
+            return _CompactionSnapshot(self._generation, rows, pending_count, self._documents_size(),
+                                       self._matrix, list(self._pending), self._documents[:rows],
+                                       self._alive[:rows])
+
+    def _build_generation(self, snapshot: _CompactionSnapshot) -> _Generation:
+        """Пишет матрицу и документы нового поколения; состояние индекса не меняет"""
+        keep = np.asarray(snapshot.alive, dtype=bool)
+        rows = len(snapshot.matrix) + snapshot.pending_count
+        matrix = np.concatenate([snapshot.matrix, *snapshot.pending])[:rows][keep]
+        documents = [document for document, kept in zip(snapshot.documents, snapshot.alive) if kept]
+        alive, keys = self._link_documents(documents)
+
+        # Сначала матрица нового поколения, затем документы, которые на нее ссылаются
+        generation = uuid.uuid4().hex
+        np.save(self._vectors_path(generation), matrix)
+        header = {'generation': generation, 'dim': self.dim}
+        tmp_path = self.path / f"documents-{generation}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in [header, *documents]))
+        return _Generation(generation, documents, alive, keys, tmp_path)
+
+    def _install_generation(self, snapshot: _CompactionSnapshot, built: _Generation):
+        """
+        Подменяет поколение; документы, добавленные после снимка, переносятся в него.
+
+        Возвращает открытый на чтение прежний файл документов (или None):
+        пока он открыт, os.replace не удаляет данные файла, и закрыть его
+        можно вне event loop.
+        """
+        if snapshot.generation != self._generation:
+            # Индекс уже сжат другой компактизацией, снимок устарел
+            built.documents_tmp_path.unlink(missing_ok=True)
+            self._vectors_path(built.generation).unlink(missing_ok=True)
+            return None
+        with self._lock:
+            tail = self._documents[snapshot.rows:]
+            tail_vectors = self._pending_rows(snapshot.pending_count, self._pending_count)
+            self._close_documents_file()
+            replaced = open(self._documents_path, 'rb') if self._documents_path.exists() else None
+            if replaced and tail:
+                # Строки документов, добавленных после снимка, уже записаны
+                # в конец прежнего файла - копируются как есть
+                replaced.seek(snapshot.documents_offset)
+                with open(built.documents_tmp_path, 'ab') as f:
+                    shutil.copyfileobj(replaced, f)
+            os.replace(built.documents_tmp_path, self._documents_path)
+
+            previous_generation = self._generation
+            self._generation = built.generation
+            self._documents, self._alive, self._keys = built.documents, built.alive, built.keys
+            self._matrix = np.load(self._vectors_path(built.generation), mmap_mode='r')
+            self._pending = [self._pending_block(tail_vectors[start:start + _PENDING_BLOCK])
+                             for start in range(0, len(tail_vectors), _PENDING_BLOCK)]
+            self._pending_count = len(tail_vectors)
+            # Документы, добавленные во время компактизации, - так же, как в add,
+            # в том числе замена версий, попавших в новое поколение
+            for document in tail:
+                self._link_document(document)
+        if previous_generation:
+            self._vectors_path(previous_generation).unlink(missing_ok=True)
+        logger.info(f"🗜️ Индекс похожих кейсов сжат: {len(self._documents)} документов, "
+                    f"удалено {snapshot.rows - len(built.documents)}")
+        return replaced
+
+    def close(self):
+        if self._pending_count:
+            self.compact()
+        self._close_documents_file()
+
+    def __len__(self) -> int:
+        return sum(self._alive)
+
+    # === Хранение ===
+
+    def _vectors_path(self, generation: str) -> Path:
+        return self.path / f"vectors-{generation}.npy"
+
+    def _load(self):
+        header: Dict[str, Any] = {}
+        documents: List[Dict[str, Any]] = []
+        if self._documents_path.exists():
+            with open(self._documents_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная последняя строка после аварийного завершения
+                        continue
+                    if 'generation' in record:
+                        header = record
+                    else:
+                        documents.append(record)
+
+        self._generation = header.get('generation')
+        if self._generation and header.get('dim') == self.dim:
+            vectors_path = self._vectors_path(self._generation)
+            matrix = np.load(vectors_path, mmap_mode='r') if vectors_path.exists() else None
+            if matrix is not None and matrix.shape[0] <= len(documents):
+                self._matrix = matrix
+            else:
+                # Векторы выводятся из текстов - просто строим их заново
+                logger.warning("⚠️ Матрица индекса похожих кейсов не найдена, векторы будут пересчитаны")
+
+        # Файлы, оставшиеся от прерванных компактизаций
+        for stale_path in self.path.glob("vectors-*.npy"):
+            if stale_path.name != f"vectors-{self._generation}.npy":
+                stale_path.unlink(missing_ok=True)
+        for stale_path in self.path.glob("documents-*.tmp"):
+            stale_path.unlink(missing_ok=True)
+
+        self._set_documents(documents)
+        # Документы, добавленные после последней компактизации, векторизуем заново
+        for document in documents[len(self._matrix):]:
+            self._append_pending(self.vectorize(document['content']))
+        if documents:
+            logger.info(f"📂 Индекс похожих кейсов загружен: {len(documents)} документов")
+
+    def _append_pending(self, vector: "np.ndarray"):
+        block, row = divmod(self._pending_count, _PENDING_BLOCK)
+        if block == len(self._pending):
+            # Новый список: поток поиска мог взять ссылку на прежний
+            self._pending = [*self._pending, self._pending_block()]
+        self._pending[block][row] = vector
+        self._pending_count += 1
+
+    def _pending_block(self, rows: Optional["np.ndarray"] = None) -> "np.ndarray":
+        block = np.zeros((_PENDING_BLOCK, self.dim), dtype=np.float32)
+        if rows is not None:
+            block[:len(rows)] = rows
+        return block
+
+    def _pending_rows(self, start: int, stop: int) -> "np.ndarray":
+        """Копия новых векторов [start:stop)"""
+        first = start // _PENDING_BLOCK
+        blocks = self._pending[first:(stop - 1) // _PENDING_BLOCK + 1] if stop > start else []
+        if not blocks:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        offset = first * _PENDING_BLOCK
+        return np.concatenate(blocks)[start - offset:stop - offset]
+
+    def _documents_size(self) -> int:
+        if self._documents_file is not None:
+            return os.fstat(self._documents_file.fileno()).st_size
+        return self._documents_path.stat().st_size if self._documents_path.exists() else 0
+
+    def _append_document(self, document: Dict[str, Any], vector: "np.ndarray"):
+        self._append_pending(vector)
+        self._link_document(document)
+
+    def _link_document(self, document: Dict[str, Any]):
+        row = len(self._documents)
+        self._documents.append(document)
+        self._alive.append(True)
+
+        key = document.get('key')
+        if key is not None:
+            previous = self._keys.get(key)
+            if previous is not None:
+                self._alive[previous] = False
+            self._keys[key] = row
+
+    def _set_documents(self, documents: List[Dict[str, Any]]):
+        self._documents = documents
+        self._alive, self._keys = self._link_documents(documents)
+
+    @staticmethod
+    def _link_documents(documents: List[Dict[str, Any]]) -> Tuple[List[bool], Dict[str, int]]:
+        """Флаги актуальности и строки последних версий по ключам"""
+        alive = [True] * len(documents)
+        keys: Dict[str, int] = {}
+        for row, document in enumerate(documents):
+            key = document.get('key')
+            if key is None:
+                continue
+            previous = keys.get(key)
+            if previous is not None:
+                alive[previous] = False
+            keys[key] = row
+        return alive, keys
+
+    def _write_document(self, document: Dict[str, Any]):
+        if self._documents_file is None:
+            self._documents_file = open(self._documents_path, 'a', encoding='utf-8')
+        self._documents_file.write(json.dumps(document, ensure_ascii=False) + '\n')
+        self._documents_file.flush()
+
+    def _close_documents_file(self):
+        if self._documents_file:
+            self._documents_file.close()
+            self._documents_file = None
@@ -0,0 +1,111 @@
+"""
+Симулятор переходов состояний диалога по журналам
+
+Прогоняет сообщения сессий из журналов DialogLogger через экстракторы и
+DialogStateExtractor, как MemoryService.process_message, и показывает,
+как диалоги движутся по таблице переходов: сколько раз выполнен каждый
+переход, на каких состояниях диалоги заканчиваются, сколько сообщений
+проводят в каждом состоянии и где пересчитанные переходы расходятся с
+записанными в журнале.
+
+Запуск:
+    python -m bot.memory.state_replay [--logs logs/dialogs] [--show 5]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .backfill import SessionHistory, read_dialog_logs
+from .extractors import DialogStateExtractor, LeadDataExtractor
+from .models import DialogState, LeadData
+
+
+@dataclass
+class ReplayStats:
+    """Итоги симуляции"""
+    sessions: int = 0
+    messages: int = 0
+    transitions: Counter = field(default_factory=Counter)  # (из, в) -> число
+    final_states: Counter = field(default_factory=Counter)
+    dwell: Counter = field(default_factory=Counter)  # состояние -> сообщений в нем
+    mismatched: List[Tuple[str, List[Tuple[str, str]], List[Tuple[str, str]]]] = field(default_factory=list)
+    state_seconds: float = 0.0  # время в determine_state
+
+
+def replay_session(history: SessionHistory, stats: ReplayStats) -> List[Tuple[str, str]]:
+    """Переходы сессии при повторном прогоне; счетчики добавляются в stats"""
+    lead = LeadData()
+    transitions = []
+    for message in history.messages:
+        state = lead.current_dialog_state
+        lead = LeadDataExtractor.extract_from_message(message, lead)
+        started = time.perf_counter()
+        new_state = DialogStateExtractor.determine_state(message, state, lead)
+        stats.state_seconds += time.perf_counter() - started
+        lead = lead.replace(current_dialog_state=new_state)
+        stats.dwell[state] += 1
+        if new_state != state:
+            stats.transitions[(state, new_state)] += 1
+            transitions.append((state.value, new_state.value))
+    stats.sessions += 1
+    stats.messages += len(history.messages)
+    stats.final_states[lead.current_dialog_state] += 1
+    return transitions
+
+
+def simulate(sessions: Dict[str, SessionHistory]) -> ReplayStats:
+    stats = ReplayStats()
+    for session_id, history in sessions.items():
+        transitions = replay_session(history, stats)
+        if transitions != history.transitions:
+            stats.mismatched.append((session_id, history.transitions, transitions))
+    return stats
+
+
+def print_report(stats: ReplayStats, show: int = 0):
+    rate = stats.messages / stats.state_seconds if stats.state_seconds > 0 else 0.0
+    print(f"Сессий: {stats.sessions}, сообщений: {stats.messages}, "
+          f"определение состояния: {rate:,.0f} сообщений/с")
+
+    print("Переходы:")
+    for (from_state, to_state), count in sorted(stats.transitions.items(),
+                                                key=lambda item: list(DialogState).index(item[0][0])):
+        print(f"   {from_state.value} → {to_state.value}: {count}")
+
+    print("Состояния (сессий закончили в нем / сообщений в нем):")
+    for state in DialogState:
+        if stats.final_states[state] or stats.dwell[state]:
+            print(f"   {state.value}: {stats.final_states[state]} / {stats.dwell[state]}")
+
+    print(f"Сессий с переходами, отличными от журнала: {len(stats.mismatched)}")
+    for session_id, logged, replayed in stats.mismatched[:show]:
+        print(f"📋 {session_id}:")
+        print(f"   журнал: {' → '.join(to for _, to in logged) or '-'}")
+        print(f"   прогон: {' → '.join(to for _, to in replayed) or '-'}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logs', default='logs/dialogs', help="каталог журналов диалогов")
+    parser.add_argument('--show', type=int, default=0, help="показать первые N расхождений с журналом")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.logs, 'dialogs_*.jsonl')))
+    if not paths:
+        print(f"❌ Нет журналов диалогов в {args.logs}")
+        return 1
+
+    sessions, skipped_lines = read_dialog_logs(paths)
+    if skipped_lines:
+        print(f"⚠️ Пропущено битых строк журнала: {skipped_lines}")
+    print_report(simulate(sessions), args.show)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
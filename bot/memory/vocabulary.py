@@ -0,0 +1,201 @@
+"""
+Словари экстракторов: загрузка из файла данных и кэш скомпилированного автомата
+"""
+import hashlib
+import json
+import logging
+import marshal
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .keyword_automaton import KeywordAutomaton
+from .models import AutomationGoal, PaymentType
+from .russian_stemmer import stem_text
+
+logger = logging.getLogger(__name__)
+
+_DATA_DIR = Path(__file__).resolve().parent.parent.parent / 'data'
+VOCABULARY_PATH = Path(os.getenv('EXTRACTOR_VOCABULARY_PATH', _DATA_DIR / 'extractor_vocabulary.json'))
+VOCABULARY_CACHE_DIR = Path(os.getenv('EXTRACTOR_VOCABULARY_CACHE_DIR', _DATA_DIR / 'vocabulary_cache'))
+
+SCHEMA_VERSION = 1
+# Формат скомпилированного автомата: увеличить при изменении таблиц
+# KeywordAutomaton или стеммера, иначе загрузятся устаревшие таблицы
+COMPILED_FORMAT = 2
+# Сколько артефактов хранить в каталоге кэша (для отката на прежнюю версию словарей)
+_CACHE_KEEP = 5
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    """Словари экстракторов и автомат, скомпилированный по ним"""
+    version: int  # версия содержимого из файла
+    content_hash: str  # ключ кэша: файл, дополнительные группы, формат автомата
+    business_spheres: Dict[str, str]
+    automation_goals: Dict[str, AutomationGoal]
+    payment_types: Dict[str, PaymentType]
+    sochi_locations: List[str]
+    property_types: Dict[str, str]
+    tech_keywords: Dict[str, str]
+    urgency_keywords: Dict[str, str]
+    mortgage_banks: List[str]
+    phrases: Dict[str, List[str]]
+    stemmed_groups: Tuple[str, ...]
+    keyword_groups: Dict[str, List[str]]
+    automaton: KeywordAutomaton = field(repr=False)
+    from_cache: bool = False  # автомат загружен из кэша, а не построен
+
+
+def _words(data: Mapping[str, Any], section: str) -> List[str]:
+    words = data.get(section)
+    if not isinstance(words, list) or not all(isinstance(word, str) and word for word in words):
+        raise ValueError(f"{section}: ожидается список непустых строк")
+    return words
+
+
+def _mapping(data: Mapping[str, Any], section: str, convert=str) -> Dict[str, Any]:
+    mapping = data.get(section)
+    if not isinstance(mapping, dict):
+        raise ValueError(f"{section}: ожидается объект слово -> значение")
+    result = {}
+    for word, value in mapping.items():
+        if not word or not isinstance(value, str):
+            raise ValueError(f"{section}: пустое слово или нестроковое значение у {word!r}")
+        try:
+            result[word] = convert(value)
+        except ValueError:
+            raise ValueError(f"{section}: недопустимое значение {value!r} у {word!r}") from None
+    return result
+
+
+def parse_vocabulary(data: Any) -> Dict[str, Any]:
+    """Проверенные разделы файла словарей (ValueError при ошибке в данных)"""
+    if not isinstance(data, dict):
+        raise ValueError("Файл словарей должен содержать JSON-объект")
+    if data.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(f"Неподдерживаемая schema_version {data.get('schema_version')!r}, "
+                         f"ожидается {SCHEMA_VERSION}")
+    version = data.get('version')
+    if not isinstance(version, int):
+        raise ValueError("version: ожидается целое число")
+
+    phrases = data.get('phrases')
+    if not isinstance(phrases, dict):
+        raise ValueError("phrases: ожидается объект группа -> список фраз")
+    sections = {
+        'version': version,
+        'business_spheres': _mapping(data, 'business_spheres'),
+        'automation_goals': _mapping(data, 'automation_goals', AutomationGoal),
+        'payment_types': _mapping(data, 'payment_types', PaymentType),
+        'sochi_locations': _words(data, 'sochi_locations'),
+        'property_types': _mapping(data, 'property_types'),
+        'tech_keywords': _mapping(data, 'tech_keywords'),
+        'urgency_keywords': _mapping(data, 'urgency_keywords'),
+        'mortgage_banks': _words(data, 'mortgage_banks'),
+        'phrases': {group: _words(phrases, group) for group in phrases},
+        'stemmed_groups': tuple(_words(data, 'stemmed_groups')),
+    }
+    return sections
+
+
+def keyword_groups(sections: Mapping[str, Any], extra_groups: Mapping[str, Sequence[str]]) -> Dict[str, List[str]]:
+    """Группы автомата в порядке битов: словари, фразы, затем группы из кода"""
+    groups = {
+        'business_spheres': list(sections['business_spheres']),
+        'automation_goals': list(sections['automation_goals']),
+        'payment_types': list(sections['payment_types']),
+        'sochi_locations': list(sections['sochi_locations']),
+        'property_types': list(sections['property_types']),
+        'tech': list(sections['tech_keywords']),
+        'urgency': list(sections['urgency_keywords']),
+        'banks': list(sections['mortgage_banks']),
+    }
+    for name, words in {**sections['phrases'], **extra_groups}.items():
+        if name in groups:
+            raise ValueError(f"Группа {name!r} задана дважды")
+        groups[name] = list(words)
+    unknown = set(sections['stemmed_groups']) - set(groups)
+    if unknown:
+        raise ValueError(f"stemmed_groups: нет групп {sorted(unknown)}")
+    return groups
+
+
+def _cache_key(content: bytes, extra_groups: Mapping[str, Sequence[str]]) -> str:
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps(extra_groups, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    # marshal не переносим между версиями Python
+    digest.update(f"{COMPILED_FORMAT}:{marshal.version}:{sys.version_info[0]}.{sys.version_info[1]}".encode())
+    return digest.hexdigest()[:32]
+
+
+def _load_cached(path: Path, key: str) -> Optional[KeywordAutomaton]:
+    try:
+        # loads по байтам файла заметно быстрее load из файлового объекта
+        cached_key, tables = marshal.loads(path.read_bytes())
+        if cached_key != key:
+            raise ValueError("ключ не совпадает")
+        return KeywordAutomaton.from_tables(tables, stemmer=stem_text)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️ Кэш словарей {path.name} поврежден, автомат будет построен заново: {e}")
+        return None
+
+
+def _store_cached(cache_dir: Path, path: Path, key: str, automaton: KeywordAutomaton):
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f'.tmp{os.getpid()}')
+        temp_path.write_bytes(marshal.dumps((key, automaton.to_tables())))
+        os.replace(temp_path, path)
+        stale = sorted(cache_dir.glob('*.marshal'), key=lambda item: item.stat().st_mtime, reverse=True)
+        for old_path in stale[_CACHE_KEEP:]:
+            old_path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"⚠️ Не удалось сохранить кэш словарей в {cache_dir}: {e}")
+
+
+def load_vocabulary(path: Optional[Path] = None, cache_dir: Optional[Path] = None,
+                    extra_groups: Optional[Mapping[str, Sequence[str]]] = None,
+                    use_cache: bool = True) -> Vocabulary:
+    """
+    Читает словари и собирает автомат.
+
+    Автомат по тем же данным берется из кэша (cache_dir/<ключ>.marshal):
+    ключ - хеш содержимого файла, групп из кода (extra_groups) и формата
+    автомата, так что после правки файла кэш не устаревает, а строится
+    новый. Ошибки кэша не мешают загрузке; ошибки в файле словарей -
+    ValueError (или OSError, если файла нет).
+
+    Args:
+        path: Файл словарей (по умолчанию data/extractor_vocabulary.json)
+        cache_dir: Каталог кэша (по умолчанию data/vocabulary_cache)
+        extra_groups: Группы ключевых слов из кода, которые ищутся тем же автоматом
+        use_cache: Читать и записывать кэш; False - всегда строить автомат
+    """
+    path = Path(path) if path is not None else VOCABULARY_PATH
+    cache_dir = Path(cache_dir) if cache_dir is not None else VOCABULARY_CACHE_DIR
+    extra_groups = dict(extra_groups or {})
+
+    content = path.read_bytes()
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        raise ValueError(f"{path.name}: некорректный JSON: {e}") from None
+    sections = parse_vocabulary(data)
+    groups = keyword_groups(sections, extra_groups)
+    key = _cache_key(content, extra_groups)
+
+    cache_path = cache_dir / f'{key}.marshal' if use_cache else None
+    automaton = _load_cached(cache_path, key) if cache_path else None
+    from_cache = automaton is not None
+    if automaton is None:
+        automaton = KeywordAutomaton(groups, stemmed_groups=sections['stemmed_groups'], stemmer=stem_text)
+        if cache_path:
+            _store_cached(cache_dir, cache_path, key, automaton)
+
+    return Vocabulary(content_hash=key, keyword_groups=groups, automaton=automaton,
+                      from_cache=from_cache, **sections)
@@ -0,0 +1,158 @@
+"""
+Тесты кодека LeadData: round-trip всех форм на случайных лидах, версии схемы и бинарная раскладка
+
+Запуск:
+    python -m unittest tests.test_lead_codec
+"""
+import dataclasses
+import json
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from bot.memory.lead_codec import SCHEMA_VERSION, SCHEMA_VERSION_KEY
+from bot.memory.models import (
+    LEAD_FIELD_BITS, AutomationGoal, ClientType, DialogState, LeadData, PaymentType, lead_codec,
+)
+from bot.memory.question_registry import QUESTION_CATALOG, question_registry
+
+LOCATIONS = ['Адлер', 'Сириус', 'Хоста', 'Красная Поляна', 'центр Сочи']
+
+# Значения простых полей по типу аннотации
+PLAIN_VALUES = {
+    'str': ['', 'Анна', 'квартира с видом на море', 'emoji 🏠'],
+    'int': [0, 1, -3, 2 ** 40],
+    'bool': [False, True],
+}
+
+
+def random_lead(rng: random.Random) -> LeadData:
+    """Лид со случайным подмножеством заполненных полей, включая пустые и граничные значения"""
+    draft = LeadData(created_at=datetime(2025, 1, 1) + timedelta(seconds=rng.randrange(10 ** 7),
+                                                                  microseconds=rng.randrange(10 ** 6))).edit()
+    for spec in dataclasses.fields(LeadData):
+        if spec.name == 'filled_mask' or rng.random() < 0.4:
+            continue
+        annotation = str(spec.type)
+        if 'AutomationGoal' in annotation:
+            value = rng.choice(list(AutomationGoal))
+        elif 'PaymentType' in annotation:
+            value = rng.choice(list(PaymentType))
+        elif 'ClientType' in annotation:
+            value = rng.choice(list(ClientType))
+        elif 'DialogState' in annotation:
+            value = rng.choice(list(DialogState))
+        elif spec.name == 'agreed_demo_slots':
+            value = tuple(datetime(2025, 3, 1, 10) + timedelta(hours=rng.randrange(100))
+                          for _ in range(rng.randrange(3)))
+        elif spec.name == 'implementation_date':
+            value = rng.choice([datetime(2025, 6, 1, 12, 30), datetime(2025, 6, 1, tzinfo=timezone.utc)])
+        elif 'Tuple' in annotation:
+            value = tuple(rng.sample(LOCATIONS, rng.randrange(3)))
+        elif 'Dict' in annotation:
+            value = rng.choice([{}, {'вид': 'море'}, {'budget': 15000000, 'этажи': [2, 3]}])
+        elif spec.name == 'asked_questions_mask':
+            questions = rng.sample(QUESTION_CATALOG, rng.randrange(4))
+            if rng.random() < 0.3:
+                questions.append(f"Уточните, пожалуйста, этаж? #{rng.randrange(5)}")
+            draft.asked_questions_mask = LeadData().with_questions_asked(questions).asked_questions_mask
+            continue
+        elif spec.name == 'created_at':
+            continue
+        elif spec.name == 'updated_at':
+            value = draft.created_at + timedelta(minutes=rng.randrange(600))
+        else:
+            kind = next(name for name in PLAIN_VALUES if name in annotation)
+            value = rng.choice(PLAIN_VALUES[kind] + [None] * (spec.default is None))
+        setattr(draft, spec.name, value)
+    return draft.freeze()
+
+
+class LeadCodecRoundTripTest(unittest.TestCase):
+    """Каждая форма кодека декодируется в исходный лид"""
+
+    def setUp(self):
+        rng = random.Random(20251019)
+        self.leads = [LeadData(), LeadData(comments='')] + [random_lead(rng) for _ in range(500)]
+
+    def test_dense_dict(self):
+        for lead in self.leads:
+            data = lead_codec.to_dict(lead)
+            self.assertEqual(len(data), len(LEAD_FIELD_BITS) + 2)
+            self.assertEqual(lead_codec.from_dict(data), lead)
+
+    def test_sparse_dict(self):
+        for lead in self.leads:
+            data = lead_codec.to_dict(lead, sparse=True)
+            self.assertNotIn(None, data.values())
+            self.assertEqual(lead_codec.from_dict(data), lead)
+
+    def test_json(self):
+        # Как при записи в хранилище и журналы
+        for lead in self.leads:
+            for sparse in (False, True):
+                data = json.loads(json.dumps(lead_codec.to_dict(lead, sparse=sparse), ensure_ascii=False))
+                self.assertEqual(lead_codec.from_dict(data), lead)
+
+    def test_bytes(self):
+        for lead in self.leads:
+            self.assertEqual(lead_codec.from_bytes(lead_codec.to_bytes(lead)), lead)
+
+    def test_filled_mask(self):
+        for lead in self.leads:
+            expected = sum(bit for name, bit in LEAD_FIELD_BITS.items() if getattr(lead, name))
+            self.assertEqual(lead.filled_mask, expected)
+            self.assertEqual(lead_codec.from_dict(lead_codec.to_dict(lead)).filled_mask, expected)
+            self.assertEqual(lead_codec.from_bytes(lead_codec.to_bytes(lead)).filled_mask, expected)
+
+
+class LeadCodecReplaceTest(unittest.TestCase):
+
+    def test_replace_updates_mask(self):
+        lead = LeadData(name='Анна')
+        changed = lead.replace(name=None, budget_max=10000000)
+        self.assertIsNone(changed.name)
+        self.assertEqual(changed.budget_max, 10000000)
+        self.assertEqual(changed.filled_mask, lead_codec.filled_mask(changed))
+        self.assertEqual(lead.name, 'Анна')
+
+    def test_replace_unknown_field(self):
+        with self.assertRaises(TypeError):
+            LeadData().replace(unknown=1)
+
+
+class LeadCodecSchemaTest(unittest.TestCase):
+
+    def test_version_key(self):
+        self.assertEqual(LeadData().to_dict()[SCHEMA_VERSION_KEY], SCHEMA_VERSION)
+        self.assertEqual(LeadData().to_dict(sparse=True)[SCHEMA_VERSION_KEY], SCHEMA_VERSION)
+
+    def test_migrate_v1_questions(self):
+        # v1: без schema_version, заданные вопросы - список текстов
+        questions = [QUESTION_CATALOG[0], "Вопрос вне каталога?"]
+        lead = lead_codec.from_dict({'name': 'Игорь', 'asked_questions': questions})
+        self.assertEqual(lead.name, 'Игорь')
+        self.assertEqual(lead.asked_questions_mask, LeadData().with_questions_asked(questions).asked_questions_mask)
+        self.assertTrue(all(question_registry.contains(lead.asked_questions_mask, q) for q in questions))
+
+    def test_newer_version_reads_known_fields(self):
+        lead = lead_codec.from_dict({SCHEMA_VERSION_KEY: SCHEMA_VERSION + 1, 'city': 'Казань', 'future': 1})
+        self.assertEqual(lead.city, 'Казань')
+
+    def test_unknown_enum_value(self):
+        with self.assertRaises(ValueError):
+            lead_codec.from_dict({SCHEMA_VERSION_KEY: SCHEMA_VERSION, 'payment_type': 'barter'})
+
+    def test_foreign_layout_rejected(self):
+        payload = bytearray(LeadData(name='Анна').to_bytes())
+        payload[1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            lead_codec.from_bytes(bytes(payload))
+
+    def test_trailing_bytes_rejected(self):
+        with self.assertRaises(ValueError):
+            lead_codec.from_bytes(LeadData(name='Анна').to_bytes() + b'\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -40,6 +40,9 @@ except ImportError:
 # Импорт AI agent
 try:
     from bot.agent import AlenaAgent
+    from bot.memory.session_manager import session_manager
+    from bot.memory.session_journal import SessionJournal
+    from bot.config import SESSION_JOURNAL_DIR
     agent = AlenaAgent()
     AI_ENABLED = True
     print("✅ AI Agent загружен успешно")
@@ -62,6 +65,8 @@ bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
 
 # Хранилище активных сессий пользователей для сохранения контекста
 user_sessions = {}  # {user_id: session_id}
+# Журнал привязок и сессий: восстанавливает user_sessions после рестарта
+session_journal = None
 
 # === ЛОГИРОВАНИЕ ===
 os.makedirs("logs", exist_ok=True)
@@ -91,6 +96,44 @@ app = FastAPI(
     version="2.0"
 )
 
+@app.on_event("startup")
+async def startup_event():
+    """Восстанавливает сессии из журнала, запускает очистку сессий и досылку записей памяти"""
+    global session_journal
+    if AI_ENABLED and agent is not None:
+        try:
+            session_journal = SessionJournal(SESSION_JOURNAL_DIR)
+            mappings, sessions = session_journal.replay()
+            user_sessions.update(mappings)
+            restored = session_manager.restore_sessions(sessions)
+            session_manager.attach_journal(session_journal)
+            logger.info(f"♻️ Восстановлено {len(mappings)} привязок и {restored} сессий "
+                        f"за {session_journal.last_replay_seconds * 1000:.0f} мс")
+        except Exception as e:
+            logger.error(f"❌ Ошибка восстановления сессий из журнала: {e}")
+
+        try:
+            session_manager.start_janitor()
+            await agent.memory_service.start()
+        except Exception as e:
+            logger.error(f"❌ Ошибка запуска системы памяти: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Досылает буферизованные данные памяти перед остановкой"""
+    if AI_ENABLED and agent is not None:
+        try:
+            await session_manager.stop_janitor()
+            await agent.memory_service.shutdown()
+        except Exception as e:
+            logger.error(f"❌ Ошибка остановки системы памяти: {e}")
+
+        if session_journal is not None:
+            try:
+                session_journal.close()
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи снимка журнала сессий: {e}")
+
 # === СЧЕТЧИКИ ===
 update_counter = 0
 last_updates = []
@@ -172,6 +215,8 @@ async def health_check():
                 health_status["ai_status"] = "operational"
                 health_status["zep_enabled"] = bool(agent.zep_client)
                 health_status["memory_enabled"] = bool(agent.memory_service.enable_memory)
+                health_status["memory_stats"] = agent.memory_service.get_memory_stats()
+                health_status["session_stats"] = session_manager.get_session_stats()
             except Exception as e:
                 health_status["ai_status"] = f"error: {str(e)}"
                 health_status["ai_enabled"] = False
@@ -298,6 +343,8 @@ async def process_regular_message(message_data):
 
                 # Сохраняем НАСТОЯЩИЙ session_id для следующих сообщений
                 user_sessions[user_key] = real_session_id
+                if session_journal is not None:
+                    session_journal.record_mapping(user_key, real_session_id)
 
                 # Structured logging
                 if STRUCTURED_LOGGING:
@@ -517,6 +564,30 @@ async def reload_prompt():
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/admin/reload-vocabulary")
+async def reload_vocabulary():
+    """Перечитать словари экстракторов (data/extractor_vocabulary.json)"""
+    try:
+        from bot.memory.extractors import LeadDataExtractor
+
+        old_hash = LeadDataExtractor.VOCABULARY.content_hash
+        # Чтение файла и сборка автомата - вне event loop, замена словарей - в нем
+        vocabulary = await asyncio.to_thread(LeadDataExtractor.load_vocabulary)
+        LeadDataExtractor.apply_vocabulary(vocabulary)
+        logger.info(f"📚 Словари экстракторов v{vocabulary.version} перезагружены")
+
+        return {
+            "status": "success",
+            "changed": old_hash != vocabulary.content_hash,
+            "version": vocabulary.version,
+            "content_hash": vocabulary.content_hash,
+            "from_cache": vocabulary.from_cache,
+            "groups": len(vocabulary.keyword_groups),
+            "automaton_states": vocabulary.automaton.states
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.get("/admin/zep/client/{session_id}")
 async def get_client_data(session_id: str):
     """Получить полные данные клиента из ZEP"""
@@ -570,6 +641,67 @@ async def get_client_data(session_id: str):
         logger.error(f"Ошибка получения данных клиента {session_id}: {e}")
         return {"error": str(e)}
 
+@app.get("/admin/leads/query")
+async def query_leads(location: str = None, property_type: str = None, qualification: str = None,
+                      state: str = None, budget_from: float = None, budget_to: float = None,
+                      offset: int = 0, limit: int = 50):
+    """Поиск лидов по локальному индексу (без обращения к ZEP)"""
+    try:
+        if AI_ENABLED and agent is not None:
+            from bot.memory import ClientType, DialogState, lead_scoring
+
+            try:
+                qualification_status = ClientType(qualification) if qualification else None
+                dialog_state = DialogState(state) if state else None
+            except ValueError as e:
+                return {"error": f"Неизвестное значение фильтра: {e}"}
+
+            limit = max(1, min(limit, 500))
+            offset = max(0, offset)
+            total, page = agent.memory_service.lead_index.query(
+                location=location, property_type=property_type,
+                qualification=qualification_status, state=dialog_state,
+                budget_from=budget_from, budget_to=budget_to,
+                offset=offset, limit=limit,
+            )
+            return {
+                "status": "success",
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "data": [
+                    {
+                        "session_id": session_id,
+                        "lead_data": lead.to_dict(sparse=True),
+                        "data_completeness": lead_scoring.data_completeness(lead),
+                        "escalation_score": lead_scoring.escalation_score(lead),
+                        "should_escalate": lead_scoring.should_escalate(lead),
+                    }
+                    for session_id, lead in page
+                ]
+            }
+        else:
+            return {"error": "AI agent не загружен"}
+    except Exception as e:
+        logger.error(f"Ошибка поиска лидов: {e}")
+        return {"error": str(e)}
+
+@app.get("/admin/leads/summary")
+async def leads_summary():
+    """Сводка по всем лидам локального индекса"""
+    try:
+        if AI_ENABLED and agent is not None:
+            lead_index = agent.memory_service.lead_index
+            return {
+                "status": "success",
+                "scores": lead_index.scores_summary(),
+                "facets": lead_index.facet_counts()
+            }
+        else:
+            return {"error": "AI agent не загружен"}
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.post("/admin/sheets/sync")
 async def sync_google_sheets():
     """Ручная синхронизация данных с Google Sheets"""